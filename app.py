@@ -1,38 +1,149 @@
 # -*- coding: utf-8 -*-
 from pathlib import Path
-from fastapi import FastAPI, Response, Request, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi import FastAPI, File, Query, Response, Request, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import cv2
 import numpy as np
-import json
 import os, sys
 import threading
 import time
 import asyncio
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
 import uvicorn
-from calibration import CalibrationResults, CameraCalibrator
+from calibration import CalibrationResults, CameraCalibrator, detect_scale_arg
+from capture import CameraCapture
+from detection_backend import create_backend
+from sessions import (
+    CalibrationSession,
+    FairShare,
+    SessionRegistry,
+    StereoSession,
+    parse_camera_specs,
+)
+from streaming import AdaptiveQuality, adaptive_stream
+from targets import TargetSpec, create_target, target_kinds
+from undistort import UndistortMaps
+from metrics import REGISTRY, Gauge, MetricsLogger
 import io
 import time
+import zipfile
 from PIL import Image, ImageDraw, ImageFont
 from argparse import ArgumentParser
 from contextlib import asynccontextmanager
 
 parser = ArgumentParser()
-parser.add_argument("--camera", default=0, type=str, help="camera name to caliberate")
+parser.add_argument(
+    "--camera",
+    default=["0"],
+    nargs="+",
+    type=str,
+    help="cameras to caliberate, each as SOURCE or NAME=SOURCE (one session per camera); "
+    "SOURCE is a device index, /dev/videoN, a URL, a video file, an image dir, "
+    "or synthetic[:COLSxROWS] for generated chessboard frames",
+)
 parser.add_argument("--port", default=5000, type=int, help="port to run the server")
 parser.add_argument("--width", default=640, type=int, help="image width")
 parser.add_argument("--height", default=480, type=int, help="image height")
+parser.add_argument(
+    "--fps",
+    default=30.0,
+    type=float,
+    help="capture frame rate, file and synthetic sources are throttled to it",
+)
+parser.add_argument(
+    "--detect-scale",
+    default=1.0,
+    type=detect_scale_arg,
+    help="downscale factor for coarse chessboard search, e.g. 0.5 for 1080p/4K",
+)
+parser.add_argument(
+    "--detect-engine",
+    default="classic",
+    choices=["classic", "sb"],
+    help="chessboard detector: findChessboardCorners + cornerSubPix, or findChessboardCornersSB",
+)
+parser.add_argument(
+    "--max-sharpness",
+    default=None,
+    type=float,
+    help="drop frames whose mean corner edge width exceeds this many pixels, 0 disables "
+    "(default: off for classic, 5.0 for sb)",
+)
+parser.add_argument(
+    "--detect-backend",
+    default="serial",
+    choices=["serial", "thread", "process"],
+    help="run chessboard detection inline, in a thread pool or in a process pool",
+)
+parser.add_argument(
+    "--detect-workers",
+    default=0,
+    type=int,
+    help="number of detection workers, 0 means one per CPU core",
+)
+parser.add_argument(
+    "--reject-outliers",
+    action="store_true",
+    help="drop views with large reprojection error and re-solve",
+)
+parser.add_argument(
+    "--roi-tracking",
+    action="store_true",
+    help="search near the last board position before scanning the full frame",
+)
+parser.add_argument(
+    "--detect-slots",
+    default=0,
+    type=int,
+    help="concurrent detections shared by all cameras, 0 means one per CPU core",
+)
+parser.add_argument(
+    "--max-skew",
+    default=0.02,
+    type=float,
+    help="max capture time difference in seconds between cameras in a stereo view",
+)
+parser.add_argument(
+    "--record",
+    default="none",
+    choices=["none", "corners", "frames"],
+    help="record accepted views (corners only, or corners and PNG frames) for offline replay",
+)
+parser.add_argument(
+    "--metrics-interval",
+    default=0,
+    type=float,
+    help="print a metrics summary line every N seconds, 0 disables",
+)
 parser.add_argument(
     "--output-dir", default="calibration_results", type=Path, help="dir to save results"
 )
 
 args = parser.parse_args()
 
-app = FastAPI(title="摄像头自动标定系统", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用启动时初始化，关闭时清理"""
+    print("摄像头自动标定系统启动中...")
+    # 初始化摄像头
+    for session in sessions:
+        session.init_camera()
+
+    yield
+    # 关闭时等待后台写入的标定结果落盘，并释放检测后端（进程池的共享内存）
+    if stereo_session is not None:
+        stereo_session.close()
+    sessions.close()
+    if detect_backend is not None:
+        detect_backend.close()
+
+
+app = FastAPI(title="摄像头自动标定系统", version="1.0.0", lifespan=lifespan)
 
 # 添加CORS中间件，允许前端跨域访问
 app.add_middleware(
@@ -44,14 +155,130 @@ app.add_middleware(
 )
 
 # 全局变量
-calibrator = CameraCalibrator()
-is_calibrating = False
-calibration_progress = 0
-calibration_message = ""
-calibration_results = None
-camera = None
-chessboard_size = (9, 6, 1)  # 默认棋盘格尺寸
-camera_lock = threading.Lock()  # 摄像头访问锁
+# 所有摄像头共享同一个检测后端，检测配额按FIFO在各会话之间轮转
+detect_backend = create_backend(args.detect_backend, args.detect_workers)
+if detect_backend is not None:
+    detect_slots = args.detect_slots or detect_backend.max_in_flight
+else:
+    detect_slots = args.detect_slots or os.cpu_count() or 1
+cpu_share = FairShare(detect_slots)
+sessions = SessionRegistry()
+stereo_session: Optional[StereoSession] = None  # 外参标定会话
+camera_specs = parse_camera_specs(args.camera)
+for camera_id, source in camera_specs:
+    sessions.add(
+        CalibrationSession(
+            camera_id,
+            source,
+            args.width,
+            args.height,
+            # 多个摄像头时每个摄像头的结果保存在各自的子目录
+            args.output_dir if len(camera_specs) == 1 else args.output_dir.joinpath(camera_id),
+            calibrator_factory=lambda camera_id=camera_id: CameraCalibrator(
+                detect_scale=args.detect_scale,
+                detect_engine=args.detect_engine,
+                max_sharpness=args.max_sharpness,
+                roi_tracking=args.roi_tracking,
+                reject_outliers=args.reject_outliers,
+                backend=detect_backend,
+                cpu_share=cpu_share.handle(camera_id),
+            ),
+            fps=args.fps,
+            record=args.record,
+        )
+    )
+
+
+def _per_camera(value: Callable[[CalibrationSession], Optional[float]]) -> Dict[tuple, float]:
+    """对每个摄像头会话取一个指标值，None表示该会话没有这个指标"""
+    values = {}
+    for session in sessions:
+        result = value(session)
+        if result is not None:
+            values[(session.camera_id,)] = result
+    return values
+
+
+def _client_fps() -> Dict[tuple, float]:
+    values = {}
+    for session in sessions:
+        if session.broadcaster is not None:
+            for client_id, fps in session.broadcaster.client_rates().items():
+                values[(session.camera_id, str(client_id))] = fps
+    return values
+
+
+# 队列深度、客户端数等由会话持有的值在抓取时读取
+REGISTRY.register(
+    Gauge(
+        "calib_stream_clients",
+        "Connected MJPEG clients",
+        ["camera"],
+        collect=lambda: _per_camera(lambda s: s.broadcaster and s.broadcaster.stats()["clients"]),
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "calib_stream_client_fps",
+        "Frames per second delivered to each client",
+        ["camera", "client"],
+        collect=_client_fps,
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "calib_stream_dropped_frames",
+        "Frames skipped by slow stream clients",
+        ["camera"],
+        collect=lambda: _per_camera(lambda s: s.broadcaster and s.broadcaster.dropped_frames),
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "calib_capture_seq",
+        "Frames captured so far",
+        ["camera"],
+        collect=lambda: _per_camera(lambda s: s.camera and s.camera.seq),
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "calib_detect_in_flight",
+        "Frames queued or being detected",
+        ["camera"],
+        collect=lambda: _per_camera(lambda s: s.calibrator.in_flight if s.is_calibrating else 0),
+    )
+)
+REGISTRY.register(
+    Gauge(
+        "calib_detect_slots",
+        "Shared detection slots by state",
+        ["state"],
+        collect=lambda: {
+            ("busy",): cpu_share.stats()["busy"],
+            ("waiting",): cpu_share.stats()["waiting"],
+            ("total",): cpu_share.slots,
+        },
+    )
+)
+
+
+def metrics_extra() -> str:
+    """周期日志中附加的客户端数、丢帧数和队列深度"""
+    parts = []
+    for session in sessions:
+        stats = session.broadcaster.stats() if session.broadcaster is not None else None
+        clients = stats["clients"] if stats else 0
+        dropped = stats["dropped_frames"] if stats else 0
+        parts.append(
+            f"{session.camera_id}: 客户端 {clients} 丢帧 {dropped} 检测队列 {session.calibrator.in_flight}"
+        )
+    share = cpu_share.stats()
+    parts.append(f"检测配额 {share['busy']}/{share['slots']} 等待 {share['waiting']}")
+    return " | ".join(parts)
+
+
+metrics_logger = MetricsLogger(args.metrics_interval, extra=metrics_extra).start()
 
 
 # Pydantic模型
@@ -59,6 +286,13 @@ class ChessboardSize(BaseModel):
     chessboard_width: int
     chessboard_height: int
     square_size: float
+    target: str = "chessboard"  # 标定板类型: chessboard、charuco、circles、asymmetric_circles
+    marker_ratio: float = 0.75  # ChArUco标记边长与方格边长之比
+    aruco_dict: str = "DICT_5X5_250"  # ChArUco使用的ArUco字典
+
+
+class StereoRequest(ChessboardSize):
+    camera_ids: Optional[List[str]] = None  # 第一个为参考摄像头，默认使用全部摄像头
 
 
 class CalibrationResponse(BaseModel):
@@ -67,316 +301,367 @@ class CalibrationResponse(BaseModel):
     chessboard_size: Optional[List[int]] = None
 
 
-# 初始化摄像头
-def init_camera():
-    """初始化摄像头"""
-    global camera
-    with camera_lock:
-        if camera is None or not camera.isOpened():
-            try:
-                try:
-                    args.camera = int(args.camera)
-                except Exception:
-                    pass
-                camera = cv2.VideoCapture(args.camera)
-                if not camera.isOpened():
-                    print(f"Can't open camera {args.camera}")
-                    sys.exit(-1)
-
-                if camera.isOpened():
-                    # 设置摄像头分辨率
-                    camera.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
-                    camera.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
-                    camera.set(cv2.CAP_PROP_FPS, 30)
-                    print(f"摄像头已初始化: 分辨率 {args.width}x{args.height}")
-                else:
-                    print("警告: 无法打开摄像头")
-                    sys.exit(-1)
-
-            except Exception as e:
-                print(f"初始化摄像头时出错: {e}")
-                sys.exit(-1)
-    return camera
-
-
-def calibration_thread(
-    chessboard_width: int, chessboard_height: int, square_size: float
-):
-    """标定线程"""
-    global is_calibrating, calibration_progress, calibration_message, calibration_results, chessboard_size
-
+def get_session(camera_id: Optional[str] = None) -> CalibrationSession:
+    """按摄像头名称获取会话，未指定时为第一个摄像头"""
     try:
-        # 设置棋盘格尺寸
-        chessboard_size = (chessboard_width, chessboard_height, square_size)
-
-        # 重置标定器并设置新的棋盘格尺寸
-        calibrator.reset()
-        calibrator.set_chessboard_size(chessboard_width, chessboard_height, square_size)
-
-        # 开始标定过程
-        cam = init_camera()
-
-        if cam is None or not cam.isOpened():
-            calibration_message = "摄像头未连接，请检查摄像头连接"
-            calibration_progress = 0
-            is_calibrating = False
-            return
-
-        results = calibrator.auto_calibrate(
-            camera=cam,
-            progress_callback=lambda p, m: update_progress(p, m),
-            max_images=30,
-            min_images=15,
-        )
+        return sessions.get(camera_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"未找到摄像头: {camera_id}")
 
-        calibration_results = results
-        calibration_progress = 100
-        calibration_message = "标定完成！"
 
-        # 保存标定结果
-        save_calibration_results(results)
+def validate_chessboard_size(size: ChessboardSize):
+    """验证棋盘格尺寸"""
+    if size.chessboard_width < 3 or size.chessboard_height < 3:
+        raise HTTPException(status_code=400, detail="棋盘格尺寸至少为3x3")
 
-    except Exception as e:
-        calibration_message = f"标定失败: {str(e)}"
-        print(f"标定过程中出错: {e}")
-    finally:
-        is_calibrating = False
+    if size.chessboard_width > 15 or size.chessboard_height > 15:
+        raise HTTPException(status_code=400, detail="棋盘格尺寸最大为15x15")
 
 
-def update_progress(progress: int, message: str):
-    """更新标定进度"""
-    global calibration_progress, calibration_message
-    calibration_progress = progress
-    calibration_message = message
+def validate_target(size: ChessboardSize) -> TargetSpec:
+    """验证标定板类型及其参数"""
+    if size.target not in target_kinds():
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知的标定板类型: {size.target}，可选: {', '.join(target_kinds())}",
+        )
+    target = TargetSpec(size.target, size.marker_ratio, size.aruco_dict)
+    if target.kind != "chessboard":
+        try:
+            create_target(
+                (size.chessboard_width, size.chessboard_height, size.square_size), target
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return target
 
 
-def save_calibration_results(results: CalibrationResults):
-    """保存标定结果到文件"""
-    output_dir: Path = args.output_dir
-    output_dir.mkdir(exist_ok=True, parents=True)
+# 以下端点同时注册在 /xxx 和 /cameras/{camera_id}/xxx 下：
+# 不带摄像头名称的旧路径对应第一个摄像头（也可用?camera_id=指定）
 
-    try:
-        # 保存为JSON
-        with open(output_dir.joinpath("calibration.json"), "w") as f:
-            results.save_json(f)
 
-        # 保存为NumPy格式
-        results.save_numpy(output_dir.joinpath("calibration.npz"))
+@app.get("/")
+async def read_root():
+    """返回前端页面"""
+    return FileResponse(static_dir.joinpath("index.html"))
 
-        # 保存为文本格式便于查看
-        with open(output_dir.joinpath("calibration.txt"), "w") as f:
-            results.save_text(f)
 
-        print(f"标定结果已保存到 {output_dir.absolute()} 目录")
+@app.get("/cameras")
+async def list_cameras():
+    """列出所有摄像头会话及检测配额的使用情况"""
+    return JSONResponse(
+        {
+            "status": "success",
+            "default": sessions.default_id,
+            "cameras": [session.summary() for session in sessions],
+            "cpu_share": cpu_share.stats(),
+        }
+    )
 
-    except Exception as e:
-        print(f"保存标定结果时出错: {e}")
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus格式的流水线指标：各阶段耗时分布、检测命中、丢帧、客户端帧率和队列深度"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
-def generate_frames():
-    """生成视频流"""
-    cam = init_camera()
 
-    if cam is None or not cam.isOpened():
-        raise ValueError("相机不可用")
+@app.get("/video_feed")
+@app.get("/cameras/{camera_id}/video_feed")
+async def video_feed(
+    camera_id: Optional[str] = None,
+    undistort: bool = False,
+    width: Optional[int] = Query(None, ge=1, description="max frame width, keeps aspect ratio"),
+    height: Optional[int] = Query(None, ge=1, description="max frame height, keeps aspect ratio"),
+    quality: int = Query(80, ge=1, le=100, description="JPEG quality"),
+    fps: Optional[float] = Query(None, gt=0, description="max frames per second"),
+    adaptive: bool = False,
+):
+    """
+    视频流端点，undistort=true时输出用缓存映射表去畸变的视频流
 
-    while True:
-        try:
-            with camera_lock:
-                success, frame = cam.read()
-                if not success:
-                    print("摄像头读取失败")
-                    continue
-
-            # 如果正在标定，在帧上绘制检测结果
-            if is_calibrating:
-                frame = calibrator.draw_corners(frame)
-
-            _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            frame_bytes = buffer.tobytes()
-
-            yield (
-                b"--frame\r\n"
-                b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+    width/height/quality/fps限制尺寸、画质和帧率，相同规格的客户端共用一份编码；
+    adaptive=true时按该客户端的发送速度自动在画质档位之间升降
+    """
+    session = get_session(camera_id)
+    try:
+        broadcaster = session.get_broadcaster(undistort, width, height, quality)
+    except ValueError as e:
+        raise HTTPException(status_code=409 if undistort else 503, detail=str(e))
+
+    if adaptive:
+        frame_width, frame_height = session.frame_size()
+        limit = min(width or frame_width, frame_width), min(height or frame_height, frame_height)
+
+        def get_level_broadcaster(scale: float, level_quality: int):
+            return session.get_broadcaster(
+                undistort,
+                int(limit[0] * scale) if scale < 1 or width else None,
+                int(limit[1] * scale) if scale < 1 or height else None,
+                min(level_quality, quality),
             )
 
-            # 控制帧率
-            time.sleep(0.033)  # 约30fps
-
-        except Exception as e:
-            print(f"生成视频帧时出错: {e}")
-            time.sleep(1)
-            continue
-
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """应用启动时初始化"""
-    print("摄像头自动标定系统启动中...")
-    # 初始化摄像头
-    init_camera()
-
-    yield
-    global camera
-    with camera_lock:
-        if camera is not None:
-            camera.release()
-            camera = None
-            print("摄像头已释放")
-
-
-@app.get("/")
-async def read_root():
-    """返回前端页面"""
-    return FileResponse(static_dir.joinpath("index.html"))
+        controller = AdaptiveQuality(max_fps=fps or args.fps)
+        return StreamingResponse(
+            adaptive_stream(get_level_broadcaster, controller),
+            media_type="multipart/x-mixed-replace; boundary=frame",
+        )
 
+    async def generate_frames():
+        """生成视频流，所有客户端共享同一份JPEG编码结果"""
+        async for chunk in broadcaster.subscribe_async(max_fps=fps):
+            yield chunk
 
-@app.get("/video_feed")
-async def video_feed():
-    """视频流端点"""
     return StreamingResponse(
         generate_frames(), media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
 
+@app.get("/stream_stats")
+@app.get("/cameras/{camera_id}/stream_stats")
+async def stream_stats(camera_id: Optional[str] = None):
+    """视频流统计：每秒编码次数与分发给客户端的次数，variants为各规格视频流的统计"""
+    session = get_session(camera_id)
+    stats = session.broadcaster.stats() if session.broadcaster is not None else None
+    return JSONResponse({"status": "success", "stats": stats, "variants": session.stream_stats()})
+
+
+@app.get("/snapshot")
+@app.get("/cameras/{camera_id}/snapshot")
+async def snapshot(camera_id: Optional[str] = None):
+    """返回最新一帧的JPEG快照"""
+    cam = get_session(camera_id).init_camera()
+    frame = None
+    if cam is not None:
+        _, frame = cam.latest()
+    if frame is None:
+        raise HTTPException(status_code=503, detail="暂无可用的图像")
+    _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return Response(content=buffer.tobytes(), media_type="image/jpeg")
+
+
+def undistort_images(maps: UndistortMaps, images: List[tuple]) -> bytes:
+    """逐张解码、去畸变并按原格式编码，打包成zip"""
+    buffer = io.BytesIO()
+    output = None
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in images:
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise ValueError(f"无法解码图像: {name}")
+            # 同尺寸的图像复用同一个输出缓冲区
+            if output is None or output.shape != image.shape or output.dtype != image.dtype:
+                output = np.empty_like(image)
+            maps.remap(image, dst=output)
+            suffix = Path(name).suffix.lower() or ".png"
+            ok, encoded = cv2.imencode(suffix, output)
+            if not ok:
+                raise ValueError(f"无法编码图像: {name}")
+            archive.writestr(Path(name).name, encoded.tobytes())
+    return buffer.getvalue()
+
+
+@app.post("/undistort")
+@app.post("/cameras/{camera_id}/undistort")
+async def undistort(files: List[UploadFile] = File(...), camera_id: Optional[str] = None):
+    """批量去畸变：上传多张图像，返回去畸变后的zip包"""
+    maps = get_session(camera_id).get_undistort_maps()
+    if maps is None:
+        raise HTTPException(status_code=409, detail="尚未完成标定，没有去畸变映射表")
+    images = [(file.filename or f"image_{i}.png", await file.read()) for i, file in enumerate(files)]
+    try:
+        # 解码、重映射和编码都在线程池中进行，不阻塞事件循环
+        content = await run_in_threadpool(undistort_images, maps, images)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(
+        content=content,
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="undistorted.zip"'},
+    )
+
+
 @app.post("/start_calibration")
-async def start_calibration(size: ChessboardSize):
+@app.post("/cameras/{camera_id}/start_calibration")
+async def start_calibration(size: ChessboardSize, camera_id: Optional[str] = None):
     """开始标定"""
-    global is_calibrating
+    session = get_session(camera_id)
 
-    if is_calibrating:
+    if session.is_calibrating:
         raise HTTPException(status_code=400, detail="标定正在进行中")
 
-    # 验证棋盘格尺寸
-    if size.chessboard_width < 3 or size.chessboard_height < 3:
-        raise HTTPException(status_code=400, detail="棋盘格尺寸至少为3x3")
-
-    if size.chessboard_width > 15 or size.chessboard_height > 15:
-        raise HTTPException(status_code=400, detail="棋盘格尺寸最大为15x15")
-
-    is_calibrating = True
-    calibration_thread_instance = threading.Thread(
-        target=calibration_thread,
-        args=(size.chessboard_width, size.chessboard_height, size.square_size),
+    validate_chessboard_size(size)
+    target = validate_target(size)
+    session.start_calibration(
+        size.chessboard_width, size.chessboard_height, size.square_size, target
     )
-    calibration_thread_instance.daemon = True
-    calibration_thread_instance.start()
 
     return JSONResponse(
         {
             "status": "success",
-            "message": f"开始标定，棋盘格尺寸: {size.chessboard_width}x{size.chessboard_height}",
+            "message": (
+                f"开始标定，{target.kind} 尺寸: {size.chessboard_width}x{size.chessboard_height}"
+            ),
         }
     )
 
 
 @app.post("/stop_calibration")
-async def stop_calibration():
+@app.post("/cameras/{camera_id}/stop_calibration")
+async def stop_calibration(camera_id: Optional[str] = None):
     """停止标定"""
-    global is_calibrating
-    is_calibrating = False
-    calibrator.stop_calibration = True
+    get_session(camera_id).stop_calibration()
     return JSONResponse({"status": "success", "message": "停止标定"})
 
 
 @app.post("/update_chessboard_size")
-async def update_chessboard_size(size: ChessboardSize):
+@app.post("/cameras/{camera_id}/update_chessboard_size")
+async def update_chessboard_size(size: ChessboardSize, camera_id: Optional[str] = None):
     """更新棋盘格尺寸"""
-    global chessboard_size, is_calibrating, calibration_progress, calibration_message, calibration_results
+    session = get_session(camera_id)
 
-    if is_calibrating:
+    if session.is_calibrating:
         raise HTTPException(status_code=400, detail="标定正在进行中，请先停止标定")
 
-    # 验证棋盘格尺寸
-    if size.chessboard_width < 3 or size.chessboard_height < 3:
-        raise HTTPException(status_code=400, detail="棋盘格尺寸至少为3x3")
-
-    if size.chessboard_width > 15 or size.chessboard_height > 15:
-        raise HTTPException(status_code=400, detail="棋盘格尺寸最大为15x15")
-
-    # 更新棋盘格尺寸
-    chessboard_size = (size.chessboard_width, size.chessboard_height, size.square_size)
-
-    # 重置标定器
-    calibrator.reset()
-    calibrator.set_chessboard_size(
-        size.chessboard_width, size.chessboard_height, size.square_size
+    validate_chessboard_size(size)
+    target = validate_target(size)
+    session.update_chessboard_size(
+        size.chessboard_width, size.chessboard_height, size.square_size, target
     )
 
-    # 重置标定状态
-    calibration_progress = 0
-    calibration_message = f"棋盘格尺寸已更新为 {size.chessboard_width}x{size.chessboard_height}，请重新开始标定"
-    calibration_results = None
-
     return JSONResponse(
         {
             "status": "success",
             "message": f"棋盘格尺寸已更新为: {size.chessboard_width}x{size.chessboard_height}",
-            "chessboard_size": list(chessboard_size),
+            "chessboard_size": list(session.chessboard_size),
         }
     )
 
 
 @app.get("/get_calibration_status")
-async def get_calibration_status():
-    """获取标定状态"""
-    global is_calibrating, calibration_progress, calibration_message, calibration_results, chessboard_size
-
-    response = {
-        "is_calibrating": is_calibrating,
-        "progress": calibration_progress,
-        "message": calibration_message,
-        "has_results": calibration_results is not None,
-        "chessboard_size": list(chessboard_size),
-    }
-
-    if calibration_results:
-        response.update(
-            {
-                "camera_matrix": calibration_results.camera_matrix.tolist(),
-                "dist_coeffs": calibration_results.dist_coeffs.flatten().tolist(),
-                "reprojection_error": float(calibration_results.reprojection_error),
-                "num_images": calibration_results.calibration_images,
-                "chessboard_size": calibration_results.chessboard_size,
-                "fov": calibration_results.fov
-            }
-        )
-
-    return JSONResponse(response)
+@app.get("/cameras/{camera_id}/get_calibration_status")
+async def get_calibration_status(camera_id: Optional[str] = None):
+    """获取标定状态（返回推送通道维护的最新状态，不再逐次重新构建）"""
+    version, status = get_session(camera_id).status_feed.snapshot()
+    status["version"] = version
+    return JSONResponse(status)
+
+
+@app.get("/status_events")
+@app.get("/cameras/{camera_id}/status_events")
+async def status_events(
+    request: Request, since: Optional[int] = None, camera_id: Optional[str] = None
+):
+    """
+    标定状态推送（Server-Sent Events）
+
+    首次连接收到完整快照，之后只收到变化的字段；
+    重连时浏览器自动携带Last-Event-ID，据此补发错过的差量
+    """
+    session = get_session(camera_id)
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            since = None
+    return StreamingResponse(
+        session.status_feed.subscribe_async(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/get_calibration_results")
-async def get_calibration_results():
-    """获取标定结果"""
-    output_dir: Path = args.output_dir
-    json_path = output_dir.joinpath("calibration.json")
-    if json_path.exists():
-        with open(json_path, "r") as f:
-            results = json.load(f)
-        return JSONResponse({"status": "success", "results": results})
-    else:
+@app.get("/cameras/{camera_id}/get_calibration_results")
+async def get_calibration_results(camera_id: Optional[str] = None, version: Optional[str] = None):
+    """获取标定结果：默认为最新结果（内存缓存），指定version时读取历史版本"""
+    store = get_session(camera_id).result_store
+    results = store.latest() if version is None else store.load_version(version)
+    if results is None:
         raise HTTPException(status_code=404, detail="未找到标定结果")
+    return JSONResponse({"status": "success", "results": results})
+
+
+@app.get("/get_calibration_history")
+@app.get("/cameras/{camera_id}/get_calibration_history")
+async def get_calibration_history(camera_id: Optional[str] = None):
+    """历史标定结果的索引：版本号、时间、摄像头、棋盘格和重投影误差"""
+    return JSONResponse({"status": "success", "history": get_session(camera_id).result_store.history()})
 
 
 @app.post("/reset_calibration")
-async def reset_calibration():
+@app.post("/cameras/{camera_id}/reset_calibration")
+async def reset_calibration(camera_id: Optional[str] = None):
     """重置标定"""
-    global is_calibrating, calibration_progress, calibration_message, calibration_results, chessboard_size
-    is_calibrating = False
-    calibrator.stop_calibration = True
-    calibration_progress = 0
-    calibration_message = "标定已重置"
-    calibration_results = None
-    calibrator.reset()
-
+    get_session(camera_id).reset()
     return JSONResponse({"status": "success", "message": "标定已重置"})
 
 
+@app.post("/stereo/start_calibration")
+async def start_stereo_calibration(request: StereoRequest):
+    """开始多摄像头外参标定"""
+    global stereo_session
+
+    if stereo_session is not None and stereo_session.is_calibrating:
+        raise HTTPException(status_code=400, detail="外参标定正在进行中")
+
+    validate_chessboard_size(request)
+    if request.target != "chessboard":
+        raise HTTPException(status_code=400, detail="外参标定目前只支持棋盘格")
+    camera_ids = request.camera_ids or [session.camera_id for session in sessions]
+    if len(camera_ids) < 2:
+        raise HTTPException(status_code=400, detail="外参标定至少需要两个摄像头")
+    selected = [get_session(camera_id) for camera_id in camera_ids]
+
+    if stereo_session is None or stereo_session.camera_ids != camera_ids:
+        if stereo_session is not None:
+            stereo_session.close()
+        stereo_session = StereoSession(
+            selected,
+            args.output_dir.joinpath("stereo", "_".join(camera_ids)),
+            max_skew=args.max_skew,
+            cpu_share=cpu_share.handle("stereo"),
+            # 与单目会话使用相同的检测设置；配额由StereoCalibrator自己获取
+            detector_factory=lambda: CameraCalibrator(
+                detect_scale=args.detect_scale,
+                detect_engine=args.detect_engine,
+                max_sharpness=args.max_sharpness,
+                roi_tracking=args.roi_tracking,
+            ),
+        )
+    stereo_session.start_calibration(
+        request.chessboard_width, request.chessboard_height, request.square_size
+    )
+    return JSONResponse(
+        {
+            "status": "success",
+            "message": f"开始外参标定，摄像头: {', '.join(camera_ids)}",
+        }
+    )
+
+
+@app.post("/stereo/stop_calibration")
+async def stop_stereo_calibration():
+    """停止外参标定的采集，已采集的视图足够时直接求解"""
+    if stereo_session is not None:
+        stereo_session.stop_calibration()
+    return JSONResponse({"status": "success", "message": "停止外参标定"})
+
+
+@app.get("/stereo/get_calibration_status")
+async def get_stereo_calibration_status():
+    """获取外参标定状态"""
+    if stereo_session is None:
+        return JSONResponse({"is_calibrating": False, "has_results": False})
+    return JSONResponse(stereo_session.get_status())
+
+
 @app.get("/get_chessboard_size")
-async def get_chessboard_size():
+@app.get("/cameras/{camera_id}/get_chessboard_size")
+async def get_chessboard_size(camera_id: Optional[str] = None):
     """获取当前棋盘格尺寸"""
-    global chessboard_size
-    return JSONResponse({"status": "success", "chessboard_size": list(chessboard_size)})
+    session = get_session(camera_id)
+    return JSONResponse({"status": "success", "chessboard_size": list(session.chessboard_size)})
 
 
 static_dir = Path(__file__).parent.joinpath("app", "dist")
@@ -7,6 +7,7 @@ import ResultsCard from "./components/ResultsCard";
 import Instructions from "./components/Instructions";
 import {
   getCalibrationStatus,
+  subscribeCalibrationStatus,
   startCalibration,
   stopCalibration,
   resetCalibration,
@@ -37,16 +38,74 @@ function App() {
     chessboardHeight: 6,
     squareSize: 0.01,
     rawSquareSize: "0.01", // 新增：存储输入的原始字符串值
+    target: "chessboard", // 标定板类型
     isEditing: false,
     originalWidth: 9,
     originalHeight: 6,
     originalSquareSize: 0.01,
     originalRawSquareSize: "0.01", // 新增：存储编辑前的原始字符串值
+    originalTarget: "chessboard",
     configMessage: "",
     configMessageType: "",
   });
   const skipNextStatusUpdateRef = useRef(false);
 
+  const applyStatus = (data) => {
+    setCalibrationState((prev) => ({
+      ...prev,
+      statusText: data.is_calibrating
+        ? "标定中..."
+        : data.has_results
+          ? "标定完成"
+          : "等待开始",
+      statusColor: data.is_calibrating
+        ? "#ff9900"
+        : data.has_results
+          ? "#4CAF50"
+          : "#666",
+      progress: data.progress || 0,
+      message: data.message || prev.message,
+      numImages: data.num_images || 0,
+      reprojectionError:
+        data.has_results && data.reprojection_error
+          ? data.reprojection_error.toFixed(4)
+          : "-",
+      chessboardSize: data.chessboard_size || prev.chessboardSize,
+      isCalibrating: data.is_calibrating || false,
+      hasResults: data.has_results || false,
+      cameraMatrix: data.camera_matrix || null,
+      distCoeffs: data.dist_coeffs || null,
+      fov: data.fov || null,
+      showResultsCard: data.has_results || false,
+    }));
+
+    // 如果不在编辑模式，更新配置中的棋盘格尺寸
+    if (!configState.isEditing && data.chessboard_size) {
+      setConfigState((prev) => ({
+        ...prev,
+        chessboardWidth: data.chessboard_size[0],
+        chessboardHeight: data.chessboard_size[1],
+        squareSize: data.chessboard_size[2],
+        rawSquareSize: data.chessboard_size[2].toString(), // 更新字符串表示
+        target: data.target ? data.target.kind : prev.target,
+      }));
+    }
+  };
+
+  // 推送回调只注册一次，通过ref调用最新的处理函数，避免读到过期的编辑状态
+  const applyStatusRef = useRef(applyStatus);
+  applyStatusRef.current = applyStatus;
+
+  const handlePushedStatus = (data) => {
+    if (configState.isEditing || skipNextStatusUpdateRef.current) {
+      skipNextStatusUpdateRef.current = false;
+      return;
+    }
+    applyStatus(data);
+  };
+  const handlePushedStatusRef = useRef(handlePushedStatus);
+  handlePushedStatusRef.current = handlePushedStatus;
+
   const updateStatus = async () => {
     if (configState.isEditing || skipNextStatusUpdateRef.current) {
       skipNextStatusUpdateRef.current = false;
@@ -55,69 +114,52 @@ function App() {
 
     try {
       const data = await getCalibrationStatus();
-      setCalibrationState((prev) => ({
-        ...prev,
-        statusText: data.is_calibrating
-          ? "标定中..."
-          : data.has_results
-            ? "标定完成"
-            : "等待开始",
-        statusColor: data.is_calibrating
-          ? "#ff9900"
-          : data.has_results
-            ? "#4CAF50"
-            : "#666",
-        progress: data.progress || 0,
-        message: data.message || prev.message,
-        numImages: data.num_images || 0,
-        reprojectionError:
-          data.has_results && data.reprojection_error
-            ? data.reprojection_error.toFixed(4)
-            : "-",
-        chessboardSize: data.chessboard_size || prev.chessboardSize,
-        isCalibrating: data.is_calibrating || false,
-        hasResults: data.has_results || false,
-        cameraMatrix: data.camera_matrix || null,
-        distCoeffs: data.dist_coeffs || null,
-        fov: data.fov || null,
-        showResultsCard: data.has_results || false,
-      }));
-
-      // 如果不在编辑模式，更新配置中的棋盘格尺寸
-      if (!configState.isEditing && data.chessboard_size) {
-        setConfigState((prev) => ({
-          ...prev,
-          chessboardWidth: data.chessboard_size[0],
-          chessboardHeight: data.chessboard_size[1],
-          squareSize: data.chessboard_size[2],
-          rawSquareSize: data.chessboard_size[2].toString(), // 更新字符串表示
-        }));
-      }
+      applyStatusRef.current(data);
     } catch (error) {
       console.error("获取标定状态失败:", error);
     }
   };
 
-  const clear = useInterval(() => {
-    if (!configState.isEditing) {
-      updateStatus();
+  // 编辑期间的推送被忽略，结束编辑（确认或取消）时重新获取一次完整状态
+  const wasEditingRef = useRef(false);
+  useEffect(() => {
+    if (wasEditingRef.current && !configState.isEditing) {
+      getCalibrationStatus()
+        .then((data) => applyStatusRef.current(data))
+        .catch((error) => console.error("获取标定状态失败:", error));
     }
-  }, 1000);
+    wasEditingRef.current = configState.isEditing;
+  }, [configState.isEditing]);
+
+  // 浏览器不支持EventSource时退回轮询
+  const supportsPush = typeof window !== "undefined" && "EventSource" in window;
+  const clear = useInterval(
+    () => {
+      if (!configState.isEditing) {
+        updateStatus();
+      }
+    },
+    supportsPush ? null : 1000,
+  );
 
   useEffect(() => {
     // 初始状态更新
     updateStatus();
 
-    // 启动状态轮询
+    // 订阅状态推送，只在状态变化时更新
+    const unsubscribe = supportsPush
+      ? subscribeCalibrationStatus((data) => handlePushedStatusRef.current(data))
+      : () => {};
 
     // 清理函数
     return () => {
+      unsubscribe();
       clear();
     };
   }, []);
 
   const handleStartCalibration = async () => {
-    const { chessboardWidth, chessboardHeight, squareSize } = configState;
+    const { chessboardWidth, chessboardHeight, squareSize, target } = configState;
 
     // 验证输入
     if (chessboardWidth < 3 || chessboardHeight < 3) {
@@ -135,6 +177,7 @@ function App() {
         chessboardWidth,
         chessboardHeight,
         squareSize,
+        target,
       );
       if (data.status === "success") {
         alert(
@@ -186,6 +229,7 @@ function App() {
       originalHeight: prev.chessboardHeight,
       originalSquareSize: prev.squareSize,
       originalRawSquareSize: prev.rawSquareSize, // 保存编辑前的原始字符串值
+      originalTarget: prev.target,
       configMessage: "",
       configMessageType: "",
     }));
@@ -201,13 +245,14 @@ function App() {
       chessboardHeight: prev.originalHeight,
       squareSize: prev.originalSquareSize,
       rawSquareSize: prev.originalRawSquareSize, // 恢复编辑前的原始字符串值
+      target: prev.originalTarget,
       configMessage: "",
       configMessageType: "",
     }));
   };
 
   const handleConfirmEdit = async () => {
-    const { chessboardWidth, chessboardHeight, rawSquareSize } = configState;
+    const { chessboardWidth, chessboardHeight, rawSquareSize, target } = configState;
 
     // 验证并转换squareSize
     let squareSizeNum;
@@ -254,6 +299,7 @@ function App() {
         chessboardWidth,
         chessboardHeight,
         squareSizeNum,
+        target,
       );
       if (data.status === "success") {
         setConfigState((prev) => ({
@@ -325,6 +371,13 @@ function App() {
         ...prev,
         rawSquareSize: value, // 保存原始字符串
       }));
+    } else if (name === "target") {
+      setConfigState((prev) => ({
+        ...prev,
+        target: value,
+        configMessage: '标定板类型已修改，请点击"确认修改"按钮保存',
+        configMessageType: "success",
+      }));
     } else {
       // 其他字段正常转换为数字
       const parseFunc = parseInt;
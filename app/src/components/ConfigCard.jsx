@@ -14,6 +14,7 @@ const ConfigCard = ({
     chessboardHeight,
     squareSize,
     rawSquareSize,
+    target,
     isEditing,
     configMessage,
     configMessageType,
@@ -23,6 +24,22 @@ const ConfigCard = ({
     <div className="config-card">
       <h2>标定配置</h2>
       <div className="config-form">
+        <div className="form-group">
+          <label htmlFor="target">标定板类型:</label>
+          <select
+            id="target"
+            name="target"
+            className="form-control"
+            value={target}
+            disabled={!isEditing}
+            onChange={onInputChange}
+          >
+            <option value="chessboard">棋盘格</option>
+            <option value="charuco">ChArUco (可部分出画)</option>
+            <option value="circles">对称圆点阵列</option>
+            <option value="asymmetric_circles">非对称圆点阵列</option>
+          </select>
+        </div>
         <div className="form-group">
           <label htmlFor="chessboard-width">棋盘格宽度 (内角点数):</label>
           <input
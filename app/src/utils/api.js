@@ -1,10 +1,15 @@
 const API_BASE = process.env.NODE_ENV === 'development' ? 'http://localhost:5000': ''; // 根据实际后端地址设置
 
-export const getVideoFeed = () => `${API_BASE}/video_feed`
+// 多摄像头时通过页面地址的 ?camera=<名称> 选择摄像头，未指定时使用服务端的默认摄像头
+const CAMERA_ID = new URLSearchParams(window.location.search).get('camera');
+const apiPath = (path) =>
+  CAMERA_ID ? `${API_BASE}/cameras/${encodeURIComponent(CAMERA_ID)}${path}` : `${API_BASE}${path}`;
+
+export const getVideoFeed = () => apiPath('/video_feed')
 
 export const getCalibrationStatus = async () => {
   try {
-    const response = await fetch(`${API_BASE}/get_calibration_status`);
+    const response = await fetch(apiPath('/get_calibration_status'));
     if (!response.ok) {
       throw new Error('获取状态失败');
     }
@@ -15,9 +20,38 @@ export const getCalibrationStatus = async () => {
   }
 };
 
-export const startCalibration = async (chessboardWidth, chessboardHeight, squareSize) => {
+// 订阅标定状态推送：首次收到完整快照，之后只收到变化的字段，合并后回调完整状态
+// 断线时EventSource会自动重连并携带Last-Event-ID，服务端据此补发差量或重新发送快照
+export const subscribeCalibrationStatus = (onStatus, onError) => {
+  const source = new EventSource(apiPath('/status_events'));
+  let status = {};
+
+  source.addEventListener('snapshot', (event) => {
+    status = JSON.parse(event.data);
+    onStatus({ ...status, version: Number(event.lastEventId) });
+  });
+
+  source.addEventListener('update', (event) => {
+    status = { ...status, ...JSON.parse(event.data) };
+    onStatus({ ...status, version: Number(event.lastEventId) });
+  });
+
+  source.onerror = (error) => {
+    console.error('标定状态推送连接中断:', error);
+    if (onError) onError(error);
+  };
+
+  return () => source.close();
+};
+
+export const startCalibration = async (
+  chessboardWidth,
+  chessboardHeight,
+  squareSize,
+  target = 'chessboard',
+) => {
   try {
-    const response = await fetch(`${API_BASE}/start_calibration`, {
+    const response = await fetch(apiPath('/start_calibration'), {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -26,6 +60,7 @@ export const startCalibration = async (chessboardWidth, chessboardHeight, square
         chessboard_width: chessboardWidth,
         chessboard_height: chessboardHeight,
         square_size: squareSize,
+        target,
       }),
     });
     if (!response.ok) {
@@ -40,7 +75,7 @@ export const startCalibration = async (chessboardWidth, chessboardHeight, square
 
 export const stopCalibration = async () => {
   try {
-    const response = await fetch(`${API_BASE}/stop_calibration`, {
+    const response = await fetch(apiPath('/stop_calibration'), {
       method: 'POST',
     });
     if (!response.ok) {
@@ -55,7 +90,7 @@ export const stopCalibration = async () => {
 
 export const resetCalibration = async () => {
   try {
-    const response = await fetch(`${API_BASE}/reset_calibration`, {
+    const response = await fetch(apiPath('/reset_calibration'), {
       method: 'POST',
     });
     if (!response.ok) {
@@ -68,9 +103,14 @@ export const resetCalibration = async () => {
   }
 };
 
-export const updateChessboardSize = async (chessboardWidth, chessboardHeight, squareSize) => {
+export const updateChessboardSize = async (
+  chessboardWidth,
+  chessboardHeight,
+  squareSize,
+  target = 'chessboard',
+) => {
   try {
-    const response = await fetch(`${API_BASE}/update_chessboard_size`, {
+    const response = await fetch(apiPath('/update_chessboard_size'), {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -78,7 +118,8 @@ export const updateChessboardSize = async (chessboardWidth, chessboardHeight, sq
       body: JSON.stringify({
         chessboard_width: chessboardWidth,
         chessboard_height: chessboardHeight,
-        square_size: squareSize 
+        square_size: squareSize,
+        target,
       }),
     });
     if (!response.ok) {
@@ -93,7 +134,7 @@ export const updateChessboardSize = async (chessboardWidth, chessboardHeight, sq
 
 export const getCalibrationResults = async () => {
   try {
-    const response = await fetch(`${API_BASE}/get_calibration_results`);
+    const response = await fetch(apiPath('/get_calibration_results'));
     if (!response.ok) {
       throw new Error('获取结果失败');
     }
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from argparse import ArgumentParser
+from pathlib import Path
+
+from calibration import CameraCalibrator, detect_scale_arg
+from detection_backend import create_backend
+from targets import TargetSpec, target_kinds
+from undistort import UndistortMaps
+
+parser = ArgumentParser(description="calibrate from image folders or video files")
+parser.add_argument("source", nargs="+", help="image dir, glob pattern or video file")
+parser.add_argument("--chessboard", nargs=2, type=int, default=[9, 6], help="inner corners, e.g. 9 6")
+parser.add_argument("--square-size", default=0.01, type=float, help="square size")
+parser.add_argument(
+    "--target",
+    default="chessboard",
+    choices=target_kinds(),
+    help="calibration target; --chessboard gives circle counts for circle grids",
+)
+parser.add_argument("--marker-ratio", default=0.75, type=float, help="ChArUco marker/square ratio")
+parser.add_argument("--aruco-dict", default="DICT_5X5_250", help="ChArUco ArUco dictionary")
+parser.add_argument(
+    "--output-dir", default="calibration_results", type=Path, help="dir to save results"
+)
+parser.add_argument("--min-images", default=15, type=int, help="minimum number of views")
+parser.add_argument("--max-images", default=None, type=int, help="maximum number of views")
+parser.add_argument("--frame-step", default=1, type=int, help="use every n-th video frame")
+parser.add_argument(
+    "--min-corner-motion",
+    default=10.0,
+    type=float,
+    help="skip views whose corners moved less than this many pixels",
+)
+parser.add_argument(
+    "--select-views",
+    action="store_true",
+    help="keep only views that add image coverage or pose diversity",
+)
+parser.add_argument(
+    "--reject-outliers",
+    action="store_true",
+    help="drop views with large reprojection error and re-solve",
+)
+parser.add_argument(
+    "--save-dataset",
+    default=None,
+    type=Path,
+    help="also save the used corners as a columnar corner dataset in this dir",
+)
+parser.add_argument(
+    "--detect-scale", default=1.0, type=detect_scale_arg, help="coarse search downscale"
+)
+parser.add_argument(
+    "--detect-engine", default="classic", choices=["classic", "sb"], help="chessboard detector"
+)
+parser.add_argument(
+    "--max-sharpness",
+    default=None,
+    type=float,
+    help="drop blurry views (mean corner edge width in pixels), 0 disables",
+)
+parser.add_argument(
+    "--detect-backend",
+    default="process",
+    choices=["serial", "thread", "process"],
+    help="where to run chessboard detection",
+)
+parser.add_argument("--detect-workers", default=0, type=int, help="0 means one per CPU core")
+
+
+def main():
+    args = parser.parse_args()
+    backend = create_backend(args.detect_backend, args.detect_workers)
+    calibrator = CameraCalibrator(
+        detect_scale=args.detect_scale,
+        detect_engine=args.detect_engine,
+        max_sharpness=args.max_sharpness,
+        backend=backend,
+        reject_outliers=args.reject_outliers,
+    )
+    calibrator.set_chessboard_size(*args.chessboard, args.square_size)
+    calibrator.set_target(TargetSpec(args.target, args.marker_ratio, args.aruco_dict))
+    try:
+        results = calibrator.calibrate_from_source(
+            args.source,
+            max_images=args.max_images,
+            min_images=args.min_images,
+            frame_step=args.frame_step,
+            min_corner_motion=args.min_corner_motion,
+            select_views=args.select_views,
+        )
+    finally:
+        if backend is not None:
+            backend.close()
+    results.save(args.output_dir)
+    if args.save_dataset is not None:
+        calibrator.save_dataset(args.save_dataset)
+        print(f"角点数据集已保存到 {args.save_dataset.absolute()} 目录")
+    UndistortMaps.load_or_build(
+        args.output_dir, results.camera_matrix, results.dist_coeffs, results.image_size
+    )
+    print(f"标定结果已保存到 {args.output_dir.absolute()} 目录")
+
+
+if __name__ == "__main__":
+    main()
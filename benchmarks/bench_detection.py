@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+棋盘格检测基准：比较原分辨率检测与金字塔粗到精检测的耗时和角点精度
+
+用法: python benchmarks/bench_detection.py --scales 1 0.5 0.25 --repeat 5
+"""
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calibration import CameraCalibrator  # noqa: E402
+from synthetic import (  # noqa: E402
+    default_camera_matrix,
+    fronto_parallel_pose,
+    render_chessboard,
+    render_empty,
+)
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (3840, 2160)]
+POSES = [
+    dict(fill=0.5, tilt_deg=(0, 0), offset=(0, 0)),
+    dict(fill=0.35, tilt_deg=(25, -15), offset=(0.2, 0.1)),
+    dict(fill=0.6, tilt_deg=(-20, 30), offset=(-0.1, -0.1)),
+]
+
+
+def corner_error(found: np.ndarray, truth: np.ndarray) -> float:
+    """角点最大误差（像素），兼容检测结果顺序反转的情况"""
+    found = found.reshape(-1, 2)
+    truth = truth.reshape(-1, 2)
+    forward = np.linalg.norm(found - truth, axis=1).max()
+    backward = np.linalg.norm(found[::-1] - truth, axis=1).max()
+    return float(min(forward, backward))
+
+
+def make_frames(image_size, pattern_size, square_size, rng):
+    K = default_camera_matrix(image_size)
+    frames = []
+    for pose in POSES:
+        rvec, tvec = fronto_parallel_pose(pattern_size, square_size, K, image_size, **pose)
+        frame, truth = render_chessboard(
+            pattern_size,
+            image_size,
+            K,
+            rvec,
+            tvec,
+            square_size,
+            noise_sigma=2.0,
+            blur_sigma=0.8,
+            rng=rng,
+        )
+        frames.append((frame, truth))
+    return frames
+
+
+def bench(calibrator: CameraCalibrator, frame, repeat: int):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = calibrator.detect_chessboard(frame)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times)), result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--scales", nargs="+", type=float, default=[1.0, 0.5, 0.25])
+    parser.add_argument("--board", nargs=2, type=int, default=[9, 6])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pattern_size = tuple(args.board)
+    square_size = 0.025
+    rng = np.random.default_rng(0)
+
+    print(
+        f"{'resolution':>11} {'scale':>6} {'found ms':>9} {'empty ms':>9} "
+        f"{'hit':>5} {'max err px':>11}"
+    )
+    for image_size in RESOLUTIONS:
+        frames = make_frames(image_size, pattern_size, square_size, rng)
+        empty = render_empty(image_size)
+        for scale in args.scales:
+            calibrator = CameraCalibrator(detect_scale=scale)
+            calibrator.set_chessboard_size(*pattern_size, square_size)
+
+            found_ms, hits, errors = [], 0, []
+            for frame, truth in frames:
+                ms, (ret, corners) = bench(calibrator, frame, args.repeat)
+                found_ms.append(ms)
+                if ret:
+                    hits += 1
+                    errors.append(corner_error(corners, truth))
+            empty_ms, _ = bench(calibrator, empty, args.repeat)
+
+            max_error = f"{max(errors):.4f}" if errors else "-"
+            print(
+                f"{image_size[0]:>5}x{image_size[1]:<5} {scale:>6.2f} "
+                f"{np.mean(found_ms):>9.1f} {empty_ms:>9.1f} "
+                f"{hits:>2}/{len(frames):<2} {max_error:>11}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+预处理微基准：比较每帧新建CLAHE/缓冲区与复用PreprocessPipeline的耗时和内存分配
+
+用法: python benchmarks/bench_preprocess.py --frames 200
+"""
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calibration import PreprocessPipeline  # noqa: E402
+from synthetic import render_empty  # noqa: E402
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (3840, 2160)]
+
+
+def preprocess_per_frame(frame, chessboard_size):
+    """改动前的做法：每帧新建CLAHE、灰度图、均衡化结果和3D模板点"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    gray = clahe.apply(gray)
+    objp = np.zeros((chessboard_size[0] * chessboard_size[1], 3), np.float32)
+    objp[:, :2] = np.mgrid[0 : chessboard_size[0], 0 : chessboard_size[1]].T.reshape(-1, 2)
+    objp = objp * chessboard_size[2]
+    return gray, objp
+
+
+def measure(step, frames: int):
+    """返回(每帧耗时ms, 每帧分配的峰值字节数)"""
+    step()  # 预热
+    start = time.perf_counter()
+    for _ in range(frames):
+        step()
+    elapsed = (time.perf_counter() - start) * 1000 / frames
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(frames, 20)):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        step()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - baseline)
+    tracemalloc.stop()
+    return elapsed, int(np.median(peaks))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    chessboard_size = (9, 6, 0.025)
+    print(f"{'resolution':>11} {'mode':>9} {'ms/frame':>9} {'alloc/frame':>12}")
+    for image_size in RESOLUTIONS:
+        frame = render_empty(image_size)
+        pipeline = PreprocessPipeline(image_size, chessboard_size)
+        steps = {
+            "before": lambda: preprocess_per_frame(frame, chessboard_size),
+            "pipeline": lambda: (pipeline.apply(frame), pipeline.object_points),
+        }
+        for name, step in steps.items():
+            ms, alloc = measure(step, args.frames)
+            print(
+                f"{image_size[0]:>5}x{image_size[1]:<5} {name:>9} {ms:>9.3f} "
+                f"{alloc / 1024:>9.1f} KB"
+            )
+
+
+if __name__ == "__main__":
+    main()
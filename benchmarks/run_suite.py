@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""
+可复现的基准套件：用合成棋盘格（已知内参、畸变、位姿、噪声和模糊）测量
+各检测引擎的检测延迟分位数和角点误差、不同模糊程度下的检测与模糊剔除、
+各种标定板的单帧检测耗时、端到端标定耗时与内参精度、N个客户端时的视频流吞吐，
+结果保存为JSON，可与之前的结果对比
+
+用法:
+    python benchmarks/run_suite.py --output result.json
+    python benchmarks/run_suite.py --quick --compare baseline.json
+    python benchmarks/run_suite.py --sections detection blur --engines classic sb
+"""
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calibration import DEFAULT_MAX_SHARPNESS, CameraCalibrator  # noqa: E402
+from capture import CameraCapture  # noqa: E402
+from streaming import MjpegBroadcaster  # noqa: E402
+from targets import TargetSpec  # noqa: E402
+from synthetic import (  # noqa: E402
+    FakeVideoCapture,
+    default_camera_matrix,
+    pose_pattern_size,
+    random_pose,
+    render_chessboard,
+    render_empty,
+    render_sequence,
+)
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+# 与API限制一致：最小3x3，最大15x15
+BOARDS = [(3, 3), (9, 6), (15, 15)]
+ENGINES = ["classic", "sb"]
+# 模糊扫描使用的高斯模糊sigma（像素）
+BLUR_SIGMAS = [0.5, 1.5, 2.5, 3.5]
+# 标定板类型 -> 尺寸（棋盘格和ChArUco为内角点数，圆点阵列为圆点数），特征点数相近
+TARGETS = {
+    "chessboard": (9, 6),
+    "charuco": (9, 6),
+    "circles": (9, 6),
+    "asymmetric_circles": (5, 9),
+}
+DIST_COEFFS = np.array([-0.12, 0.03, 0.0005, -0.0003, 0.0])
+SQUARE_SIZE = 0.025
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """毫秒分位数"""
+    if not values:
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in points}
+
+
+def corner_error(found: np.ndarray, truth: np.ndarray, pattern_size) -> float:
+    """角点最大误差（像素），兼容检测结果顺序反转（方形棋盘格还可能旋转90度）的情况"""
+    cols, rows = pattern_size
+    grid = found.reshape(rows, cols, 2)
+    truth = truth.reshape(-1, 2)
+    turns = (0, 1, 2, 3) if rows == cols else (0, 2)
+    return float(min(
+        np.linalg.norm(np.rot90(grid, k).reshape(-1, 2) - truth, axis=1).max() for k in turns
+    ))
+
+
+def bench_detection(resolutions, boards, frames: int, seed: int, engines=("classic",)):
+    """
+    每种检测引擎、分辨率和棋盘格尺寸下的单帧检测延迟、命中率和角点误差
+
+    这里关闭模糊剔除，只比较引擎本身；模糊剔除的效果见bench_blur
+    """
+    results = []
+    for image_size, engine, board in itertools.product(resolutions, engines, boards):
+        K = default_camera_matrix(image_size)
+        empty = render_empty(image_size, seed)
+        rng = np.random.default_rng(seed)
+        calibrator = CameraCalibrator(detect_engine=engine, max_sharpness=0)
+        calibrator.set_chessboard_size(*board, SQUARE_SIZE)
+        calibrator.detect_chessboard(empty)  # 预热（创建预处理流水线）
+
+        latencies, errors, hits = [], [], 0
+        for _ in range(frames):
+            rvec, tvec = random_pose(board, SQUARE_SIZE, K, image_size, rng)
+            frame, truth = render_chessboard(
+                board, image_size, K, rvec, tvec, SQUARE_SIZE,
+                noise_sigma=2.0, blur_sigma=0.6, rng=rng, dist_coeffs=DIST_COEFFS,
+            )
+            start = time.perf_counter()
+            ret, corners = calibrator.detect_chessboard(frame)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if ret:
+                hits += 1
+                errors.append(corner_error(corners, truth, board))
+
+        empty_latencies = []
+        for _ in range(max(frames // 4, 3)):
+            start = time.perf_counter()
+            calibrator.detect_chessboard(empty)
+            empty_latencies.append((time.perf_counter() - start) * 1000)
+
+        entry = {
+            "resolution": list(image_size),
+            "engine": engine,
+            "board": list(board),
+            "frames": frames,
+            "hit_rate": round(hits / frames, 3),
+            "latency_ms": percentiles(latencies),
+            "empty_latency_ms": percentiles(empty_latencies),
+            "median_corner_error_px": round(float(np.median(errors)), 4) if errors else None,
+            "max_corner_error_px": round(float(np.max(errors)), 4) if errors else None,
+        }
+        results.append(entry)
+        print(
+            f"detect {image_size[0]}x{image_size[1]} {engine:<7} board {board[0]}x{board[1]}: "
+            f"p50 {entry['latency_ms']['p50']} ms, p99 {entry['latency_ms']['p99']} ms, "
+            f"hit {entry['hit_rate']:.0%}, error {entry['median_corner_error_px']} px"
+        )
+    return results
+
+
+def bench_blur(image_size, frames: int, seed: int, engines=("classic",)):
+    """
+    不同模糊程度下各引擎的检测率、角点误差、清晰度（角点边缘宽度）和被模糊剔除的比例
+
+    同一组位姿和噪声在各个模糊程度下复用，只有模糊sigma不同
+    """
+    K = default_camera_matrix(image_size)
+    board = (9, 6)
+    results = []
+    for engine, blur in itertools.product(engines, BLUR_SIGMAS):
+        rng = np.random.default_rng(seed)
+        calibrator = CameraCalibrator(detect_engine=engine, max_sharpness=0)
+        calibrator.set_chessboard_size(*board, SQUARE_SIZE)
+        threshold = DEFAULT_MAX_SHARPNESS["sb"]
+        errors, sharpness, hits, rejected = [], [], 0, 0
+        for _ in range(frames):
+            rvec, tvec = random_pose(board, SQUARE_SIZE, K, image_size, rng)
+            frame, truth = render_chessboard(
+                board, image_size, K, rvec, tvec, SQUARE_SIZE,
+                noise_sigma=2.0, blur_sigma=blur, rng=rng, dist_coeffs=DIST_COEFFS,
+            )
+            ret, corners = calibrator.detect_chessboard(frame)
+            if not ret:
+                continue
+            hits += 1
+            errors.append(corner_error(corners, truth, board))
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            stats, _ = cv2.estimateChessboardSharpness(gray, board, corners)
+            sharpness.append(stats[0])
+            rejected += stats[0] > threshold
+
+        entry = {
+            "resolution": list(image_size),
+            "engine": engine,
+            "blur": blur,
+            "frames": frames,
+            "hit_rate": round(hits / frames, 3),
+            "median_corner_error_px": round(float(np.median(errors)), 4) if errors else None,
+            "median_sharpness_px": round(float(np.median(sharpness)), 3) if sharpness else None,
+            "max_sharpness": threshold,
+            "rejected_rate": round(rejected / hits, 3) if hits else None,
+        }
+        results.append(entry)
+        print(
+            f"blur {blur} {engine:<7}: hit {entry['hit_rate']:.0%}, "
+            f"error {entry['median_corner_error_px']} px, "
+            f"sharpness {entry['median_sharpness_px']} px, rejected {entry['rejected_rate']}"
+        )
+    return results
+
+
+def bench_targets(resolutions, frames: int, seed: int):
+    """同样的位姿分布下各种标定板的单帧检测耗时（CameraCalibrator.detect）、命中率和角点误差"""
+    results = []
+    for image_size in resolutions:
+        K = default_camera_matrix(image_size)
+        empty = render_empty(image_size, seed)
+        for kind, board in TARGETS.items():
+            rng = np.random.default_rng(seed)
+            target = TargetSpec(kind)
+            calibrator = CameraCalibrator()
+            calibrator.set_chessboard_size(*board, SQUARE_SIZE)
+            calibrator.set_target(target)
+            calibrator.detect(empty)  # 预热
+
+            latencies, errors, points, hits = [], [], [], 0
+            for _ in range(frames):
+                rvec, tvec = random_pose(
+                    pose_pattern_size(board, target), SQUARE_SIZE, K, image_size, rng
+                )
+                frame, truth = render_chessboard(
+                    board, image_size, K, rvec, tvec, SQUARE_SIZE,
+                    noise_sigma=2.0, blur_sigma=0.6, rng=rng, dist_coeffs=DIST_COEFFS,
+                    target=target,
+                )
+                start = time.perf_counter()
+                ret, corners, ids = calibrator.detect(frame)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if ret:
+                    hits += 1
+                    points.append(len(corners))
+                    if ids is None:
+                        errors.append(corner_error(corners, truth, board))
+                    else:
+                        diff = corners.reshape(-1, 2) - truth.reshape(-1, 2)[ids]
+                        errors.append(float(np.linalg.norm(diff, axis=1).max()))
+
+            entry = {
+                "resolution": list(image_size),
+                "target": kind,
+                "board": list(board),
+                "frames": frames,
+                "hit_rate": round(hits / frames, 3),
+                "mean_points": round(float(np.mean(points)), 1) if points else None,
+                "latency_ms": percentiles(latencies),
+                "median_corner_error_px": round(float(np.median(errors)), 4) if errors else None,
+            }
+            results.append(entry)
+            print(
+                f"target {image_size[0]}x{image_size[1]} {kind:<18}: "
+                f"p50 {entry['latency_ms']['p50']} ms, p90 {entry['latency_ms']['p90']} ms, "
+                f"hit {entry['hit_rate']:.0%}, error {entry['median_corner_error_px']} px"
+            )
+    return results
+
+
+def bench_calibration(resolutions, poses: int, seed: int, engines=("classic",)):
+    """通过合成摄像头跑完整的auto_calibrate，记录耗时与恢复出的内参误差"""
+    results = []
+    board = (9, 6)
+    for image_size, engine in itertools.product(resolutions, engines):
+        K = default_camera_matrix(image_size)
+        frames = render_sequence(
+            board, image_size, K, poses, SQUARE_SIZE, dist_coeffs=DIST_COEFFS, seed=seed
+        )
+        camera = FakeVideoCapture(frames)
+        calibrator = CameraCalibrator(detect_engine=engine)
+        calibrator.set_chessboard_size(*board, SQUARE_SIZE)
+
+        start = time.perf_counter()
+        result = calibrator.auto_calibrate(camera, lambda p, m: None, max_images=30, min_images=15)
+        elapsed = time.perf_counter() - start
+
+        entry = {
+            "resolution": list(image_size),
+            "engine": engine,
+            "board": list(board),
+            "frames_read": camera.index,
+            "seconds": round(elapsed, 3),
+            "success": result is not None,
+        }
+        if result is not None:
+            recovered = result.camera_matrix
+            dist = np.asarray(result.dist_coeffs).ravel()
+            entry.update(
+                {
+                    "views": result.calibration_images,
+                    "reprojection_error": round(float(result.reprojection_error), 4),
+                    "fx_error_pct": round(abs(recovered[0, 0] / K[0, 0] - 1) * 100, 4),
+                    "fy_error_pct": round(abs(recovered[1, 1] / K[1, 1] - 1) * 100, 4),
+                    "cx_error_px": round(abs(recovered[0, 2] - K[0, 2]), 3),
+                    "cy_error_px": round(abs(recovered[1, 2] - K[1, 2]), 3),
+                    "k1_error": round(abs(dist[0] - DIST_COEFFS[0]), 5),
+                    "k2_error": round(abs(dist[1] - DIST_COEFFS[1]), 5),
+                }
+            )
+        results.append(entry)
+        print(
+            f"calibrate {image_size[0]}x{image_size[1]} {engine}: {entry['seconds']} s, "
+            f"fx error {entry.get('fx_error_pct')}%, rms {entry.get('reprojection_error')}"
+        )
+    return results
+
+
+def bench_stream(image_size, client_counts, seconds: float, fps: float, seed: int):
+    """30fps合成摄像头 + 编码一次的广播器，N个同步客户端时的编码与分发吞吐"""
+    K = default_camera_matrix(image_size)
+    frames = render_sequence((9, 6), image_size, K, 10, SQUARE_SIZE, hold=1, seed=seed)
+    results = []
+    for clients in client_counts:
+        capture = CameraCapture(FakeVideoCapture(frames, fps=fps)).start()
+        broadcaster = MjpegBroadcaster(capture, quality=80).start()
+        stop = threading.Event()
+        received = [0] * clients
+
+        def client(index: int):
+            for _ in broadcaster.subscribe():
+                received[index] += 1
+                if stop.is_set():
+                    break
+
+        threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)  # 预热
+        baseline = list(received)
+        encodes = broadcaster.encode_meter.total
+        start = time.perf_counter()
+        time.sleep(seconds)
+        elapsed = time.perf_counter() - start
+        counts = [r - b for r, b in zip(received, baseline)]
+        encodes = broadcaster.encode_meter.total - encodes
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=2.0)
+        broadcaster.stop()
+        capture.release()
+
+        per_client = [c / elapsed for c in counts]
+        entry = {
+            "resolution": list(image_size),
+            "clients": clients,
+            "source_fps": fps,
+            "encodes_per_sec": round(encodes / elapsed, 2),
+            "client_fps_mean": round(float(np.mean(per_client)), 2),
+            "client_fps_min": round(float(np.min(per_client)), 2),
+            "served_per_sec": round(sum(counts) / elapsed, 2),
+            "dropped_frames": broadcaster.dropped_frames,
+        }
+        results.append(entry)
+        print(
+            f"stream {clients} clients: {entry['encodes_per_sec']} encodes/s, "
+            f"client fps mean {entry['client_fps_mean']} min {entry['client_fps_min']}"
+        )
+    return results
+
+
+def environment():
+    """记录运行环境，便于判断两次结果是否可比"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+
+def _key(entry):
+    # 没有engine字段的旧基线都是classic引擎
+    entry = dict({"engine": "classic"}, **entry)
+    return tuple(entry.get(k) and tuple(entry[k]) if isinstance(entry.get(k), list) else entry.get(k)
+                 for k in ("resolution", "engine", "target", "blur", "board", "clients"))
+
+
+def compare(report, baseline):
+    """与基线结果逐项对比主要指标"""
+    metrics = {
+        "detection": lambda e: e["latency_ms"]["p50"],
+        "targets": lambda e: e["latency_ms"]["p50"],
+        "blur": lambda e: e["median_corner_error_px"],
+        "calibration": lambda e: e["seconds"],
+        "stream": lambda e: e["client_fps_mean"],
+    }
+    labels = {
+        "detection": "p50 ms",
+        "targets": "p50 ms",
+        "blur": "error px",
+        "calibration": "seconds",
+        "stream": "client fps",
+    }
+    for section, metric in metrics.items():
+        old = {_key(e): e for e in baseline.get(section, [])}
+        for entry in report.get(section, []):
+            before = old.get(_key(entry))
+            if before is None:
+                continue
+            a, b = metric(before), metric(entry)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            print(f"{section:<12} {str(_key(entry)):<32} {labels[section]:>10}: {a:>9} -> {b:>9} ({change:+.1f}%)")
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--output", type=Path, default=None, help="JSON report path")
+    parser.add_argument("--compare", type=Path, default=None, help="baseline JSON report")
+    parser.add_argument("--quick", action="store_true", help="smaller run for a smoke check")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--frames", type=int, default=30, help="frames per detection case")
+    parser.add_argument("--poses", type=int, default=40, help="poses in the calibration video")
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 10, 50])
+    parser.add_argument("--stream-seconds", type=float, default=3.0)
+    parser.add_argument(
+        "--engines", nargs="+", default=ENGINES, choices=ENGINES,
+        help="chessboard detection engines to compare",
+    )
+    parser.add_argument(
+        "--sections", nargs="+", default=["detection", "targets", "blur", "calibration", "stream"],
+        choices=["detection", "targets", "blur", "calibration", "stream"],
+    )
+    args = parser.parse_args()
+
+    resolutions = RESOLUTIONS
+    if args.quick:
+        resolutions = RESOLUTIONS[:2]
+        args.frames = min(args.frames, 10)
+        args.clients = args.clients[:2]
+        args.stream_seconds = min(args.stream_seconds, 1.5)
+
+    report = {"environment": environment(), "config": {
+        "seed": args.seed,
+        "frames": args.frames,
+        "poses": args.poses,
+        "engines": args.engines,
+        "dist_coeffs": DIST_COEFFS.tolist(),
+        "square_size": SQUARE_SIZE,
+    }}
+    if "detection" in args.sections:
+        report["detection"] = bench_detection(
+            resolutions, BOARDS, args.frames, args.seed, args.engines
+        )
+    if "targets" in args.sections:
+        report["targets"] = bench_targets(resolutions, args.frames, args.seed)
+    if "blur" in args.sections:
+        report["blur"] = bench_blur(resolutions[0], args.frames, args.seed, args.engines)
+    if "calibration" in args.sections:
+        report["calibration"] = bench_calibration(
+            resolutions, args.poses, args.seed, args.engines
+        )
+    if "stream" in args.sections:
+        report["stream"] = bench_stream(resolutions[0], args.clients, args.stream_seconds, 30.0, args.seed)
+
+    output = args.output or Path(__file__).resolve().parent.joinpath(
+        "results", f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"结果已保存到 {output}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
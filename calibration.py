@@ -1,12 +1,50 @@
 # -*- coding: utf-8 -*-
 import math
+from argparse import ArgumentTypeError
 import cv2
 import numpy as np
 import time
-from typing import List, Optional, Callable, Dict, Any, Tuple
+from typing import List, Optional, Callable, Dict, Any, Sequence, Tuple
 import threading
-from dataclasses import dataclass, fields
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 import json
+from pathlib import Path
+from result_store import atomic_write
+from sources import iter_source_frames
+from view_selection import ViewSelector
+from corner_dataset import CornerDataset, CornerDatasetWriter
+from recording import SessionRecorder, read_recording
+from reprojection import compute_reprojection_errors
+from targets import TargetDetector, TargetSpec, create_target
+from metrics import (
+    DETECTIONS,
+    DETECT_SKIPPED_FRAMES,
+    STAGE_SECONDS,
+    TARGET_DETECT_SECONDS,
+    stage_timer,
+    target_latency_stats,
+)
+
+
+# 棋盘格检测引擎：classic为findChessboardCorners + cornerSubPix，
+# sb为基于扇区的findChessboardCornersSB，角点本身就是亚像素精度
+DETECT_ENGINES = ("classic", "sb")
+DETECT_SCALE_ERROR = "检测缩放比例必须在(0, 1]之间"
+# 各引擎默认的模糊阈值（角点边缘宽度，像素，见estimateChessboardSharpness），0表示不检查
+DEFAULT_MAX_SHARPNESS = {"classic": 0.0, "sb": 5.0}
+
+
+@dataclass
+class Detection:
+    """某一帧的标定板检测结果，按帧序号索引"""
+
+    seq: int
+    found: bool
+    corners: Optional[np.ndarray]
+    ids: Optional[np.ndarray] = None  # 部分可见时角点在模板中的编号，None表示完整的标定板
+    frame: Optional[np.ndarray] = None  # 只在录制原图时保留帧的副本
 
 
 @dataclass
@@ -20,9 +58,13 @@ class CalibrationResults:
     chessboard_size: List[Any]
     image_size: List[int]
     fov: List[int]
+    per_view_errors: List[float] = field(default_factory=list)  # 每个视图的RMS
+    rejected_views: int = 0  # 离群剔除掉的视图数
+    target: str = "chessboard"  # 标定板类型
 
-    def save_json(self, p: Any):
-        results = {
+    def to_dict(self) -> Dict[str, Any]:
+        """与calibration.json内容一致的字典"""
+        return {
             "camera_matrix": self.camera_matrix.tolist(),
             "dist_coeffs": self.dist_coeffs.tolist(),
             "reprojection_error": self.reprojection_error,
@@ -30,83 +72,479 @@ class CalibrationResults:
             "chessboard_size": self.chessboard_size,
             "fov": self.fov,
             "image_size": self.image_size,
+            "per_view_errors": self.per_view_errors,
+            "rejected_views": self.rejected_views,
+            "target": self.target,
         }
-        return json.dump(results, p, indent=2)
+
+    def save_json(self, p: Any):
+        return json.dump(self.to_dict(), p, indent=2)
 
     def save_numpy(self, p: Any):
         np.savez(p, camera_matrix=self.camera_matrix, dist_coeffs=self.dist_coeffs)
 
+    def save(self, output_dir: Any):
+        """把JSON、NumPy和文本格式的结果原子地保存到目录（先写临时文件再rename）"""
+        output_dir = Path(output_dir)
+        atomic_write(output_dir.joinpath("calibration.json"), self.save_json)
+        atomic_write(output_dir.joinpath("calibration.npz"), self.save_numpy, "wb")
+        atomic_write(output_dir.joinpath("calibration.txt"), self.save_text)
+
     def save_text(self, f: Any):
         # 保存为文本格式便于查看
         f.write("相机标定结果\n")
         f.write("=" * 50 + "\n\n")
+        f.write(f"标定板: {self.target}\n")
         f.write(f"棋盘格尺寸: {self.chessboard_size}\n")
         f.write(f"图片尺寸: {self.image_size}\n")
         f.write(f"标定图片数量: {self.calibration_images}\n")
         f.write(f"相机视场角: {self.fov}\n")
-        f.write(f"重投影误差: {self.reprojection_error:.6f}\n\n")
+        f.write(f"重投影误差: {self.reprojection_error:.6f}\n")
+        f.write(f"剔除的离群视图: {self.rejected_views}\n\n")
         f.write("相机矩阵:\n")
         np.savetxt(f, self.camera_matrix, fmt="%10.5f")
         f.write("\n畸变系数:\n")
         np.savetxt(f, self.dist_coeffs, fmt="%10.5f")
 
 
+class PreprocessPipeline:
+    """
+    检测前的预处理流水线：灰度化 + CLAHE (+ 金字塔缩小)
+
+    CLAHE实例和输出数组只在创建时分配，之后每帧通过dst=复用；
+    同时缓存棋盘格的3D模板点。图像尺寸或棋盘格尺寸变化时需要重建。
+    返回的数组会被下一帧覆盖，同一流水线不能被多个线程同时使用。
+    """
+
+    def __init__(
+        self,
+        image_size: Tuple[int, int],
+        chessboard_size: Tuple[int, int, float],
+        clip_limit: float = 2.0,
+        tile_grid_size: Tuple[int, int] = (8, 8),
+    ):
+        self.image_size = tuple(image_size)
+        self.chessboard_size = tuple(chessboard_size)
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        width, height = self.image_size
+        self.gray = np.empty((height, width), np.uint8)
+        self.equalized = np.empty((height, width), np.uint8)
+        self._small = None
+
+        # 3D世界坐标模板点，所有视图共享同一个数组
+        cols, rows, square_size = self.chessboard_size
+        objp = np.zeros((cols * rows, 3), np.float32)
+        objp[:, :2] = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2)
+        objp *= square_size
+        objp.setflags(write=False)
+        self.object_points = objp
+
+    def matches(self, image_size, chessboard_size) -> bool:
+        return self.image_size == tuple(image_size) and self.chessboard_size == tuple(
+            chessboard_size
+        )
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        """返回均衡化后的灰度图（复用内部缓冲区）"""
+        if frame.ndim == 2:
+            gray = frame
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        # 调整图像以提高检测效果
+        return self.clahe.apply(gray, dst=self.equalized)
+
+    def downscale(self, gray: np.ndarray, scale: float) -> np.ndarray:
+        """缩小图像用于粗检测，整幅图像时复用内部缓冲区"""
+        size = (
+            max(int(round(gray.shape[1] * scale)), 1),
+            max(int(round(gray.shape[0] * scale)), 1),
+        )
+        if gray.shape != self.equalized.shape:
+            # ROI等局部区域的尺寸每帧不同，不做缓存
+            return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        if self._small is None or self._small.shape != (size[1], size[0]):
+            self._small = np.empty((size[1], size[0]), np.uint8)
+        return cv2.resize(gray, size, dst=self._small, interpolation=cv2.INTER_AREA)
+
+
+def detect_scale_arg(value: str) -> float:
+    """argparse的type：解析粗检测缩放比例，不在(0, 1]之间时报错"""
+    scale = float(value)
+    if not 0 < scale <= 1:
+        raise ArgumentTypeError(f"{DETECT_SCALE_ERROR}: {value}")
+    return scale
+
+
 class CameraCalibrator:
-    def __init__(self):
+    def __init__(
+        self,
+        detect_scale: float = 1.0,
+        roi_tracking: bool = False,
+        backend: Any = None,
+        estimate_every: int = 5,
+        reject_outliers: bool = False,
+        outlier_threshold: float = 0.5,
+        outlier_factor: float = 3.0,
+        cpu_share: Any = None,
+        detect_engine: str = "classic",
+        max_sharpness: Optional[float] = None,
+    ):
         self.chessboard_size = (9, 6, 0.01)  # 默认棋盘格尺寸
+        # 标定板类型（见targets.py），棋盘格使用内置的检测流程
+        self.target = TargetSpec()
+        self._target_detector: Optional[TargetDetector] = None
+        # 检测后端（见detection_backend.py），None表示在当前线程中逐帧检测
+        self.backend = backend
+        # 多个标定器共享CPU时的检测配额（见sessions.FairShare），每次检测前获取
+        self.cpu_share = cpu_share
+        self.in_flight = 0  # 正在检测的帧数（队列深度）
+        # 粗检测的缩放比例，小于1时先在缩小的图像上找角点，再在原图上亚像素精细化
+        self.detect_scale = 1.0
+        self.set_detect_scale(detect_scale)
+        self.detect_engine = "classic"
+        self.set_detect_engine(detect_engine)
+        # 角点平均边缘宽度超过该值（像素）的帧视为模糊，不采用；None表示使用引擎的默认值
+        self.max_sharpness = max_sharpness
+        self.last_sharpness: Optional[float] = None  # 最近一次检测到的棋盘格的清晰度
+        self.last_outcome: Optional[str] = None  # 最近一帧的检测结论：found、missed或blurry
+        self.blurry_frames = 0  # 本标定器因模糊丢弃的帧数（全局总数见DETECTIONS指标）
+        # ROI跟踪：先在上一次角点外接框附近搜索，未找到再搜索整幅图像
+        self.roi_tracking = roi_tracking
+        self.roi_hits = 0
+        self.roi_misses = 0
+        self._last_bbox = None
+        self._pipeline: Optional[PreprocessPipeline] = None
+        # 采集过程中每新增estimate_every个视图在后台热启动求解一次，0表示不估计
+        self.estimate_every = estimate_every
+        self.running_estimate: Optional[Dict[str, Any]] = None
+        # 中间估计更新后的回调（在求解线程中调用）
+        self.estimate_callback: Optional[Callable[[], None]] = None
+        # 每检测完一帧的回调（在标定线程中调用），没有采用视图时也能更新检测统计
+        self.detection_callback: Optional[Callable[[], None]] = None
+        self._estimate_views = 0
+        self._estimate_thread: Optional[threading.Thread] = None
+        self._estimate_lock = threading.Lock()
+        self._generation = 0  # reset()后丢弃上一轮后台求解的结果
+        self.view_selector: Optional[ViewSelector] = None
+        # 录制采用的视图（见recording.SessionRecorder），None表示不录制
+        self.recorder: Optional[SessionRecorder] = None
+        # 离群视图剔除：RMS超过max(outlier_threshold, outlier_factor * 中位数)的视图被剔除后重新求解
+        self.reject_outliers = reject_outliers
+        self.outlier_threshold = outlier_threshold
+        self.outlier_factor = outlier_factor
         self.criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
         self.object_points = []  # 3D世界坐标点
         self.image_points = []  # 2D图像坐标点
+        self.point_ids = []  # 每个视图的角点编号，None表示完整的标定板
         self.image_size = None
         self.calibration_results = None
         self.stop_calibration = False
         self.current_instruction = "请将棋盘格放置在摄像头前"
         self.collected_images = 0
+        # 当前标定的最小视图数，覆盖率统计与采集循环使用同一个目标
+        self.min_images = 15
+        # 最近几帧的检测结果，预览叠加直接复用，不再重复检测
+        self._detections = deque(maxlen=8)
+        self._detection_lock = threading.Lock()
 
     def set_chessboard_size(self, width: int, height: int, square_size: float):
         """设置棋盘格尺寸"""
         self.chessboard_size = (width, height, square_size)
 
+    def set_detect_scale(self, scale: float):
+        """设置粗检测的缩放比例，1.0表示直接在原图上检测"""
+        if not 0 < scale <= 1:
+            raise ValueError(DETECT_SCALE_ERROR)
+        self.detect_scale = scale
+
+    def set_detect_engine(self, engine: str):
+        """设置棋盘格检测引擎（classic或sb）"""
+        if engine not in DETECT_ENGINES:
+            raise ValueError(f"未知的检测引擎: {engine}，可选: {', '.join(DETECT_ENGINES)}")
+        self.detect_engine = engine
+
+    def get_max_sharpness(self) -> float:
+        """当前生效的模糊阈值，0表示不检查"""
+        if self.max_sharpness is None:
+            return DEFAULT_MAX_SHARPNESS[self.detect_engine]
+        return self.max_sharpness
+
+    def set_target(self, target: TargetSpec):
+        """设置标定板类型，参数不合法时抛出ValueError"""
+        if target.kind != "chessboard":
+            create_target(self.chessboard_size, target)
+        self.target = target
+
+    def get_target_detector(self) -> Optional[TargetDetector]:
+        """当前的标定板检测器，棋盘格时返回None；只在类型或尺寸变化时重建"""
+        if self.target.kind == "chessboard":
+            return None
+        detector = self._target_detector
+        if detector is None or not detector.matches(self.chessboard_size, self.target):
+            detector = create_target(self.chessboard_size, self.target)
+            self._target_detector = detector
+        return detector
+
+    def get_object_points(self, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """视图的3D坐标点：完整的标定板共享同一个模板，部分可见时按编号取模板中的点"""
+        detector = self.get_target_detector()
+        if detector is None:
+            template = self.get_pipeline(self.image_size).object_points
+        else:
+            template = detector.object_points
+        return template if ids is None else template[ids]
+
+    def get_detect_config(self):
+        """检测后端的工作者需要的检测配置"""
+        return (
+            tuple(self.chessboard_size),
+            self.detect_scale,
+            self.target,
+            self.detect_engine,
+            self.get_max_sharpness(),
+        )
+
     def reset(self):
         """重置标定器"""
         self.object_points = []
         self.image_points = []
+        self.point_ids = []
         self.image_size = None
         self.calibration_results = None
         self.stop_calibration = False
         self.current_instruction = "请将棋盘格放置在摄像头前"
         self.collected_images = 0
+        self.roi_hits = 0
+        self.roi_misses = 0
+        self.blurry_frames = 0
+        self._last_bbox = None
+        self.view_selector = None
+        with self._detection_lock:
+            self._detections.clear()
+        with self._estimate_lock:
+            self._generation += 1
+            self.running_estimate = None
+            self._estimate_views = 0
+
+    def publish_detection(
+        self, seq: int, found: bool, corners: Optional[np.ndarray], ids: Optional[np.ndarray] = None
+    ):
+        """发布某一帧的检测结果供预览叠加使用"""
+        with self._detection_lock:
+            self._detections.append(Detection(seq, found, corners, ids))
+
+    def get_detection(self, seq: int, max_age: int = 3) -> Optional[Detection]:
+        """返回与seq最接近的缓存检测结果，相差超过max_age帧时返回None"""
+        with self._detection_lock:
+            best = None
+            for detection in self._detections:
+                if abs(seq - detection.seq) > max_age:
+                    continue
+                if best is None or abs(seq - detection.seq) < abs(seq - best.seq):
+                    best = detection
+            return best
+
+    def get_pipeline(self, image_size: Tuple[int, int]) -> PreprocessPipeline:
+        """返回当前的预处理流水线，只在分辨率或棋盘格尺寸变化时重建"""
+        pipeline = self._pipeline
+        if pipeline is None or not pipeline.matches(image_size, self.chessboard_size):
+            pipeline = PreprocessPipeline(image_size, self.chessboard_size)
+            self._pipeline = pipeline
+        return pipeline
+
+    def detect(self, frame) -> Tuple[bool, Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        按当前的标定板类型检测，返回(是否检测到, 角点(N, 1, 2), 角点编号)
+
+        编号为None表示检测到完整的标定板；单帧检测耗时按标定板类型单独统计
+        """
+        start = time.perf_counter()
+        detector = self.get_target_detector()
+        if detector is None:
+            ret, corners = self.detect_chessboard(frame)
+            ids = None
+        else:
+            pipeline = self.get_pipeline((frame.shape[1], frame.shape[0]))
+            with stage_timer("preprocess"):
+                gray = pipeline.apply(frame)
+            with stage_timer("find_corners"):
+                ret, corners, ids = detector.detect(gray)
+            self._count_detection("found" if ret else "missed")
+        TARGET_DETECT_SECONDS.observe(
+            time.perf_counter() - start,
+            target=self.target.kind,
+            result="found" if ret else "missed",
+        )
+        return ret, corners, ids
+
+    def get_target_stats(self) -> Dict[str, Any]:
+        """当前标定板类型和各类型的单帧检测耗时统计"""
+        return {"kind": self.target.kind, "latency": target_latency_stats()}
 
     def detect_chessboard(self, frame):
         """检测棋盘格角点"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        pipeline = self.get_pipeline((frame.shape[1], frame.shape[0]))
+        with stage_timer("preprocess"):
+            gray = pipeline.apply(frame)
 
-        # 调整图像以提高检测效果
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        gray = clahe.apply(gray)
+        # 尝试检测棋盘格角点，跟踪模式下先搜索上一次位置附近
+        ret, corners = False, None
+        start = time.perf_counter()
+        roi = self._tracking_roi(gray.shape) if self.roi_tracking else None
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            ret, corners = self._find_corners(gray[y0:y1, x0:x1])
+            if ret:
+                corners = corners + np.array([x0, y0], np.float32)
+                self.roi_hits += 1
+            else:
+                self.roi_misses += 1
+        if not ret:
+            ret, corners = self._find_corners(gray)
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="find_corners")
+
+        if ret:
+            # 精细化角点位置（始终在原分辨率上进行），sb引擎在原图上检测时已是亚像素精度
+            corners_refined = corners
+            if self.detect_engine == "classic" or self.detect_scale < 1:
+                win = max(11, int(math.ceil(2 / self.detect_scale)))
+                with stage_timer("subpix"):
+                    corners_refined = cv2.cornerSubPix(
+                        gray, corners, (win, win), (-1, -1), self.criteria
+                    )
+            # 统一为(N, 1, 2)，与projectPoints的输出一致（OpenCV 5返回(N, 2)）
+            corners_refined = corners_refined.reshape(-1, 1, 2)
+            self._update_bbox(corners_refined)
+            if self._is_blurry(gray, corners_refined):
+                # 模糊的帧角点位置不可靠，不进入image_points（ROI跟踪照常进行）
+                self._count_detection("blurry")
+                return False, None
+            self._count_detection("found")
+            return True, corners_refined
+        self._last_bbox = None
+        self._count_detection("missed")
+        return False, None
+
+    def _count_detection(self, outcome: str):
+        """记录单帧的检测结论（found、missed或blurry）"""
+        self.last_outcome = outcome
+        if outcome == "blurry":
+            self.blurry_frames += 1
+        DETECTIONS.inc(result=outcome)
+
+    def _is_blurry(self, gray, corners) -> bool:
+        """按角点附近的边缘宽度判断是否模糊，未设置阈值时不检查"""
+        max_sharpness = self.get_max_sharpness()
+        if max_sharpness <= 0:
+            return False
+        with stage_timer("sharpness"):
+            stats, _ = cv2.estimateChessboardSharpness(
+                gray, self.chessboard_size[:2], corners
+            )
+        self.last_sharpness = float(stats[0])
+        return self.last_sharpness > max_sharpness
+
+    def get_engine_stats(self) -> Dict[str, Any]:
+        """检测引擎、模糊阈值、最近一次的清晰度和本摄像头因模糊丢弃的帧数"""
+        return {
+            "engine": self.detect_engine,
+            "max_sharpness": self.get_max_sharpness(),
+            "last_sharpness": self.last_sharpness,
+            "blurry_frames": self.blurry_frames,
+        }
 
-        # 尝试检测棋盘格角点
-        ret, corners = cv2.findChessboardCorners(
-            gray,
-            self.chessboard_size[:2],
+    def _update_bbox(self, corners):
+        """记录角点外接框，供下一帧ROI跟踪使用"""
+        if not self.roi_tracking:
+            return
+        points = corners.reshape(-1, 2)
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0)
+        self._last_bbox = (float(x0), float(y0), float(x1), float(y1))
+
+    def _tracking_roi(self, shape):
+        """上一次外接框外扩后的搜索区域，整数像素(x0, y0, x1, y1)"""
+        if self._last_bbox is None:
+            return None
+        x0, y0, x1, y1 = self._last_bbox
+        height, width = shape[:2]
+        # 外接框只包含内角点，需要再外扩出最外圈方格和白边，并留出帧间运动的余量
+        square = max(
+            (x1 - x0) / max(self.chessboard_size[0] - 1, 1),
+            (y1 - y0) / max(self.chessboard_size[1] - 1, 1),
+        )
+        # 外扩过多反而会让findChessboardCorners变慢，约1.25个方格足够覆盖30fps下的帧间运动
+        pad = 1.25 * square + 0.03 * max(x1 - x0, y1 - y0)
+        roi = (
+            max(int(x0 - pad), 0),
+            max(int(y0 - pad), 0),
+            min(int(math.ceil(x1 + pad)), width),
+            min(int(math.ceil(y1 + pad)), height),
+        )
+        # 外扩后接近整幅图像时ROI没有意义
+        if (roi[2] - roi[0]) * (roi[3] - roi[1]) > 0.8 * width * height:
+            return None
+        return roi
+
+    def get_roi_stats(self) -> Dict[str, Any]:
+        """ROI跟踪命中/未命中统计"""
+        total = self.roi_hits + self.roi_misses
+        return {
+            "enabled": self.roi_tracking,
+            "hits": self.roi_hits,
+            "misses": self.roi_misses,
+            "hit_rate": self.roi_hits / total if total else 0.0,
+        }
+
+    def _find_chessboard(self, gray):
+        """按检测引擎在给定图像上找角点"""
+        if self.detect_engine == "sb":
+            return cv2.findChessboardCornersSB(
+                gray, self.chessboard_size[:2], flags=cv2.CALIB_CB_NORMALIZE_IMAGE
+            )
+        flags = (
             cv2.CALIB_CB_ADAPTIVE_THRESH
             + cv2.CALIB_CB_FAST_CHECK
-            + cv2.CALIB_CB_NORMALIZE_IMAGE,
+            + cv2.CALIB_CB_NORMALIZE_IMAGE
         )
+        return cv2.findChessboardCorners(gray, self.chessboard_size[:2], flags)
 
-        if ret:
-            # 精细化角点位置
-            corners_refined = cv2.cornerSubPix(
-                gray, corners, (11, 11), (-1, -1), self.criteria
-            )
-            return True, corners_refined
-        return False, None
+    def _find_corners(self, gray):
+        """粗检测角点，detect_scale小于1时在缩小的图像上检测后映射回原图坐标"""
+        scale = self.detect_scale
+        if scale >= 1:
+            return self._find_chessboard(gray)
+
+        small = self._pipeline.downscale(gray, scale)
+        ret, corners = self._find_chessboard(small)
+        if not ret:
+            return False, None
+        # 像素中心对齐的坐标映射，按实际缩放后的尺寸计算比例
+        factor = np.array(
+            [small.shape[1] / gray.shape[1], small.shape[0] / gray.shape[0]], np.float32
+        )
+        corners = (corners + 0.5) / factor - 0.5
+        return True, corners.astype(np.float32)
+
+    def draw_corners(self, frame, seq: Optional[int] = None):
+        """
+        在图像上绘制检测到的角点
 
-    def draw_corners(self, frame):
-        """在图像上绘制检测到的角点"""
-        ret, corners = self.detect_chessboard(frame)
+        传入帧序号时只绘制缓存的检测结果，不再重新检测
+        """
+        if seq is None:
+            ret, corners, ids = self.detect(frame)
+        else:
+            detection = self.get_detection(seq)
+            ret = detection is not None and detection.found
+            corners = detection.corners if ret else None
+            ids = detection.ids if ret else None
         if ret:
-            cv2.drawChessboardCorners(frame, self.chessboard_size[:2], corners, ret)
+            detector = self.get_target_detector()
+            if detector is None:
+                cv2.drawChessboardCorners(frame, self.chessboard_size[:2], corners, ret)
+            else:
+                detector.draw(frame, corners, ids)
 
             # 添加检测提示
             cv2.putText(
@@ -153,69 +591,77 @@ class CameraCalibrator:
         self.reset()
         self.stop_calibration = False
 
-        print(f"开始自动标定，棋盘格尺寸: {self.chessboard_size[:2]}")
+        print(f"开始自动标定，标定板: {self.target.kind} {self.chessboard_size[:2]}")
         print(f"目标采集 {min_images}-{max_images} 张有效图片")
+        self.min_images = min_images
 
         collected = 0
-        last_capture_time = 0
-        capture_interval = 1.0  # 采集间隔（秒）
-
-        # 准备3D世界坐标点
-        objp = np.zeros(
-            (self.chessboard_size[0] * self.chessboard_size[1], 3), np.float32
-        )
-        objp[:, :2] = np.mgrid[
-            0 : self.chessboard_size[0], 0 : self.chessboard_size[1]
-        ].T.reshape(-1, 2)
-        objp = objp * self.chessboard_size[2]
+        self.view_selector = None
 
+        detections = self._iter_detections(camera, progress_callback)
         while not self.stop_calibration and collected < max_images:
-            # 读取摄像头帧
-            ret, frame = camera.read()
-            if not ret:
-                progress_callback(0, "摄像头读取失败")
-                time.sleep(0.1)
-                continue
+            detection = next(detections, None)
+            if detection is None:
+                break
+            ret, corners, ids = detection.found, detection.corners, detection.ids
 
-            # 保存图像尺寸
-            if self.image_size is None:
-                self.image_size = (frame.shape[1], frame.shape[0])
-                print(f"图像尺寸: {self.image_size}")
+            if self.view_selector is None:
+                self.view_selector = ViewSelector(self.image_size, self.chessboard_size)
+                if self.recorder is not None:
+                    self.recorder.start(self.chessboard_size, self.image_size, self.target)
+            selector = self.view_selector
 
-            # 检测棋盘格
-            ret, corners = self.detect_chessboard(frame)
+            if ret:
+                # 按覆盖率和姿态多样性评估，只采用能带来新信息的稳定视图
+                score = selector.evaluate(corners, ids)
+                if score.accepted:
+                    # 保存角点，完整的标定板共享模板中的3D坐标点
+                    self.object_points.append(self.get_object_points(ids))
+                    self.image_points.append(corners)
+                    self.point_ids.append(ids)
+                    selector.accept(corners, score, ids)
+                    collected += 1
+                    self.collected_images = collected
+                    if self.recorder is not None:
+                        timestamp = None
+                        if hasattr(camera, "timestamp"):
+                            timestamp = camera.timestamp(detection.seq)
+                        self.recorder.add_view(
+                            detection.seq, corners, detection.frame, timestamp, ids
+                        )
 
-            current_time = time.time()
+                    # 更新指令
+                    self.current_instruction = (
+                        f"已采集 {collected}/{max_images} 张图片。{self._get_angle_hint()}"
+                    )
 
-            if ret and (current_time - last_capture_time) > capture_interval:
-                # 保存角点
-                self.object_points.append(objp)
-                self.image_points.append(corners)
-                collected += 1
-                self.collected_images = collected
-                last_capture_time = current_time
+                    # 更新进度
+                    progress = int(
+                        max(collected / max_images, selector.progress(min_images)) * 100
+                    )
+                    progress_callback(progress, self.current_instruction)
 
-                # 更新指令
-                angle_hint = self._get_angle_hint(collected)
-                self.current_instruction = (
-                    f"已采集 {collected}/{max_images} 张图片。{angle_hint}"
-                )
+                    print(
+                        f"采集第 {collected} 张图片成功，覆盖率 {selector.coverage:.0%}"
+                    )
+                    self._request_estimate()
 
-                # 更新进度
-                progress = int((collected / max_images) * 100)
-                progress_callback(progress, self.current_instruction)
-
-                print(f"采集第 {collected} 张图片成功")
-                time.sleep(0.5)  # 短暂暂停让用户调整位置
-            elif ret:
-                # 已检测到但时间间隔不够
-                remaining_time = capture_interval - (current_time - last_capture_time)
-                self.current_instruction = (
-                    f"保持姿势... {remaining_time:.1f}秒后采集下一张"
-                )
+                    # 覆盖率、倾斜和尺度都达标后提前结束
+                    if selector.targets_met(min_images):
+                        print("覆盖率和姿态已达标，提前结束采集")
+                        break
+                else:
+                    self.current_instruction = f"{score.reason}，{self._get_angle_hint()}"
             else:
-                # 未检测到棋盘格
-                self.current_instruction = "请将棋盘格完整放入视野中，并确保光线充足"
+                # 未检测到标定板，可以部分可见的标定板不要求完整放入视野
+                detector = self.get_target_detector()
+                if detector is not None and detector.partial:
+                    self.current_instruction = "请将标定板放入视野中，并确保光线充足"
+                elif self.get_max_sharpness() > 0:
+                    # 模糊的帧也按未检测到处理
+                    self.current_instruction = "请将标定板完整放入视野中，保持稳定并确保光线充足"
+                else:
+                    self.current_instruction = "请将标定板完整放入视野中，并确保光线充足"
 
             # 显示进度
             if collected >= min_images:
@@ -223,14 +669,20 @@ class CameraCalibrator:
                     f" ({collected}/{max_images})，按停止键可提前完成"
                 )
 
-            time.sleep(0.033)  # 约30fps
-
             # 检查是否达到最小采集数量
             if collected >= min_images and self.stop_calibration:
                 break
 
         # 如果用户提前停止，使用已采集的图片
-        final_images = collected
+        try:
+            return self._calibrate_collected(progress_callback, min_images)
+        finally:
+            if self.recorder is not None:
+                self.recorder.finish(self.calibration_results)
+
+    def _calibrate_collected(self, progress_callback: Callable, min_images: int):
+        """用已采集的角点计算标定参数"""
+        final_images = len(self.image_points)
         if final_images < min_images:
             progress_callback(
                 0,
@@ -245,28 +697,50 @@ class CameraCalibrator:
             100, f"图片采集完成，共 {final_images} 张，正在计算标定参数..."
         )
 
-        # 进行相机标定
+        # 进行相机标定，有采集过程中的估计时以它为初值，只需少量迭代
         try:
-            ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
-                self.object_points, self.image_points, self.image_size, None, None
-            )
+            camera_matrix, dist_coeffs, flags = self._estimate_guess()
+            rejected = 0
+            # 最多剔除3轮，最后一次求解的结果总是对应剔除后的视图集合
+            solves = 4
+            for attempt in range(solves):
+                with stage_timer("solve"):
+                    ret, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
+                        self.object_points,
+                        self.image_points,
+                        self.image_size,
+                        camera_matrix,
+                        dist_coeffs,
+                        flags=flags,
+                    )
 
-            # 计算重投影误差
-            mean_error = 0
-            for i in range(len(self.object_points)):
-                imgpoints2, _ = cv2.projectPoints(
-                    self.object_points[i],
-                    rvecs[i],
-                    tvecs[i],
+                # 批量计算逐点、逐视图的重投影误差
+                errors = compute_reprojection_errors(
+                    self.object_points,
+                    self.image_points,
+                    rvecs,
+                    tvecs,
                     camera_matrix,
                     dist_coeffs,
                 )
-                error = cv2.norm(self.image_points[i], imgpoints2, cv2.NORM_L2) / len(
-                    imgpoints2
-                )
-                mean_error += error
+                if attempt == solves - 1:
+                    break
+                outliers = self._find_outlier_views(errors.per_view)
+                if not outliers or len(self.image_points) - len(outliers) < min_images:
+                    break
+
+                # 剔除离群视图后以当前结果为初值重新求解
+                print(f"剔除 {len(outliers)} 个离群视图: {outliers}")
+                for i in reversed(outliers):
+                    del self.object_points[i]
+                    del self.image_points[i]
+                    del self.point_ids[i]
+                rejected += len(outliers)
+                flags |= cv2.CALIB_USE_INTRINSIC_GUESS
 
-            mean_error /= len(self.object_points)
+            final_images = len(self.image_points)
+            self.collected_images = final_images
+            mean_error = errors.rms
 
             fov = self._calculate_fov_from_intrinsics(camera_matrix)
             # 保存结果
@@ -280,6 +754,9 @@ class CameraCalibrator:
                 chessboard_size=self.chessboard_size,
                 image_size=self.image_size,
                 fov=fov,
+                per_view_errors=errors.per_view.tolist(),
+                rejected_views=rejected,
+                target=self.target.kind,
             )
 
             print(f"标定完成！重投影误差: {mean_error:.6f}")
@@ -295,6 +772,356 @@ class CameraCalibrator:
             progress_callback(0, f"标定计算失败: {str(e)}")
             raise
 
+    def _find_outlier_views(self, per_view: np.ndarray) -> List[int]:
+        """返回RMS明显偏大的视图下标，未开启离群剔除时返回空列表"""
+        if not self.reject_outliers or len(per_view) == 0:
+            return []
+        threshold = max(self.outlier_threshold, self.outlier_factor * float(np.median(per_view)))
+        return [int(i) for i in np.flatnonzero(per_view > threshold)]
+
+    def _estimate_guess(self):
+        """返回(相机矩阵, 畸变系数, 标志)，作为calibrateCamera的热启动初值"""
+        with self._estimate_lock:
+            estimate = self.running_estimate
+        if estimate is None:
+            return None, None, 0
+        return (
+            estimate["camera_matrix"].copy(),
+            estimate["dist_coeffs"].copy(),
+            cv2.CALIB_USE_INTRINSIC_GUESS,
+        )
+
+    def _request_estimate(self):
+        """视图数每增加estimate_every个，在后台线程中求解一次当前的内参估计"""
+        views = len(self.image_points)
+        if not self.estimate_every or views < max(self.estimate_every, 3):
+            return
+        with self._estimate_lock:
+            if views - self._estimate_views < self.estimate_every:
+                return
+            # 上一次求解还没结束时跳过，下一个视图到来时会再次触发
+            if self._estimate_thread is not None and self._estimate_thread.is_alive():
+                return
+            self._estimate_views = views
+            self._estimate_thread = threading.Thread(
+                target=self._run_estimate,
+                args=(
+                    self._generation,
+                    list(self.object_points),
+                    list(self.image_points),
+                    self.image_size,
+                ),
+                daemon=True,
+            )
+            self._estimate_thread.start()
+
+    def _run_estimate(self, generation: int, object_points, image_points, image_size):
+        camera_matrix, dist_coeffs, flags = self._estimate_guess()
+        start = time.perf_counter()
+        try:
+            rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(
+                object_points, image_points, image_size, camera_matrix, dist_coeffs, flags=flags
+            )
+        except cv2.error as e:
+            print(f"中间估计求解失败: {e}")
+            return
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage="estimate")
+        with self._estimate_lock:
+            if generation != self._generation:
+                return
+            self.running_estimate = {
+                "camera_matrix": camera_matrix,
+                "dist_coeffs": dist_coeffs,
+                "reprojection_error": float(rms),
+                "views": len(image_points),
+                "solve_time": time.perf_counter() - start,
+            }
+        if self.estimate_callback is not None:
+            self.estimate_callback()
+
+    def get_running_estimate(self) -> Optional[Dict[str, Any]]:
+        """采集过程中最新的内参估计（可直接序列化为JSON）"""
+        with self._estimate_lock:
+            estimate = self.running_estimate
+        if estimate is None:
+            return None
+        return {
+            "camera_matrix": estimate["camera_matrix"].tolist(),
+            "dist_coeffs": estimate["dist_coeffs"].flatten().tolist(),
+            "reprojection_error": estimate["reprojection_error"],
+            "views": estimate["views"],
+            "solve_time": round(estimate["solve_time"], 4),
+        }
+
+    def calibrate_from_source(
+        self,
+        source: Any,
+        progress_callback: Optional[Callable] = None,
+        max_images: Optional[int] = None,
+        min_images: int = 15,
+        frame_step: int = 1,
+        min_corner_motion: float = 10.0,
+        select_views: bool = False,
+    ):
+        """
+        离线标定：从图片目录、通配符或视频文件中读取帧并标定
+
+        Args:
+            source: 路径、通配符或它们的列表，见sources.iter_source_frames
+            progress_callback: 进度回调函数，默认只打印
+            max_images: 最多使用的视图数，None表示不限制
+            min_images: 最小视图数
+            frame_step: 视频每隔多少帧取一帧
+            min_corner_motion: 与上一个采用的视图相比角点平均移动小于该像素数时视为重复视图
+            select_views: 按覆盖率和姿态多样性筛选视图，覆盖率和姿态达标后提前结束
+        """
+        if progress_callback is None:
+            progress_callback = lambda p, m: print(m)
+
+        self.reset()
+        self.min_images = min_images
+        names = deque()
+
+        def frames():
+            for name, frame in iter_source_frames(source, frame_step=frame_step):
+                size = (frame.shape[1], frame.shape[0])
+                if self.image_size is None:
+                    self.image_size = size
+                    print(f"图像尺寸: {self.image_size}")
+                elif size != self.image_size:
+                    print(f"跳过尺寸不一致的图像 {name}: {size}")
+                    continue
+                names.append(name)
+                yield frame
+
+        if self.backend is not None:
+            results = self.backend.map(frames(), self.get_detect_config())
+        else:
+            results = (self.detect(frame) for frame in frames())
+
+        processed = 0
+        last_corners = None
+        for ret, corners, ids in results:
+            name = names.popleft()
+            processed += 1
+            if not ret:
+                continue
+            # 与上一个采用的视图几乎相同（例如视频中静止的片段）时跳过
+            if last_corners is not None and last_corners.shape == corners.shape:
+                motion = np.linalg.norm(
+                    corners.reshape(-1, 2) - last_corners.reshape(-1, 2), axis=1
+                ).mean()
+                if motion < min_corner_motion:
+                    continue
+            if select_views:
+                if self.view_selector is None:
+                    self.view_selector = ViewSelector(
+                        self.image_size, self.chessboard_size, max_motion=None
+                    )
+                score = self.view_selector.evaluate(corners, ids)
+                if not score.accepted:
+                    continue
+                self.view_selector.accept(corners, score, ids)
+            last_corners = corners
+            self.object_points.append(self.get_object_points(ids))
+            self.image_points.append(corners)
+            self.point_ids.append(ids)
+            self.collected_images = len(self.image_points)
+            if self.collected_images % 10 == 0:
+                progress_callback(
+                    0, f"已处理 {processed} 帧，采用 {self.collected_images} 张 ({name})"
+                )
+            if max_images is not None and self.collected_images >= max_images:
+                break
+            if select_views and self.view_selector.targets_met(min_images):
+                print("覆盖率和姿态已达标，提前结束")
+                break
+
+        print(f"共处理 {processed} 帧，采用 {self.collected_images} 张")
+        return self._calibrate_collected(progress_callback, min_images)
+
+    def calibrate_from_recording(
+        self,
+        path: Any,
+        progress_callback: Optional[Callable] = None,
+        min_images: int = 15,
+        redetect: bool = False,
+    ):
+        """
+        回放录制文件并重新求解，不经过摄像头，也不做实时采集的节奏控制
+
+        Args:
+            path: SessionRecorder写入的录制文件
+            progress_callback: 进度回调函数，默认只打印
+            min_images: 最小视图数
+            redetect: 录制文件包含原图时，用当前的检测配置重新检测角点
+        """
+        if progress_callback is None:
+            progress_callback = lambda p, m: print(m)
+
+        recording = read_recording(path)
+        self.reset()
+        self.set_chessboard_size(*recording.meta["chessboard_size"])
+        self.set_target(TargetSpec.from_dict(recording.meta.get("target")))
+        self.image_size = tuple(recording.meta["image_size"])
+
+        if redetect:
+            if not recording.has_frames:
+                raise ValueError("录制文件中没有原图，无法重新检测")
+            frames = (view.decode_frame() for view in recording.views if view.png is not None)
+            if self.backend is not None:
+                results = self.backend.map(frames, self.get_detect_config())
+            else:
+                results = (self.detect(frame) for frame in frames)
+            views = [(corners, ids) for ret, corners, ids in results if ret]
+        else:
+            views = [(view.corners, view.ids) for view in recording.views]
+
+        for corners, ids in views:
+            self.object_points.append(self.get_object_points(ids))
+            self.image_points.append(corners)
+            self.point_ids.append(ids)
+        self.collected_images = len(self.image_points)
+        print(f"回放 {len(recording.views)} 个视图，使用 {self.collected_images} 个")
+        return self._calibrate_collected(progress_callback, min_images)
+
+    def calibrate_from_dataset(
+        self,
+        dataset: Any,
+        camera_id: Optional[str] = None,
+        progress_callback: Optional[Callable] = None,
+        min_images: int = 15,
+        views: Optional[Sequence[int]] = None,
+    ):
+        """
+        从列式角点数据集（见corner_dataset.py）标定某个摄像头
+
+        角点直接取内存映射数组的切片，不为每个视图复制数据
+
+        Args:
+            dataset: CornerDataset或数据集目录
+            camera_id: 要标定的摄像头，数据集只有一个摄像头时可省略
+            views: 只使用这些视图下标，None表示该摄像头的全部视图
+        """
+        if progress_callback is None:
+            progress_callback = lambda p, m: print(m)
+        if not isinstance(dataset, CornerDataset):
+            dataset = CornerDataset(dataset)
+        if camera_id is None:
+            if len(dataset.cameras) != 1:
+                raise ValueError(f"数据集包含多个摄像头，请指定其中一个: {dataset.cameras}")
+            camera_id = dataset.cameras[0]
+
+        self.reset()
+        self.set_chessboard_size(*dataset.chessboard_size)
+        self.set_target(dataset.target)
+        self.image_size = dataset.image_size(camera_id)
+        if views is None:
+            views = dataset.views_for(camera_id)
+        for view in views:
+            self.object_points.append(dataset.object_points(view))
+            self.image_points.append(dataset.image_points(view))
+            self.point_ids.append(dataset.view_point_ids(view))
+        self.collected_images = len(self.image_points)
+        print(f"摄像头 {camera_id}: 从数据集中读取 {self.collected_images} 个视图")
+        return self._calibrate_collected(progress_callback, min_images)
+
+    def save_dataset(self, path: Any, camera_id: str = ""):
+        """把已采集的视图保存为列式角点数据集"""
+        if self.image_size is None:
+            raise ValueError("还没有采集到视图")
+        with CornerDatasetWriter(path, self.chessboard_size, self.target) as writer:
+            writer.add_camera(camera_id, self.image_size)
+            for corners, ids in zip(self.image_points, self.point_ids):
+                writer.add_view(corners, camera_id, ids)
+
+    def _iter_detections(self, camera, progress_callback: Callable):
+        """
+        逐帧读取并检测，按帧顺序产出Detection并发布给预览叠加
+
+        配置了检测后端时同时有多帧在途并行检测，否则在当前线程中逐帧检测
+        """
+        seq = 0
+        pending = deque()
+        max_in_flight = self.backend.max_in_flight if self.backend is not None else 1
+        config = self.get_detect_config()
+        # 录制原图时复制一份，环形缓冲区中的帧在视图被采用前可能已被覆盖
+        keep_frames = self.recorder is not None and self.recorder.save_frames
+        while not self.stop_calibration:
+            while len(pending) < max_in_flight:
+                # 先取得检测配额再取帧：取到的帧只是环形缓冲区槽位的视图，
+                # 等待配额期间槽位可能已被采集线程覆盖
+                start = time.perf_counter()
+                if self.cpu_share is not None:
+                    self.cpu_share.acquire()
+                last_seq = seq
+                ret, seq, frame = self._read_frame(camera, seq)
+                if not ret:
+                    if self.cpu_share is not None:
+                        self.cpu_share.release()
+                    progress_callback(0, "摄像头读取失败")
+                    time.sleep(0.1)
+                    break
+                if last_seq and seq - last_seq > 1:
+                    # 检测跟不上采集时跳过的帧
+                    DETECT_SKIPPED_FRAMES.inc(seq - last_seq - 1)
+
+                # 保存图像尺寸
+                if self.image_size is None:
+                    self.image_size = (frame.shape[1], frame.shape[0])
+                    print(f"图像尺寸: {self.image_size}")
+
+                kept = frame.copy() if keep_frames else None
+                if self.backend is not None:
+                    # 结果为(检测结果, (检测结论, 清晰度))
+                    try:
+                        future = self.backend.submit(frame, config)
+                    except BaseException:
+                        # 提交失败时归还配额，否则其他摄像头会一直等待
+                        if self.cpu_share is not None:
+                            self.cpu_share.release()
+                        raise
+                    if self.cpu_share is not None:
+                        future.add_done_callback(lambda _: self.cpu_share.release())
+                    pending.append((seq, start, future, kept))
+                else:
+                    future = Future()
+                    try:
+                        future.set_result((self.detect(frame), None))
+                    finally:
+                        if self.cpu_share is not None:
+                            self.cpu_share.release()
+                    pending.append((seq, start, future, kept))
+
+            self.in_flight = len(pending)
+            if not pending:
+                continue
+            done_seq, start, future, kept = pending.popleft()
+            (ret, corners, ids), info = future.result()
+            if info is not None:
+                # 工作者中的检测器在所有摄像头之间共用，计数和清晰度记在当前摄像头的标定器上
+                outcome, sharpness = info
+                if outcome == "blurry":
+                    self.blurry_frames += 1
+                if sharpness is not None:
+                    self.last_sharpness = sharpness
+            # 从提交到取得结果的总耗时，包含排队等待配额和工作进程的时间
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="detect")
+            # 检测结果发布给预览叠加复用
+            self.publish_detection(done_seq, ret, corners, ids)
+            if self.detection_callback is not None:
+                self.detection_callback()
+            yield Detection(done_seq, ret, corners, ids, kept)
+
+    @staticmethod
+    def _read_frame(camera, last_seq: int) -> Tuple[bool, int, Any]:
+        """读取下一帧并返回(成功, 帧序号, 帧)，共享采集线程直接提供序号"""
+        if hasattr(camera, "wait_frame"):
+            seq, frame = camera.wait_frame(last_seq)
+            return frame is not None, seq, frame
+        ret, frame = camera.read()
+        return ret, last_seq + 1, frame
+
     def _calculate_fov_from_intrinsics(self, K):
         """
         根据相机内参矩阵计算FOV
@@ -323,22 +1150,14 @@ class CameraCalibrator:
 
         return fov_horizontal_deg, fov_vertical_deg
 
-    def _get_angle_hint(self, image_count: int) -> str:
-        """根据采集的图片数量返回角度提示"""
-        hints = [
-            "正面放置棋盘格",
-            "将棋盘格向左倾斜",
-            "将棋盘格向右倾斜",
-            "将棋盘格向上倾斜",
-            "将棋盘格向下倾斜",
-            "靠近摄像头",
-            "远离摄像头",
-            "旋转棋盘格",
-            "改变棋盘格角度",
-            "尝试不同距离",
-        ]
-
-        if image_count <= len(hints):
-            return hints[image_count - 1]
-        else:
-            return f"继续采集不同角度（第{image_count}张）"
+    def _get_angle_hint(self) -> str:
+        """根据覆盖率和已采集视图的姿态返回操作提示"""
+        if self.view_selector is None:
+            return "正面放置棋盘格"
+        return self.view_selector.hint()
+
+    def get_coverage_stats(self, min_views: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """覆盖率网格和姿态多样性统计，min_views默认为当前标定的最小视图数"""
+        if self.view_selector is None:
+            return None
+        return self.view_selector.get_stats(min_views or self.min_images)
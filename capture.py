@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import CAPTURE_FAILURES, STAGE_SECONDS
+
+
+class FrameRing:
+    """
+    固定大小的帧环形缓冲区
+
+    每个槽位是预分配的帧数组，写入方按递增的序号轮流覆盖槽位，
+    读取方拿到的是槽位本身的引用（不复制）。一帧在被覆盖前至少保留
+    size - 1 个帧周期，需要更长时间持有帧或要修改帧的读取方应自行复制。
+    """
+
+    def __init__(self, size: int = 4):
+        if size < 2:
+            raise ValueError("环形缓冲区至少需要2个槽位")
+        self.size = size
+        self._slots: List[Optional[np.ndarray]] = [None] * size
+        self._timestamps = [0.0] * size
+        self._seq = 0  # 最新一帧的序号，0表示还没有帧
+        self._cond = threading.Condition()
+
+    @property
+    def seq(self) -> int:
+        """最新一帧的序号"""
+        return self._seq
+
+    def next_slot(self) -> Optional[np.ndarray]:
+        """返回下一次写入使用的槽位数组（尚未分配时为None）"""
+        return self._slots[(self._seq + 1) % self.size]
+
+    def publish(self, frame: np.ndarray, timestamp: Optional[float] = None) -> int:
+        """发布写入next_slot()槽位的新帧，返回它的序号"""
+        with self._cond:
+            seq = self._seq + 1
+            index = seq % self.size
+            self._slots[index] = frame
+            self._timestamps[index] = time.time() if timestamp is None else timestamp
+            self._seq = seq
+            self._cond.notify_all()
+        return seq
+
+    def latest(self) -> Tuple[int, Optional[np.ndarray]]:
+        """返回最新的(序号, 帧)，不等待"""
+        with self._cond:
+            if self._seq == 0:
+                return 0, None
+            return self._seq, self._slots[self._seq % self.size]
+
+    def timestamp(self, seq: int) -> Optional[float]:
+        """返回序号对应帧的采集时间，帧已被覆盖时返回None"""
+        with self._cond:
+            if seq <= 0 or self._seq - seq >= self.size:
+                return None
+            return self._timestamps[seq % self.size]
+
+    def nearest(self, timestamp: float) -> Tuple[int, Optional[np.ndarray], float]:
+        """
+        返回采集时间最接近timestamp的(序号, 帧, 采集时间)，用于多摄像头按时间对齐
+
+        只在保证未被覆盖的最近size - 1帧中查找，没有帧时返回(0, None, 0.0)
+        """
+        with self._cond:
+            best = (0, None, 0.0)
+            for seq in range(max(self._seq - self.size + 2, 1), self._seq + 1):
+                index = seq % self.size
+                stamp = self._timestamps[index]
+                if best[1] is None or abs(stamp - timestamp) < abs(best[2] - timestamp):
+                    best = (seq, self._slots[index], stamp)
+            return best
+
+    def wait(
+        self, after_seq: int, timeout: Optional[float] = None
+    ) -> Tuple[int, Optional[np.ndarray]]:
+        """等待序号大于after_seq的帧，超时返回(最新序号, None)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > after_seq, timeout):
+                return self._seq, None
+            return self._seq, self._slots[self._seq % self.size]
+
+    def notify_all(self):
+        """唤醒所有等待中的读取方"""
+        with self._cond:
+            self._cond.notify_all()
+
+
+class CameraCapture:
+    """
+    单个摄像头的共享采集线程
+
+    只有采集线程调用底层设备的read()，帧写入FrameRing，
+    视频流、标定、快照等所有消费者都从环形缓冲区读取最新帧。
+    对外提供与cv2.VideoCapture兼容的read()/isOpened()/release()，
+    可以直接传给CameraCalibrator.auto_calibrate。
+    """
+
+    def __init__(self, device: Any, ring_size: int = 4, read_timeout: float = 2.0):
+        self.device = device
+        self.ring = FrameRing(ring_size)
+        self.read_timeout = read_timeout
+        self.failed_reads = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动采集线程"""
+        if self._running:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def _capture_loop(self):
+        while self._running:
+            slot = self.ring.next_slot()
+            start = time.perf_counter()
+            # 槽位已分配时让设备直接解码到槽位中，避免每帧分配新数组
+            success, frame = self.device.read(slot) if slot is not None else self.device.read()
+            if not success or frame is None:
+                self.failed_reads += 1
+                CAPTURE_FAILURES.inc()
+                time.sleep(0.01)
+                continue
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="capture")
+            self.ring.publish(frame)
+
+    @property
+    def seq(self) -> int:
+        """最新一帧的序号"""
+        return self.ring.seq
+
+    def latest(self) -> Tuple[int, Optional[np.ndarray]]:
+        """返回最新的(序号, 帧)，不等待"""
+        return self.ring.latest()
+
+    def wait_frame(
+        self, after_seq: int, timeout: Optional[float] = None
+    ) -> Tuple[int, Optional[np.ndarray]]:
+        """等待比after_seq更新的帧"""
+        if timeout is None:
+            timeout = self.read_timeout
+        return self.ring.wait(after_seq, timeout)
+
+    def timestamp(self, seq: int) -> Optional[float]:
+        """序号对应帧的采集时间"""
+        return self.ring.timestamp(seq)
+
+    def nearest(self, timestamp: float) -> Tuple[int, Optional[np.ndarray], float]:
+        """采集时间最接近timestamp的(序号, 帧, 采集时间)"""
+        return self.ring.nearest(timestamp)
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        与cv2.VideoCapture.read()兼容：等待下一帧并返回它
+
+        返回的是环形缓冲区中的帧引用，传入image时会复制到image中
+        """
+        _, frame = self.ring.wait(self.ring.seq, self.read_timeout)
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self._running and self.device.isOpened()
+
+    def set(self, prop_id: int, value: Any) -> bool:
+        return self.device.set(prop_id, value)
+
+    def get(self, prop_id: int) -> Any:
+        return self.device.get(prop_id)
+
+    def release(self):
+        """停止采集线程并释放设备"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.ring.notify_all()
+        self.device.release()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from result_store import atomic_write
+from targets import TargetSpec, object_template
+
+CORNERS_FILE = "corners.f32"  # (总角点数, 2) float32，所有视图连续存放
+POINT_IDS_FILE = "point_ids.i32"  # (总角点数,) int32，角点在棋盘格模板中的编号
+OFFSETS_FILE = "view_offsets.npy"  # (视图数 + 1,) int64，第i个视图为[offsets[i], offsets[i+1])
+CAMERAS_FILE = "view_cameras.npy"  # (视图数,) int32，视图所属摄像头在meta["cameras"]中的下标
+META_FILE = "meta.json"
+
+
+def board_template(chessboard_size: Sequence[Any], kind: str = "chessboard") -> np.ndarray:
+    """标定板角点的3D坐标模板，与CameraCalibrator.get_object_points()一致"""
+    return object_template(chessboard_size, kind)
+
+
+class CornerDatasetWriter:
+    """
+    按视图追加写入列式角点数据集
+
+    角点和编号以原始二进制追加到文件末尾，不在内存中累积；视图偏移、
+    所属摄像头和描述文件在close()时写入，描述文件最后原子写入，
+    写到一半中断的数据集不会被当成有效数据集加载
+    """
+
+    def __init__(
+        self, path: Any, chessboard_size: Sequence[Any], target: Optional[TargetSpec] = None
+    ):
+        self.path = Path(path)
+        self.path.mkdir(exist_ok=True, parents=True)
+        self.chessboard_size = list(chessboard_size)
+        self.target = target or TargetSpec()
+        self.board_points = int(chessboard_size[0] * chessboard_size[1])
+        self._corners = open(self.path.joinpath(CORNERS_FILE), "wb")
+        self._point_ids = open(self.path.joinpath(POINT_IDS_FILE), "wb")
+        self._offsets: List[int] = [0]
+        self._view_cameras: List[int] = []
+        self._cameras: List[Dict[str, Any]] = []
+        self._camera_index: Dict[str, int] = {}
+        self._full_boards = True
+
+    def add_camera(self, camera_id: str, image_size: Sequence[int]) -> int:
+        """登记摄像头及其图像尺寸，返回下标"""
+        if camera_id not in self._camera_index:
+            self._camera_index[camera_id] = len(self._cameras)
+            self._cameras.append({"id": camera_id, "image_size": list(image_size)})
+        return self._camera_index[camera_id]
+
+    def add_view(
+        self, corners: np.ndarray, camera_id: str = "", point_ids: Optional[np.ndarray] = None
+    ):
+        """追加一个视图；point_ids为None表示完整的标定板（按模板顺序）"""
+        if camera_id not in self._camera_index:
+            raise KeyError(f"未登记的摄像头: {camera_id}")
+        points = np.ascontiguousarray(corners, np.float32).reshape(-1, 2)
+        if point_ids is None:
+            if len(points) != self.board_points:
+                raise ValueError(f"完整棋盘格应有 {self.board_points} 个角点，实际 {len(points)} 个")
+            ids = np.arange(len(points), dtype=np.int32)
+        else:
+            ids = np.ascontiguousarray(point_ids, np.int32).ravel()
+            if len(ids) != len(points):
+                raise ValueError("角点编号与角点数量不一致")
+            self._full_boards = self._full_boards and np.array_equal(
+                ids, np.arange(self.board_points)
+            )
+        self._corners.write(points.tobytes())
+        self._point_ids.write(ids.tobytes())
+        self._offsets.append(self._offsets[-1] + len(points))
+        self._view_cameras.append(self._camera_index[camera_id])
+
+    def close(self):
+        self._corners.close()
+        self._point_ids.close()
+        atomic_write(
+            self.path.joinpath(OFFSETS_FILE),
+            lambda f: np.save(f, np.array(self._offsets, np.int64)),
+            "wb",
+        )
+        atomic_write(
+            self.path.joinpath(CAMERAS_FILE),
+            lambda f: np.save(f, np.array(self._view_cameras, np.int32)),
+            "wb",
+        )
+        meta = {
+            "chessboard_size": self.chessboard_size,
+            "target": self.target.to_dict(),
+            "cameras": self._cameras,
+            "views": len(self._view_cameras),
+            "points": self._offsets[-1],
+            "full_boards": self._full_boards,
+        }
+        atomic_write(self.path.joinpath(META_FILE), lambda f: json.dump(meta, f, indent=2))
+
+    def __enter__(self) -> "CornerDatasetWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CornerDataset:
+    """
+    内存映射加载的列式角点数据集
+
+    所有视图的角点在一个连续的float32数组中，image_points(i)返回其中的切片
+    （不复制），数据集再大，常驻内存也只有实际访问到的页
+    """
+
+    def __init__(self, path: Any):
+        self.path = Path(path)
+        with open(self.path.joinpath(META_FILE), "r") as f:
+            self.meta = json.load(f)
+        points = int(self.meta["points"])
+        if points:
+            # 以描述文件中的数量为准，忽略中断的写入追加在文件末尾的数据
+            self.corners = np.memmap(
+                self.path.joinpath(CORNERS_FILE), np.float32, "r", shape=(points, 2)
+            )
+            self.point_ids = np.memmap(
+                self.path.joinpath(POINT_IDS_FILE), np.int32, "r", shape=(points,)
+            )
+        else:
+            # 没有视图时数据文件为空，不能内存映射
+            self.corners = np.empty((0, 2), np.float32)
+            self.point_ids = np.empty((0,), np.int32)
+        self.offsets = np.load(self.path.joinpath(OFFSETS_FILE), mmap_mode="r")
+        self.view_cameras = np.load(self.path.joinpath(CAMERAS_FILE), mmap_mode="r")
+        self.chessboard_size = tuple(self.meta["chessboard_size"])
+        # 没有记录标定板类型的旧数据集都是棋盘格
+        self.target = TargetSpec.from_dict(self.meta.get("target"))
+        self.template = board_template(self.chessboard_size, self.target.kind)
+
+    @staticmethod
+    def exists(path: Any) -> bool:
+        return Path(path).joinpath(META_FILE).exists()
+
+    def __len__(self) -> int:
+        return int(self.meta["views"])
+
+    @property
+    def cameras(self) -> List[str]:
+        return [camera["id"] for camera in self.meta["cameras"]]
+
+    def image_size(self, camera_id: str) -> Tuple[int, int]:
+        for camera in self.meta["cameras"]:
+            if camera["id"] == camera_id:
+                return tuple(camera["image_size"])
+        raise KeyError(f"数据集中没有摄像头: {camera_id}")
+
+    def views_for(self, camera_id: str) -> np.ndarray:
+        """某个摄像头的视图下标"""
+        return np.flatnonzero(self.view_cameras == self.cameras.index(camera_id))
+
+    def image_points(self, view: int) -> np.ndarray:
+        """第view个视图的角点 (N, 1, 2)，内存映射数组的切片"""
+        start, end = self.offsets[view], self.offsets[view + 1]
+        return self.corners[start:end].reshape(-1, 1, 2)
+
+    def object_points(self, view: int) -> np.ndarray:
+        """第view个视图的3D角点，完整棋盘格时所有视图共用同一个模板"""
+        if self.meta["full_boards"]:
+            return self.template
+        start, end = self.offsets[view], self.offsets[view + 1]
+        return self.template[self.point_ids[start:end]]
+
+    def view_point_ids(self, view: int) -> Optional[np.ndarray]:
+        """第view个视图的角点编号，完整标定板时返回None"""
+        if self.meta["full_boards"]:
+            return None
+        start, end = self.offsets[view], self.offsets[view + 1]
+        return np.asarray(self.point_ids[start:end])
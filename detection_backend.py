@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from calibration import CameraCalibrator
+from metrics import DETECTIONS, TARGET_DETECT_SECONDS
+from targets import TargetSpec
+
+# (棋盘格尺寸, 粗检测缩放比例, 标定板类型, 检测引擎, 模糊阈值)，
+# 即CameraCalibrator.get_detect_config()的返回值
+DetectConfig = Tuple[Tuple[int, int, float], float, TargetSpec, str, float]
+# (是否检测到, 角点, 角点编号)，即CameraCalibrator.detect()的返回值
+DetectResult = Tuple[bool, Optional[np.ndarray], Optional[np.ndarray]]
+# (检测结论found/missed/blurry, 这一帧的清晰度或None)
+# 工作者中检测器的状态和指标主进程看不到，随检测结果一起返回
+DetectInfo = Tuple[str, Optional[float]]
+
+
+def _run_detector(
+    detector: CameraCalibrator, frame: np.ndarray
+) -> Tuple[DetectResult, DetectInfo]:
+    # 检测器按配置在多个摄像头之间复用，清晰度先清空，避免带出其他帧的值
+    detector.last_sharpness = None
+    result = detector.detect(frame)
+    return result, (detector.last_outcome, detector.last_sharpness)
+
+
+def _make_detector(config: DetectConfig) -> CameraCalibrator:
+    chessboard_size, detect_scale, target, engine, max_sharpness = config
+    detector = CameraCalibrator(
+        detect_scale=detect_scale, detect_engine=engine, max_sharpness=max_sharpness
+    )
+    detector.set_chessboard_size(*chessboard_size)
+    detector.set_target(target)
+    return detector
+
+
+class DetectionBackend:
+    """
+    检测后端基类
+
+    submit()把一帧交给工作者检测并返回Future，结果为((是否检测到, 角点, 角点编号),
+    (检测结论, 清晰度))；map()按输入顺序产出检测结果，同时在途的帧数不超过max_in_flight。
+    工作者之间不共享ROI跟踪状态，帧可能乱序完成。
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(int(workers), 1)
+        # 每个工作者留一帧余量，保证工作者不会空等
+        self.max_in_flight = 2 * self.workers
+
+    def submit(self, frame: np.ndarray, config: DetectConfig) -> Future:
+        raise NotImplementedError
+
+    def map(self, frames: Iterable[np.ndarray], config: DetectConfig) -> Iterator[DetectResult]:
+        """按顺序返回每一帧的检测结果"""
+        pending = deque()
+        for frame in frames:
+            pending.append(self.submit(frame, config))
+            if len(pending) >= self.max_in_flight:
+                yield pending.popleft().result()[0]
+        while pending:
+            yield pending.popleft().result()[0]
+
+    def close(self):
+        pass
+
+
+class _SlotPool:
+    """固定数量的帧缓冲槽，submit前占用、检测完成后归还，同时限制在途帧数"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for i in range(count):
+            self._free.put(i)
+
+    def acquire(self) -> int:
+        return self._free.get()
+
+    def release(self, index: int):
+        self._free.put(index)
+
+
+_thread_local = threading.local()
+
+
+def _thread_detect(frame: np.ndarray, config: DetectConfig) -> Tuple[DetectResult, DetectInfo]:
+    # 预处理流水线的缓冲区不能跨线程共享，每个线程持有自己的检测器
+    detectors: Dict[DetectConfig, CameraCalibrator] = getattr(_thread_local, "detectors", None)
+    if detectors is None:
+        detectors = _thread_local.detectors = {}
+    detector = detectors.get(config)
+    if detector is None:
+        detector = detectors[config] = _make_detector(config)
+    return _run_detector(detector, frame)
+
+
+class ThreadPoolBackend(DetectionBackend):
+    """线程池检测后端，OpenCV在检测时释放GIL，线程可以并行"""
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="detect")
+        self._slots = _SlotPool(self.max_in_flight)
+        self._buffers: list = [None] * self.max_in_flight
+
+    def submit(self, frame: np.ndarray, config: DetectConfig) -> Future:
+        index = self._slots.acquire()
+        # 复制到自己的缓冲区，避免采集环形缓冲区覆盖正在检测的帧
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = self._buffers[index] = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        future = self._executor.submit(_thread_detect, buffer, config)
+        future.add_done_callback(lambda _: self._slots.release(index))
+        return future
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+_process_detectors: Dict[DetectConfig, CameraCalibrator] = {}
+# 帧缓冲槽下标 -> 映射的共享内存
+_process_segments: Dict[int, shared_memory.SharedMemory] = {}
+
+
+def _attach_segment(index: int, name: str) -> shared_memory.SharedMemory:
+    segment = _process_segments.get(index)
+    if segment is None or segment.name != name:
+        # 主进程扩大槽位时换成了新的共享内存，关闭旧的映射，否则每次分辨率变化都会泄漏
+        if segment is not None:
+            segment.close()
+        # 共享内存由主进程创建和释放，子进程只负责映射
+        segment = shared_memory.SharedMemory(name=name)
+        _process_segments[index] = segment
+    return segment
+
+
+def _init_process_worker():
+    # 并行度由进程数提供，避免每个进程再开满OpenCV内部线程
+    cv2.setNumThreads(1)
+
+
+def _process_detect(
+    index: int, name: str, shape: Tuple[int, ...], dtype: str, config: DetectConfig
+) -> Tuple[DetectResult, DetectInfo, float]:
+    segment = _attach_segment(index, name)
+    frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+    detector = _process_detectors.get(config)
+    if detector is None:
+        detector = _process_detectors[config] = _make_detector(config)
+    start = time.perf_counter()
+    result, info = _run_detector(detector, frame)
+    # 子进程中的指标主进程看不到，检测结论和耗时随结果一起返回
+    return result, info, time.perf_counter() - start
+
+
+class ProcessPoolBackend(DetectionBackend):
+    """
+    多进程检测后端
+
+    帧通过共享内存传给子进程，只传递共享内存名称和形状，不序列化图像数据；
+    返回的角点数组很小，直接序列化。
+    """
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        # 工作进程要与主进程共用resource_tracker，否则子进程退出时会删除主进程的共享内存
+        resource_tracker.ensure_running()
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_process_worker)
+        # 在创建共享内存之前启动工作进程：fork出的子进程会继承主进程已有的映射，且不会被关闭
+        self._executor.submit(cv2.getNumThreads).result()
+        self._slots = _SlotPool(self.max_in_flight)
+        self._segments: list = [None] * self.max_in_flight
+
+    def _segment(self, index: int, nbytes: int) -> shared_memory.SharedMemory:
+        segment = self._segments[index]
+        if segment is None or segment.size < nbytes:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+            segment = self._segments[index] = shared_memory.SharedMemory(
+                create=True, size=nbytes
+            )
+        return segment
+
+    def submit(self, frame: np.ndarray, config: DetectConfig) -> Future:
+        index = self._slots.acquire()
+        segment = self._segment(index, frame.nbytes)
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=segment.buf)
+        np.copyto(view, frame)
+        del view
+        inner = self._executor.submit(
+            _process_detect, index, segment.name, frame.shape, frame.dtype.str, config
+        )
+        future = Future()
+
+        def done(inner: Future):
+            self._slots.release(index)
+            try:
+                result, info, seconds = inner.result()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            DETECTIONS.inc(result=info[0])
+            TARGET_DETECT_SECONDS.observe(
+                seconds, target=config[2].kind, result="found" if result[0] else "missed"
+            )
+            future.set_result((result, info))
+
+        inner.add_done_callback(done)
+        return future
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for segment in self._segments:
+            if segment is not None:
+                segment.close()
+                segment.unlink()
+        self._segments = [None] * self.max_in_flight
+
+
+def create_backend(kind: str, workers: int = 0) -> Optional[DetectionBackend]:
+    """
+    按名称创建检测后端
+
+    kind: serial（在标定线程中直接检测，返回None）、thread或process
+    workers: 工作者数量，0表示使用CPU核数
+    """
+    if kind == "serial":
+        return None
+    workers = workers or os.cpu_count() or 1
+    if kind == "thread":
+        return ThreadPoolBackend(workers)
+    if kind == "process":
+        return ProcessPoolBackend(workers)
+    raise ValueError(f"未知的检测后端: {kind}")
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 各阶段耗时的默认分桶（秒），覆盖0.1ms到约2s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {v:g}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    瞬时值
+
+    可以直接set()，也可以传入collect回调，在抓取时返回{标签值元组: 数值}
+    （适合队列深度、客户端数这类随时变化、由其他对象持有的值）
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, help, labels)
+        self.collect = collect
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def values(self) -> Dict[LabelValues, float]:
+        if self.collect is not None:
+            return dict(self.collect())
+        with self._lock:
+            return dict(self._values)
+
+    def _samples(self) -> List[str]:
+        items = sorted(self.values().items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {v:g}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """按固定分桶统计的耗时分布，同时记录总和与次数"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值元组 -> [各分桶计数(最后一个为+Inf), 总和]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """统计with块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """{标签值元组: (次数, 总耗时)}"""
+        with self._lock:
+            return {k: (sum(counts), total) for k, (counts, total) in self._series.items()}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _format_labels(self.labels, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total:g}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # 同名指标重复注册时返回已有的（如Gauge的collect回调被替换）
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if isinstance(metric, Gauge) and metric.collect is not None:
+                    existing.collect = metric.collect
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# 流水线各阶段耗时：capture, preprocess, find_corners, subpix, detect（含排队的单帧检测总耗时）,
+# overlay, resize, encode, solve, estimate
+STAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram("calib_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+)
+# 按标定板类型统计的单帧检测耗时（预处理到得到角点），用于比较不同标定板在同一套设备上的速度
+TARGET_DETECT_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "calib_target_detect_seconds",
+        "Per-frame detection time by calibration target",
+        ["target", "result"],
+    )
+)
+DETECTIONS: Counter = REGISTRY.register(
+    Counter("calib_detections_total", "Chessboard detection attempts by result", ["result"])
+)
+DETECT_SKIPPED_FRAMES: Counter = REGISTRY.register(
+    Counter(
+        "calib_detect_skipped_frames_total",
+        "Captured frames the calibration loop never looked at",
+    )
+)
+CAPTURE_FAILURES: Counter = REGISTRY.register(
+    Counter("calib_capture_failed_reads_total", "Failed camera reads")
+)
+
+
+def stage_timer(stage: str):
+    """统计某个阶段的耗时：with stage_timer("encode"): ..."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def target_latency_stats() -> Dict[str, Dict[str, float]]:
+    """各标定板类型的检测帧数、命中率和平均单帧耗时（毫秒）"""
+    stats: Dict[str, list] = {}
+    for (target, result), (count, total) in TARGET_DETECT_SECONDS.totals().items():
+        entry = stats.setdefault(target, [0, 0, 0.0])
+        entry[0] += count
+        entry[1] += count if result == "found" else 0
+        entry[2] += total
+    return {
+        target: {
+            "frames": frames,
+            "hit_rate": round(found / frames, 3),
+            "mean_ms": round(total / frames * 1000, 3),
+        }
+        for target, (frames, found, total) in stats.items()
+        if frames
+    }
+
+
+class MetricsLogger:
+    """按固定间隔打印一行汇总：各阶段平均耗时、检测命中率和附加的指标"""
+
+    def __init__(self, interval: float, extra: Optional[Callable[[], str]] = None):
+        self.interval = interval
+        self.extra = extra
+        self._last_stages: Dict[LabelValues, Tuple[int, float]] = {}
+        self._last_found = 0.0
+        self._last_missed = 0.0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval > 0 and not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+
+    def _loop(self):
+        while self._running:
+            time.sleep(self.interval)
+            print(self.summary())
+
+    def summary(self) -> str:
+        """自上一次汇总以来的增量"""
+        stages = STAGE_SECONDS.totals()
+        parts = []
+        for key, (count, total) in sorted(stages.items()):
+            last_count, last_total = self._last_stages.get(key, (0, 0.0))
+            if count > last_count:
+                mean = (total - last_total) / (count - last_count) * 1000
+                parts.append(f"{key[0]} {mean:.1f}ms x{count - last_count}")
+        self._last_stages = stages
+
+        found = DETECTIONS.value(result="found")
+        missed = DETECTIONS.value(result="missed")
+        attempts = (found - self._last_found) + (missed - self._last_missed)
+        hit_rate = (found - self._last_found) / attempts if attempts else 0.0
+        self._last_found, self._last_missed = found, missed
+
+        line = f"[metrics] {' | '.join(parts) or '无数据'} | 检测命中率 {hit_rate:.0%}"
+        if self.extra is not None:
+            line += f" | {self.extra()}"
+        return line
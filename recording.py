@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import json
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from result_store import BackgroundWriter
+from targets import TargetSpec
+
+MAGIC = b"CALREC1\n"
+# 每条记录: 4字节类型 + uint32负载长度 + 负载
+RECORD_HEADER = struct.Struct("<4sI")
+# VIEW负载: uint32帧序号 + float64采集时间 + uint32角点数，之后是float32角点 (N, 2)
+VIEW_HEADER = struct.Struct("<IdI")
+# FRAM负载: uint32帧序号，之后是PNG数据；VIDS负载: uint32帧序号，之后是int32角点编号
+FRAME_HEADER = struct.Struct("<I")
+
+RECORDING_SUFFIX = ".calrec"
+
+
+def _iter_records(f: BinaryIO) -> Iterator[Tuple[bytes, bytes]]:
+    """逐条读取记录；文件末尾不完整的记录（录制中断）直接忽略"""
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        tag, length = RECORD_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            return
+        yield tag, payload
+
+
+class SessionRecorder:
+    """
+    把标定过程中采用的视图按块追加写入录制文件
+
+    每个视图只记录角点（几百字节），save_frames为True时同时保存PNG原图，
+    以便回放时重新检测。文件由META、VIEW、VIDS（部分可见视图的角点编号）、
+    FRAM、RSLT记录组成，每条记录
+    写完即落盘，中途崩溃时已写入的视图仍可回放。PNG编码和写盘在后台线程中进行。
+    """
+
+    def __init__(self, path: Any, save_frames: bool = False, meta: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.save_frames = save_frames
+        self.meta = dict(meta or {})
+        self.views = 0
+        self.writer = BackgroundWriter(f"recorder-{self.path.stem}")
+        self._file: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+
+    def _write(self, tag: bytes, payload: bytes):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(RECORD_HEADER.pack(tag, len(payload)))
+            self._file.write(payload)
+            self._file.flush()
+
+    def start(
+        self,
+        chessboard_size: Tuple[Any, ...],
+        image_size: Tuple[int, int],
+        target: Optional[TargetSpec] = None,
+    ):
+        """写入文件头和标定配置"""
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        meta = dict(
+            self.meta,
+            chessboard_size=list(chessboard_size),
+            image_size=list(image_size),
+            target=(target or TargetSpec()).to_dict(),
+            save_frames=self.save_frames,
+            created=time.time(),
+        )
+        with self._lock:
+            self._file = open(self.path, "wb")
+            self._file.write(MAGIC)
+        self._write(b"META", json.dumps(meta).encode())
+
+    def add_view(
+        self,
+        seq: int,
+        corners: np.ndarray,
+        frame: Optional[np.ndarray] = None,
+        timestamp: Optional[float] = None,
+        ids: Optional[np.ndarray] = None,
+    ):
+        """记录一个采用的视图，frame需要是调用方不再修改的副本，ids为部分可见时的角点编号"""
+        points = np.ascontiguousarray(corners, np.float32).reshape(-1, 2)
+        payload = VIEW_HEADER.pack(seq, timestamp or time.time(), len(points)) + points.tobytes()
+        self.views += 1
+        self.writer.submit(lambda: self._write(b"VIEW", payload))
+        if ids is not None:
+            id_payload = FRAME_HEADER.pack(seq) + np.ascontiguousarray(ids, np.int32).tobytes()
+            self.writer.submit(lambda: self._write(b"VIDS", id_payload))
+        if self.save_frames and frame is not None:
+            self.writer.submit(lambda: self._write_frame(seq, frame))
+
+    def _write_frame(self, seq: int, frame: np.ndarray):
+        ok, buffer = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if ok:
+            self._write(b"FRAM", FRAME_HEADER.pack(seq) + buffer.tobytes())
+
+    def finish(self, results: Any = None):
+        """写入标定结果（用于回放时对比）并关闭文件"""
+        if results is not None:
+            payload = json.dumps(results.to_dict()).encode()
+            self.writer.submit(lambda: self._write(b"RSLT", payload))
+        self.writer.close()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        print(f"已录制 {self.views} 个视图到 {self.path}")
+
+
+@dataclass
+class RecordedView:
+    seq: int
+    timestamp: float
+    corners: np.ndarray  # (N, 1, 2) float32，与findChessboardCorners输出一致
+    png: Optional[bytes] = None
+    ids: Optional[np.ndarray] = None  # 部分可见时的角点编号，None表示完整的标定板
+
+    def decode_frame(self) -> Optional[np.ndarray]:
+        if self.png is None:
+            return None
+        return cv2.imdecode(np.frombuffer(self.png, np.uint8), cv2.IMREAD_COLOR)
+
+
+@dataclass
+class Recording:
+    meta: Dict[str, Any]
+    views: List[RecordedView] = field(default_factory=list)
+    results: Optional[Dict[str, Any]] = None  # 录制时的标定结果
+
+    @property
+    def has_frames(self) -> bool:
+        return any(view.png is not None for view in self.views)
+
+
+def read_recording(path: Any) -> Recording:
+    """读取录制文件"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是标定录制文件: {path}")
+        recording: Optional[Recording] = None
+        by_seq: Dict[int, RecordedView] = {}
+        for tag, payload in _iter_records(f):
+            if tag == b"META":
+                recording = Recording(json.loads(payload))
+            elif recording is None:
+                raise ValueError(f"录制文件缺少META记录: {path}")
+            elif tag == b"VIEW":
+                seq, timestamp, count = VIEW_HEADER.unpack_from(payload)
+                corners = np.frombuffer(payload, np.float32, count * 2, VIEW_HEADER.size)
+                view = RecordedView(seq, timestamp, corners.reshape(-1, 1, 2).copy())
+                recording.views.append(view)
+                by_seq[seq] = view
+            elif tag == b"VIDS":
+                (seq,) = FRAME_HEADER.unpack_from(payload)
+                if seq in by_seq:
+                    ids = np.frombuffer(payload, np.int32, offset=FRAME_HEADER.size)
+                    by_seq[seq].ids = ids.copy()
+            elif tag == b"FRAM":
+                (seq,) = FRAME_HEADER.unpack_from(payload)
+                if seq in by_seq:
+                    by_seq[seq].png = payload[FRAME_HEADER.size:]
+            elif tag == b"RSLT":
+                recording.results = json.loads(payload)
+    if recording is None:
+        raise ValueError(f"录制文件为空: {path}")
+    return recording
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+from calibration import CameraCalibrator, detect_scale_arg
+from corner_dataset import CornerDataset
+from detection_backend import create_backend
+from recording import read_recording
+
+parser = ArgumentParser(
+    description="re-solve a calibration from a recorded session or corner dataset"
+)
+parser.add_argument(
+    "recording", type=Path, help=".calrec file written with --record, or a corner dataset dir"
+)
+parser.add_argument(
+    "--camera", default=None, help="camera to calibrate from a multi-camera dataset"
+)
+parser.add_argument(
+    "--save-dataset",
+    default=None,
+    type=Path,
+    help="save the replayed corners as a columnar corner dataset in this dir",
+)
+parser.add_argument("--output-dir", default=None, type=Path, help="dir to save results")
+parser.add_argument("--min-images", default=15, type=int, help="minimum number of views")
+parser.add_argument(
+    "--redetect",
+    action="store_true",
+    help="detect corners again from the recorded frames instead of using recorded corners",
+)
+parser.add_argument(
+    "--reject-outliers",
+    action="store_true",
+    help="drop views with large reprojection error and re-solve",
+)
+parser.add_argument(
+    "--detect-scale", default=1.0, type=detect_scale_arg, help="coarse search downscale"
+)
+parser.add_argument(
+    "--detect-engine", default="classic", choices=["classic", "sb"], help="chessboard detector"
+)
+parser.add_argument(
+    "--max-sharpness",
+    default=None,
+    type=float,
+    help="drop blurry views (mean corner edge width in pixels), 0 disables",
+)
+parser.add_argument(
+    "--detect-backend",
+    default="serial",
+    choices=["serial", "thread", "process"],
+    help="where to run chessboard detection when --redetect is given",
+)
+parser.add_argument("--detect-workers", default=0, type=int, help="0 means one per CPU core")
+
+
+def compare(recorded: dict, results):
+    """打印回放结果与录制时结果的差异"""
+    K0 = np.array(recorded["camera_matrix"])
+    d0 = np.array(recorded["dist_coeffs"]).ravel()
+    K1, d1 = results.camera_matrix, results.dist_coeffs.ravel()
+    print("与录制时的结果对比:")
+    for name, (i, j) in {"fx": (0, 0), "fy": (1, 1), "cx": (0, 2), "cy": (1, 2)}.items():
+        print(f"  {name}: {K0[i, j]:.4f} -> {K1[i, j]:.4f} ({K1[i, j] - K0[i, j]:+.4f})")
+    count = min(len(d0), len(d1))
+    print(f"  畸变系数最大差异: {np.abs(d1[:count] - d0[:count]).max():.6f}")
+    print(
+        f"  重投影误差: {recorded['reprojection_error']:.6f} -> {results.reprojection_error:.6f}"
+    )
+
+
+def main():
+    args = parser.parse_args()
+    backend = create_backend(args.detect_backend, args.detect_workers) if args.redetect else None
+    calibrator = CameraCalibrator(
+        detect_scale=args.detect_scale,
+        detect_engine=args.detect_engine,
+        max_sharpness=args.max_sharpness,
+        backend=backend,
+        reject_outliers=args.reject_outliers,
+    )
+    from_dataset = CornerDataset.exists(args.recording)
+    try:
+        if from_dataset:
+            results = calibrator.calibrate_from_dataset(
+                args.recording, args.camera, min_images=args.min_images
+            )
+        else:
+            results = calibrator.calibrate_from_recording(
+                args.recording, min_images=args.min_images, redetect=args.redetect
+            )
+    finally:
+        if backend is not None:
+            backend.close()
+
+    if not from_dataset:
+        recorded = read_recording(args.recording).results
+        if recorded is not None:
+            compare(recorded, results)
+    if args.save_dataset is not None:
+        calibrator.save_dataset(args.save_dataset, args.camera or "")
+        print(f"角点数据集已保存到 {args.save_dataset.absolute()} 目录")
+    if args.output_dir is not None:
+        results.save(args.output_dir)
+        print(f"标定结果已保存到 {args.output_dir.absolute()} 目录")
+
+
+if __name__ == "__main__":
+    main()
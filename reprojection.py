@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from dataclasses import dataclass
+from typing import Sequence
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class ReprojectionErrors:
+    """一次求解的重投影残差"""
+
+    residuals: np.ndarray  # (N, 2) 每个点的残差（检测值 - 投影值）
+    view_index: np.ndarray  # (N,) 每个点所属的视图
+    per_point: np.ndarray  # (N,) 每个点的残差长度
+    per_view: np.ndarray  # (V,) 每个视图的RMS
+    rms: float  # 所有点的RMS，与calibrateCamera的返回值一致
+
+
+def rodrigues_batch(rvecs: np.ndarray) -> np.ndarray:
+    """把(V, 3)的旋转向量批量转换为(V, 3, 3)的旋转矩阵"""
+    rvecs = np.asarray(rvecs, np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    safe = np.where(theta > 1e-12, theta, 1.0)
+    k = rvecs / safe[:, None]
+    K = np.zeros((len(rvecs), 3, 3))
+    K[:, 0, 1], K[:, 0, 2] = -k[:, 2], k[:, 1]
+    K[:, 1, 0], K[:, 1, 2] = k[:, 2], -k[:, 0]
+    K[:, 2, 0], K[:, 2, 1] = -k[:, 1], k[:, 0]
+    sin = np.sin(theta)[:, None, None]
+    cos = np.cos(theta)[:, None, None]
+    return np.eye(3) + sin * K + (1 - cos) * (K @ K)
+
+
+def project_points_batch(
+    object_points: np.ndarray,
+    view_index: np.ndarray,
+    rvecs: np.ndarray,
+    tvecs: np.ndarray,
+    camera_matrix: np.ndarray,
+    dist_coeffs: np.ndarray,
+) -> np.ndarray:
+    """
+    一次性投影所有视图的点
+
+    支持径向(k1-k6)、切向(p1, p2)和薄棱镜(s1-s4)畸变；
+    使用倾斜传感器模型(tauX, tauY)时退回逐视图的cv2.projectPoints
+    """
+    dist = np.zeros(14)
+    coeffs = np.asarray(dist_coeffs, np.float64).ravel()
+    dist[: len(coeffs)] = coeffs
+    rvecs = np.asarray(rvecs, np.float64).reshape(-1, 3)
+    tvecs = np.asarray(tvecs, np.float64).reshape(-1, 3)
+
+    if np.any(dist[12:]):
+        projected = np.empty((len(object_points), 2))
+        for view in range(len(rvecs)):
+            mask = view_index == view
+            points, _ = cv2.projectPoints(
+                object_points[mask], rvecs[view], tvecs[view], camera_matrix, coeffs
+            )
+            projected[mask] = points.reshape(-1, 2)
+        return projected
+
+    rotations = rodrigues_batch(rvecs)
+    cam = np.einsum("nij,nj->ni", rotations[view_index], object_points) + tvecs[view_index]
+    x = cam[:, 0] / cam[:, 2]
+    y = cam[:, 1] / cam[:, 2]
+
+    k1, k2, p1, p2, k3, k4, k5, k6, s1, s2, s3, s4 = dist[:12]
+    r2 = x * x + y * y
+    r4 = r2 * r2
+    r6 = r4 * r2
+    radial = (1 + k1 * r2 + k2 * r4 + k3 * r6) / (1 + k4 * r2 + k5 * r4 + k6 * r6)
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x) + s1 * r2 + s2 * r4
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y + s3 * r2 + s4 * r4
+
+    K = np.asarray(camera_matrix, np.float64)
+    u = K[0, 0] * xd + K[0, 1] * yd + K[0, 2]
+    v = K[1, 1] * yd + K[1, 2]
+    return np.column_stack([u, v])
+
+
+def compute_reprojection_errors(
+    object_points: Sequence[np.ndarray],
+    image_points: Sequence[np.ndarray],
+    rvecs: Sequence[np.ndarray],
+    tvecs: Sequence[np.ndarray],
+    camera_matrix: np.ndarray,
+    dist_coeffs: np.ndarray,
+) -> ReprojectionErrors:
+    """一次批量计算所有视图的重投影残差，返回逐点和逐视图的结果"""
+    counts = np.array([len(points) for points in image_points])
+    view_index = np.repeat(np.arange(len(counts)), counts)
+    objects = np.concatenate([np.asarray(p, np.float64).reshape(-1, 3) for p in object_points])
+    detected = np.concatenate([np.asarray(p, np.float64).reshape(-1, 2) for p in image_points])
+
+    projected = project_points_batch(
+        objects, view_index, np.array(rvecs), np.array(tvecs), camera_matrix, dist_coeffs
+    )
+    residuals = detected - projected
+    squared = (residuals**2).sum(axis=1)
+    per_view = np.sqrt(np.bincount(view_index, squared, len(counts)) / counts)
+    return ReprojectionErrors(
+        residuals=residuals,
+        view_index=view_index,
+        per_point=np.sqrt(squared),
+        per_view=per_view,
+        rms=float(np.sqrt(squared.mean())),
+    )
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+INDEX_FILE = "index.json"
+LATEST_FILE = "calibration.json"
+
+
+def atomic_write(path: Any, write: Callable[[Any], Any], mode: str = "w"):
+    """
+    先写到同目录下的临时文件再rename，读者只会看到旧文件或完整的新文件
+
+    write接收打开的文件对象；写入失败时删除临时文件，原文件保持不变
+    """
+    path = Path(path)
+    path.parent.mkdir(exist_ok=True, parents=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class BackgroundWriter:
+    """单个后台线程按提交顺序执行写盘任务，调用方不等待磁盘IO"""
+
+    def __init__(self, name: str = "result-writer"):
+        self.name = name
+        self._queue: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.failures = 0
+
+    def submit(self, task: Callable[[], None]):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+        self._queue.put(task)
+
+    def _loop(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                task()
+            except Exception as e:
+                self.failures += 1
+                print(f"后台写入失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待已提交的任务全部完成"""
+        self._queue.join()
+
+    def close(self):
+        """写完剩余任务后停止线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+class ResultStore:
+    """
+    单个摄像头的标定结果存储
+
+    最新结果保存在内存中，读取不访问磁盘；保存时立即替换内存中的结果，
+    由后台线程原子地写入output_dir下的calibration.json/.npz/.txt，
+    同时在history/<版本号>/下保留一份，并更新history/index.json
+    （时间、摄像头、棋盘格、重投影误差等）。超过max_history的旧版本被删除。
+    """
+
+    def __init__(self, output_dir: Any, camera_id: str = "", max_history: int = 100):
+        self.output_dir = Path(output_dir)
+        self.history_dir = self.output_dir.joinpath("history")
+        self.camera_id = camera_id
+        self.max_history = max_history
+        self.writer = BackgroundWriter(f"result-writer-{camera_id}")
+        self._lock = threading.Lock()
+        self._latest: Optional[Dict[str, Any]] = self._read_json(self.output_dir.joinpath(LATEST_FILE))
+        self._index: List[Dict[str, Any]] = self._read_json(self.history_dir.joinpath(INDEX_FILE)) or []
+        self._next_seq = self._index[-1]["seq"] + 1 if self._index else 1
+
+    @staticmethod
+    def _read_json(path: Path) -> Any:
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """最新的结果（与calibration.json内容一致），没有时返回None"""
+        with self._lock:
+            return self._latest
+
+    def history(self) -> List[Dict[str, Any]]:
+        """历史版本索引，最新的在最后"""
+        with self._lock:
+            return list(self._index)
+
+    def load_version(self, version: str) -> Optional[Dict[str, Any]]:
+        """读取某个历史版本的结果"""
+        with self._lock:
+            if not any(entry["version"] == version for entry in self._index):
+                return None
+        return self._read_json(self.history_dir.joinpath(version, LATEST_FILE))
+
+    def save(self, results: Any, after_write: Optional[Callable[[], None]] = None) -> str:
+        """
+        保存一次标定结果，返回版本号
+
+        内存中的最新结果立即更新；文件在后台写入，after_write在写完后于写线程中调用
+        """
+        data = results.to_dict()
+        now = time.time()
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            # 序号保证同一秒内多次保存的版本号不重复
+            version = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{seq:04d}"
+            self._latest = data
+            self._index.append(
+                {
+                    "version": version,
+                    "seq": seq,
+                    "timestamp": now,
+                    "camera_id": self.camera_id,
+                    "chessboard_size": data["chessboard_size"],
+                    "image_size": data["image_size"],
+                    "reprojection_error": data["reprojection_error"],
+                    "calibration_images": data["calibration_images"],
+                }
+            )
+            expired = self._index[: max(len(self._index) - self.max_history, 0)]
+            del self._index[: len(expired)]
+            index = list(self._index)
+
+        def write():
+            results.save(self.output_dir)
+            results.save(self.history_dir.joinpath(version))
+            for old in expired:
+                shutil.rmtree(self.history_dir.joinpath(old["version"]), ignore_errors=True)
+            atomic_write(self.history_dir.joinpath(INDEX_FILE), lambda f: json.dump(index, f, indent=2))
+            if after_write is not None:
+                after_write()
+
+        self.writer.submit(write)
+        return version
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from calibration import CalibrationResults, CameraCalibrator
+from capture import CameraCapture
+from recording import RECORDING_SUFFIX, SessionRecorder
+from result_store import ResultStore
+from sources import open_source
+from status_feed import StatusFeed
+from stereo import StereoCalibrator, StereoResults
+from streaming import MjpegBroadcaster, normalize_stream_setting
+from targets import TargetSpec
+from undistort import UndistortMaps, intrinsics_key
+
+
+# (是否去畸变, 最大宽度, 最大高度, JPEG质量)
+StreamKey = Tuple[bool, Optional[int], Optional[int], int]
+DEFAULT_STREAM = (None, None, 80)  # 全分辨率、质量80
+MAX_STREAM_VARIANTS = 8  # 每个摄像头同时存在的视频流规格上限
+# 空闲超过该秒数的非默认规格广播器才会被停掉：刚创建的广播器在响应开始订阅之前
+# 还没有客户端，自适应码流切换档位时也会短暂没有客户端
+STREAM_IDLE_GRACE = 5.0
+# 标定中逐帧的检测统计（ROI跟踪、清晰度、检测耗时）最多按这个间隔推送
+DETECTION_STATUS_INTERVAL = 0.25
+
+
+class FairShare:
+    """
+    多个会话共享的检测配额
+
+    同时进行的检测数不超过slots，等待的请求按到达顺序（FIFO）获得配额，
+    每个会话同一时刻在途的帧数有上限，因此各会话轮流获得CPU，不会被某一路饿死。
+    """
+
+    def __init__(self, slots: int):
+        self.slots = max(int(slots), 1)
+        self._busy = 0
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self._grants: Dict[str, int] = {}
+
+    def acquire(self, owner: str = ""):
+        """按先来先得获得一个配额，配额用尽时阻塞"""
+        with self._lock:
+            if self._busy < self.slots and not self._queue:
+                self._busy += 1
+                self._grants[owner] = self._grants.get(owner, 0) + 1
+                return
+            waiter = threading.Event()
+            self._queue.append((owner, waiter))
+        waiter.wait()
+
+    def release(self):
+        """归还配额，直接转交给队首的等待者"""
+        with self._lock:
+            if self._queue:
+                owner, waiter = self._queue.popleft()
+                self._grants[owner] = self._grants.get(owner, 0) + 1
+                waiter.set()
+            else:
+                self._busy -= 1
+
+    def handle(self, owner: str) -> "FairShareHandle":
+        return FairShareHandle(self, owner)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "slots": self.slots,
+                "busy": self._busy,
+                "waiting": len(self._queue),
+                "grants": dict(self._grants),
+            }
+
+
+class FairShareHandle:
+    """绑定了会话名的配额句柄，传给CameraCalibrator的cpu_share参数"""
+
+    def __init__(self, share: FairShare, owner: str):
+        self.share = share
+        self.owner = owner
+
+    def acquire(self):
+        self.share.acquire(self.owner)
+
+    def release(self):
+        self.share.release()
+
+
+def parse_camera_specs(specs: List[str]) -> List[Tuple[str, Any]]:
+    """
+    解析--camera参数，每一项为 源 或 名称=源
+
+    未指定名称时按顺序命名为"0"、"1"……；数字形式的源转换为设备编号
+    """
+    cameras = []
+    for index, spec in enumerate(specs):
+        name, sep, source = str(spec).partition("=")
+        if not sep:
+            name, source = str(index), name
+        try:
+            source = int(source)
+        except ValueError:
+            pass
+        cameras.append((name, source))
+    names = [name for name, _ in cameras]
+    if len(set(names)) != len(names):
+        raise ValueError(f"摄像头名称重复: {names}")
+    return cameras
+
+
+class CalibrationSession:
+    """
+    单个摄像头的标定会话
+
+    持有自己的采集线程、视频流广播器、CameraCalibrator和标定状态，
+    状态变化通过自己的StatusFeed推送。多个会话可以同时标定。
+    """
+
+    def __init__(
+        self,
+        camera_id: str,
+        source: Any,
+        width: int,
+        height: int,
+        output_dir: Path,
+        calibrator_factory: Callable[[], CameraCalibrator],
+        fps: float = 30.0,
+        record: str = "none",
+    ):
+        self.camera_id = camera_id
+        self.source = source
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.record = record  # 录制采用的视图: none、corners（只录角点）或frames（同时录原图）
+        self.output_dir = output_dir
+        self.calibrator = calibrator_factory()
+        self.is_calibrating = False
+        self.calibration_progress = 0
+        self.calibration_message = ""
+        self.calibration_results: Optional[CalibrationResults] = None
+        self.chessboard_size = (9, 6, 1)  # 默认棋盘格尺寸
+        self.camera: Optional[CameraCapture] = None  # 共享采集线程
+        # 视频流广播器：(是否去畸变, 最大宽度, 最大高度, JPEG质量) -> 广播器
+        self.broadcasters: Dict[StreamKey, MjpegBroadcaster] = {}
+        self.undistort_maps: Optional[UndistortMaps] = None  # 去畸变映射表
+        self.camera_lock = threading.Lock()  # 摄像头访问锁
+        self.status_feed = StatusFeed()  # 标定状态推送
+        self.result_store = ResultStore(output_dir, camera_id)  # 结果缓存与后台持久化
+        self._results_fields_cache = (None, {})  # (标定结果, 转换后的字段)
+        self._thread: Optional[threading.Thread] = None
+        self._last_detection_status = 0.0
+
+        # 中间估计在后台线程中求解完成后也推送一次
+        self.calibrator.estimate_callback = self.publish_status
+        # 没有采用视图时检测统计也会变化（例如帧模糊），限频推送
+        self.calibrator.detection_callback = self._publish_detection_status
+        self.publish_status()
+
+    def init_camera(self) -> Optional[CameraCapture]:
+        """初始化摄像头，打开失败时返回None"""
+        with self.camera_lock:
+            if self.camera is None or not self.camera.isOpened():
+                try:
+                    # 真实摄像头、视频文件/图片目录或合成画面
+                    device = open_source(self.source, self.width, self.height, self.fps)
+                    if device is None:
+                        print(f"Can't open camera {self.source}")
+                        return None
+
+                    # 只由采集线程读取设备，其他消费者读取环形缓冲区
+                    self.camera = CameraCapture(device).start()
+                    print(
+                        f"摄像头 {self.camera_id} 已初始化: 分辨率 {self.width}x{self.height}"
+                    )
+                except Exception as e:
+                    print(f"初始化摄像头 {self.camera_id} 时出错: {e}")
+                    return None
+        return self.camera
+
+    def close(self):
+        """停止标定并释放摄像头"""
+        self.calibrator.stop_calibration = True
+        with self.camera_lock:
+            for broadcaster in self.broadcasters.values():
+                broadcaster.stop()
+            self.broadcasters.clear()
+            if self.camera is not None:
+                self.camera.release()
+                self.camera = None
+                print(f"摄像头 {self.camera_id} 已释放")
+        # 等待尚未写完的结果落盘
+        self.result_store.close()
+
+    def start_calibration(
+        self,
+        chessboard_width: int,
+        chessboard_height: int,
+        square_size: float,
+        target: Optional[TargetSpec] = None,
+    ):
+        """在后台线程中开始标定"""
+        self.is_calibrating = True
+        self.publish_status()
+        self._thread = threading.Thread(
+            target=self._calibration_thread,
+            args=(chessboard_width, chessboard_height, square_size, target or TargetSpec()),
+            name=f"calibration-{self.camera_id}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _calibration_thread(
+        self, chessboard_width: int, chessboard_height: int, square_size: float, target: TargetSpec
+    ):
+        """标定线程"""
+        try:
+            # 设置棋盘格尺寸
+            self.chessboard_size = (chessboard_width, chessboard_height, square_size)
+
+            # 重置标定器并设置新的棋盘格尺寸和标定板类型
+            self.calibrator.reset()
+            self.calibrator.set_chessboard_size(chessboard_width, chessboard_height, square_size)
+            self.calibrator.set_target(target)
+            self.publish_status()
+
+            # 开始标定过程
+            cam = self.init_camera()
+
+            if cam is None or not cam.isOpened():
+                self.calibration_message = "摄像头未连接，请检查摄像头连接"
+                self.calibration_progress = 0
+                self.is_calibrating = False
+                return
+
+            if self.record != "none":
+                self.calibrator.recorder = SessionRecorder(
+                    self.output_dir.joinpath(
+                        "recordings", time.strftime("%Y%m%d-%H%M%S") + RECORDING_SUFFIX
+                    ),
+                    save_frames=self.record == "frames",
+                    meta={"camera_id": self.camera_id, "source": str(self.source)},
+                )
+
+            results = self.calibrator.auto_calibrate(
+                camera=cam,
+                progress_callback=self.update_progress,
+                max_images=30,
+                min_images=15,
+            )
+
+            self.calibration_results = results
+            self.calibration_progress = 100
+            self.calibration_message = "标定完成！"
+
+            # 保存标定结果
+            self.save_calibration_results(results)
+
+        except Exception as e:
+            self.calibration_message = f"标定失败: {str(e)}"
+            print(f"摄像头 {self.camera_id} 标定过程中出错: {e}")
+        finally:
+            self.calibrator.recorder = None
+            self.is_calibrating = False
+            self.publish_status()
+
+    def stop_calibration(self):
+        """停止标定"""
+        self.is_calibrating = False
+        self.calibrator.stop_calibration = True
+        self.publish_status()
+
+    def update_chessboard_size(
+        self,
+        chessboard_width: int,
+        chessboard_height: int,
+        square_size: float,
+        target: Optional[TargetSpec] = None,
+    ):
+        """更新棋盘格尺寸（和标定板类型）并重置标定状态"""
+        self.chessboard_size = (chessboard_width, chessboard_height, square_size)
+
+        # 重置标定器
+        self.calibrator.reset()
+        self.calibrator.set_chessboard_size(chessboard_width, chessboard_height, square_size)
+        if target is not None:
+            self.calibrator.set_target(target)
+
+        # 重置标定状态
+        self.calibration_progress = 0
+        self.calibration_message = (
+            f"棋盘格尺寸已更新为 {chessboard_width}x{chessboard_height}，请重新开始标定"
+        )
+        self.calibration_results = None
+        self.publish_status()
+
+    def reset(self):
+        """重置标定"""
+        self.is_calibrating = False
+        self.calibrator.stop_calibration = True
+        self.calibration_progress = 0
+        self.calibration_message = "标定已重置"
+        self.calibration_results = None
+        self.calibrator.reset()
+        self.publish_status()
+
+    def update_progress(self, progress: int, message: str):
+        """更新标定进度"""
+        self.calibration_progress = progress
+        self.calibration_message = message
+        self.publish_status()
+
+    def save_calibration_results(self, results: CalibrationResults):
+        """保存标定结果：内存中的结果立即可读，文件由后台线程原子写入"""
+        try:
+            # 去畸变映射表在内存中生成，随结果一起在后台写入同一目录
+            maps = UndistortMaps.build(results.camera_matrix, results.dist_coeffs, results.image_size)
+            self.undistort_maps = maps
+            version = self.result_store.save(results, after_write=lambda: maps.save(self.output_dir))
+            print(f"标定结果 {version} 将保存到 {self.output_dir.absolute()} 目录")
+
+        except Exception as e:
+            print(f"保存标定结果时出错: {e}")
+
+    def _results_fields(self) -> Dict[str, Any]:
+        """标定结果对应的状态字段，同一份结果只转换一次"""
+        results = self.calibration_results
+        cached_results, fields = self._results_fields_cache
+        if results is cached_results and fields:
+            return fields
+        if results is None:
+            # 没有结果时显式置空，推送差量时客户端才能清掉旧结果
+            fields = {
+                "camera_matrix": None,
+                "dist_coeffs": None,
+                "reprojection_error": None,
+                "num_images": 0,
+                "fov": None,
+                "per_view_errors": [],
+                "rejected_views": 0,
+            }
+        else:
+            fields = {
+                "camera_matrix": results.camera_matrix.tolist(),
+                "dist_coeffs": results.dist_coeffs.flatten().tolist(),
+                "reprojection_error": float(results.reprojection_error),
+                "num_images": results.calibration_images,
+                "chessboard_size": results.chessboard_size,
+                "fov": results.fov,
+                "per_view_errors": results.per_view_errors,
+                "rejected_views": results.rejected_views,
+            }
+        self._results_fields_cache = (results, fields)
+        return fields
+
+    def publish_status(self):
+        """汇总当前标定状态并推送变化的字段"""
+        status = {
+            "camera_id": self.camera_id,
+            "is_calibrating": self.is_calibrating,
+            "progress": self.calibration_progress,
+            "message": self.calibration_message,
+            "has_results": self.calibration_results is not None,
+            "chessboard_size": list(self.chessboard_size),
+            "roi_stats": self.calibrator.get_roi_stats(),
+            "target": self.calibrator.get_target_stats(),
+            "detect_engine": self.calibrator.get_engine_stats(),
+            "running_estimate": self.calibrator.get_running_estimate(),
+            "coverage": self.calibrator.get_coverage_stats(),
+        }
+        status.update(self._results_fields())
+        self.status_feed.update(status)
+
+    def _publish_detection_status(self):
+        now = time.monotonic()
+        if now - self._last_detection_status >= DETECTION_STATUS_INTERVAL:
+            self._last_detection_status = now
+            self.publish_status()
+
+    def draw_overlay(self, frame: np.ndarray, seq: int) -> np.ndarray:
+        """标定中时在帧上绘制标定线程缓存的检测结果（复制一份，不修改共享帧）"""
+        if not self.is_calibrating:
+            return frame
+        return self.calibrator.draw_corners(frame.copy(), seq)
+
+    def _current_intrinsics(self) -> Optional[Tuple[np.ndarray, np.ndarray, Tuple[int, int]]]:
+        """当前标定结果的(内参矩阵, 畸变系数, 图像尺寸)，没有结果时使用最近保存的结果"""
+        results = self.calibration_results
+        if results is not None:
+            return results.camera_matrix, results.dist_coeffs, tuple(results.image_size)
+        latest = self.result_store.latest()
+        if latest is None:
+            return None
+        return (
+            np.array(latest["camera_matrix"]),
+            np.array(latest["dist_coeffs"]),
+            tuple(latest["image_size"]),
+        )
+
+    def get_undistort_maps(self) -> Optional[UndistortMaps]:
+        """
+        与当前标定结果对应的去畸变映射表，没有标定结果时返回None
+
+        内存中的映射表与结果不一致时按内参摘要加载磁盘缓存，缓存也过期时重新生成
+        """
+        intrinsics = self._current_intrinsics()
+        if intrinsics is None:
+            return None
+        maps = self.undistort_maps
+        if maps is None or maps.key != intrinsics_key(*intrinsics, 0.0):
+            maps = self.undistort_maps = UndistortMaps.load_or_build(self.output_dir, *intrinsics)
+        return maps
+
+    def undistort_overlay(self) -> Callable[[np.ndarray, int], np.ndarray]:
+        """
+        去畸变视频流的逐帧处理函数，输出写入它自己复用的缓冲区
+
+        每个去畸变广播器各创建一个：缓冲区只在该广播器的编码线程中使用，
+        编码完成前不会被其他规格的广播器覆盖
+        """
+        buffer: Optional[np.ndarray] = None
+
+        def undistort_frame(frame: np.ndarray, seq: int) -> np.ndarray:
+            nonlocal buffer
+            maps = self.undistort_maps
+            if maps is None or (frame.shape[1], frame.shape[0]) != maps.image_size:
+                return frame
+            if buffer is None or buffer.shape != frame.shape:
+                buffer = np.empty_like(frame)
+            return maps.remap(frame, dst=buffer)
+
+        return undistort_frame
+
+    @property
+    def broadcaster(self) -> Optional[MjpegBroadcaster]:
+        """全分辨率的原始视频流广播器"""
+        return self.broadcasters.get((False,) + DEFAULT_STREAM)
+
+    @property
+    def undistorted_broadcaster(self) -> Optional[MjpegBroadcaster]:
+        """全分辨率的去畸变视频流广播器"""
+        return self.broadcasters.get((True,) + DEFAULT_STREAM)
+
+    def get_broadcaster(
+        self,
+        undistort: bool = False,
+        max_width: Optional[int] = None,
+        max_height: Optional[int] = None,
+        quality: int = 80,
+    ) -> MjpegBroadcaster:
+        """
+        获取视频流广播器，首次调用时创建；undistort为True时返回去畸变视频流
+
+        指定尺寸或质量时返回对应规格的广播器，同一规格的客户端共用一份编码结果
+        """
+        cam = self.init_camera()
+
+        if cam is None or not cam.isOpened():
+            raise ValueError("相机不可用")
+        if undistort and self.get_undistort_maps() is None:
+            raise ValueError("尚未完成标定，没有去畸变映射表")
+
+        key = (undistort,) + normalize_stream_setting(max_width, max_height, quality)
+        with self.camera_lock:
+            broadcaster = self.broadcasters.get(key)
+            if broadcaster is None or broadcaster.capture is not cam:
+                if broadcaster is not None:
+                    broadcaster.stop()
+                    del self.broadcasters[key]
+                self._evict_idle_streams()
+                if len(self.broadcasters) >= MAX_STREAM_VARIANTS:
+                    raise ValueError("视频流规格过多，请使用已有的尺寸和质量")
+                _, width, height, quality = key
+                overlay = self.undistort_overlay() if undistort else self.draw_overlay
+                broadcaster = MjpegBroadcaster(
+                    cam, overlay=overlay, quality=quality, max_width=width, max_height=height
+                ).start()
+                self.broadcasters[key] = broadcaster
+        return broadcaster
+
+    def _evict_idle_streams(self):
+        """停掉空闲超过STREAM_IDLE_GRACE的非默认规格广播器（调用方持有camera_lock）"""
+        for key, broadcaster in list(self.broadcasters.items()):
+            if key[1:] != DEFAULT_STREAM and broadcaster.idle_seconds() > STREAM_IDLE_GRACE:
+                broadcaster.stop()
+                del self.broadcasters[key]
+
+    def frame_size(self) -> Tuple[int, int]:
+        """实际的帧尺寸（设备可能不支持请求的分辨率），还没有帧时返回请求的分辨率"""
+        if self.camera is not None:
+            _, frame = self.camera.latest()
+            if frame is not None:
+                return frame.shape[1], frame.shape[0]
+        return self.width, self.height
+
+    def stream_stats(self) -> Dict[str, Any]:
+        """各规格视频流的统计"""
+        return {
+            f"{'undistorted' if undistort else 'raw'}:{width or 'full'}x{height or 'full'}@q{quality}": (
+                broadcaster.stats()
+            )
+            for (undistort, width, height, quality), broadcaster in list(self.broadcasters.items())
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """会话列表中显示的简要状态"""
+        return {
+            "camera_id": self.camera_id,
+            "source": str(self.source),
+            "is_calibrating": self.is_calibrating,
+            "progress": self.calibration_progress,
+            "has_results": self.calibration_results is not None,
+            "connected": self.camera is not None and self.camera.isOpened(),
+        }
+
+
+class StereoSession:
+    """
+    多摄像头外参标定会话
+
+    使用各摄像头会话的采集线程（不另开设备），已完成单目标定的摄像头直接使用其内参
+    """
+
+    def __init__(
+        self,
+        sessions: List[CalibrationSession],
+        output_dir: Path,
+        max_skew: float = 0.02,
+        cpu_share: Any = None,
+        detector_factory: Optional[Callable[[], CameraCalibrator]] = None,
+    ):
+        self.sessions = sessions
+        self.camera_ids = [session.camera_id for session in sessions]
+        self.output_dir = output_dir
+        self.calibrator = StereoCalibrator(
+            self.camera_ids,
+            max_skew=max_skew,
+            cpu_share=cpu_share,
+            detector_factory=detector_factory,
+        )
+        self.is_calibrating = False
+        self.calibration_progress = 0
+        self.calibration_message = ""
+        self.calibration_results: Optional[StereoResults] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start_calibration(self, chessboard_width: int, chessboard_height: int, square_size: float):
+        """在后台线程中开始外参标定"""
+        self.is_calibrating = True
+        self.calibration_results = None
+        self._thread = threading.Thread(
+            target=self._calibration_thread,
+            args=(chessboard_width, chessboard_height, square_size),
+            name="calibration-stereo",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _calibration_thread(self, chessboard_width: int, chessboard_height: int, square_size: float):
+        """外参标定线程"""
+        try:
+            self.calibrator.reset()
+            self.calibrator.set_chessboard_size(chessboard_width, chessboard_height, square_size)
+
+            captures = [session.init_camera() for session in self.sessions]
+            if any(cam is None or not cam.isOpened() for cam in captures):
+                self.calibration_message = "摄像头未连接，请检查摄像头连接"
+                self.calibration_progress = 0
+                return
+
+            self.calibrator.capture_views(captures, self.update_progress)
+            self.update_progress(99, "正在求解外参...")
+
+            # 棋盘格尺寸一致的单目标定结果可以直接作为内参
+            intrinsics = {
+                session.camera_id: session.calibration_results
+                for session in self.sessions
+                if session.calibration_results is not None
+                and list(session.calibration_results.chessboard_size)
+                == [chessboard_width, chessboard_height, square_size]
+            }
+            results = self.calibrator.calibrate(intrinsics)
+            results.save(self.output_dir)
+            print(f"外参标定结果已保存到 {self.output_dir.absolute()} 目录")
+
+            self.calibration_results = results
+            self.calibration_progress = 100
+            errors = ", ".join(f"{pair.reprojection_error:.4f}" for pair in results.pairs)
+            self.calibration_message = f"外参标定完成！重投影误差: {errors}"
+        except Exception as e:
+            self.calibration_message = f"外参标定失败: {str(e)}"
+            print(f"外参标定过程中出错: {e}")
+        finally:
+            self.is_calibrating = False
+
+    def stop_calibration(self):
+        """停止采集，已采集的视图足够时直接求解"""
+        self.calibrator.stop_calibration = True
+
+    def update_progress(self, progress: int, message: str):
+        self.calibration_progress = progress
+        self.calibration_message = message
+
+    def get_status(self) -> Dict[str, Any]:
+        status = {
+            "camera_ids": self.camera_ids,
+            "is_calibrating": self.is_calibrating,
+            "progress": self.calibration_progress,
+            "message": self.calibration_message,
+            "has_results": self.calibration_results is not None,
+            "sync": self.calibrator.get_stats(),
+        }
+        if self.calibration_results is not None:
+            status["pairs"] = [
+                {
+                    "reference": pair.reference,
+                    "camera": pair.camera,
+                    "R": pair.R.tolist(),
+                    "T": pair.T.ravel().tolist(),
+                    "baseline": pair.baseline,
+                    "reprojection_error": pair.reprojection_error,
+                }
+                for pair in self.calibration_results.pairs
+            ]
+        return status
+
+    def close(self):
+        self.calibrator.stop_calibration = True
+        self.calibrator.close()
+
+
+class SessionRegistry:
+    """按摄像头名称索引的标定会话"""
+
+    def __init__(self):
+        self._sessions: Dict[str, CalibrationSession] = {}
+        self.default_id: Optional[str] = None
+
+    def add(self, session: CalibrationSession):
+        if session.camera_id in self._sessions:
+            raise ValueError(f"摄像头 {session.camera_id} 已存在")
+        self._sessions[session.camera_id] = session
+        if self.default_id is None:
+            self.default_id = session.camera_id
+
+    def get(self, camera_id: Optional[str] = None) -> CalibrationSession:
+        """按名称获取会话，未指定名称时返回第一个摄像头的会话"""
+        if camera_id is None:
+            camera_id = self.default_id
+        session = self._sessions.get(camera_id)
+        if session is None:
+            raise KeyError(camera_id)
+        return session
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def close(self):
+        for session in self:
+            session.close()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import glob
+import sys
+import time
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+VIDEO_SUFFIXES = {".mp4", ".avi", ".mov", ".mkv", ".m4v", ".webm", ".mpg", ".mpeg"}
+
+SourceSpec = Union[str, Path, Sequence[Union[str, Path]]]
+
+
+def expand_source(source: SourceSpec) -> List[Path]:
+    """把目录、通配符或文件路径（及它们的列表）展开为排好序的文件列表"""
+    if isinstance(source, (str, Path)):
+        source = [source]
+    paths: List[Path] = []
+    for item in source:
+        item = str(item)
+        if glob.has_magic(item):
+            matches = sorted(Path(p) for p in glob.glob(item, recursive=True))
+        elif Path(item).is_dir():
+            matches = sorted(
+                p
+                for p in Path(item).iterdir()
+                if p.suffix.lower() in IMAGE_SUFFIXES | VIDEO_SUFFIXES
+            )
+        else:
+            matches = [Path(item)]
+        paths.extend(p for p in matches if p.is_file())
+    return paths
+
+
+def iter_video_frames(path: Path, frame_step: int = 1) -> Iterator[Tuple[str, np.ndarray]]:
+    """逐帧读取视频文件，frame_step大于1时跳过中间帧（只grab不解码）"""
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        print(f"无法打开视频: {path}")
+        return
+    try:
+        index = 0
+        while True:
+            if index % frame_step:
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield f"{path.name}#{index}", frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_source_frames(
+    source: SourceSpec, frame_step: int = 1
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    从磁盘流式读取帧，产出(名称, BGR帧)
+
+    图片逐张读取，视频逐帧解码，不会一次性把所有帧读入内存
+    """
+    frame_step = max(int(frame_step), 1)
+    paths = expand_source(source)
+    if not paths:
+        raise FileNotFoundError(f"未找到图片或视频: {source}")
+    for path in paths:
+        suffix = path.suffix.lower()
+        if suffix in IMAGE_SUFFIXES:
+            frame = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if frame is None:
+                print(f"无法读取图片: {path}")
+                continue
+            yield path.name, frame
+        else:
+            yield from iter_video_frames(path, frame_step)
+
+
+class FrameRateLimiter:
+    """按固定帧率节流，fps为0或None时不等待"""
+
+    def __init__(self, fps: Optional[float]):
+        self.fps = fps
+        self._next_time: Optional[float] = None
+
+    def wait(self):
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self._next_time is None:
+            self._next_time = now
+        if self._next_time > now:
+            time.sleep(self._next_time - now)
+        # 落后超过一帧时不追赶，避免读取暂停后连续返回一串帧
+        self._next_time = max(self._next_time + 1 / self.fps, now - 1 / self.fps)
+
+
+def fit_frame(
+    frame: np.ndarray, size: Optional[Tuple[int, int]], image: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """缩放到size=(宽, 高)，尺寸一致时直接返回；image形状匹配时写入image"""
+    if size is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+        target = image if image is not None and image.shape[:2] == (size[1], size[0]) else None
+        return cv2.resize(frame, tuple(size), dst=target, interpolation=cv2.INTER_AREA)
+    if image is not None and image.shape == frame.shape:
+        np.copyto(image, frame)
+        return image
+    return frame
+
+
+class FileSource:
+    """
+    把视频文件或图片目录当作摄像头循环播放
+
+    与cv2.VideoCapture接口兼容，按fps节流，帧缩放到指定分辨率；
+    逐帧从磁盘读取，不会把所有帧读入内存
+    """
+
+    def __init__(
+        self,
+        source: SourceSpec,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        fps: Optional[float] = 30.0,
+        loop: bool = True,
+    ):
+        self.paths = expand_source(source)
+        if not self.paths:
+            raise FileNotFoundError(f"未找到图片或视频: {source}")
+        self.size = (width, height) if width and height else None
+        self.loop = loop
+        self.limiter = FrameRateLimiter(fps)
+        self._frames: Optional[Iterator[Tuple[str, np.ndarray]]] = None
+        self._opened = True
+
+    def _next_frame(self) -> Optional[np.ndarray]:
+        for _ in range(2):
+            if self._frames is None:
+                self._frames = iter_source_frames(self.paths)
+            item = next(self._frames, None)
+            if item is not None:
+                return item[1]
+            # 播放完一遍，从头开始
+            self._frames = None
+            if not self.loop:
+                break
+        return None
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened:
+            return False, None
+        self.limiter.wait()
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        return True, fit_frame(frame, self.size, image)
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def set(self, prop_id: int, value: Any) -> bool:
+        return False
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH and self.size:
+            return float(self.size[0])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT and self.size:
+            return float(self.size[1])
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.limiter.fps or 0)
+        return 0.0
+
+    def release(self):
+        self._opened = False
+        if self._frames is not None:
+            self._frames.close()
+            self._frames = None
+
+
+def open_device(source: Any, width: int, height: int, fps: float):
+    """打开摄像头设备（设备编号、/dev/videoN或URL），并设置分辨率和帧率"""
+    if sys.platform.startswith("linux") and str(source).startswith("/dev/video"):
+        device = cv2.VideoCapture(str(source), cv2.CAP_V4L2)
+    else:
+        device = cv2.VideoCapture(source)
+    if not device.isOpened():
+        return None
+    device.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    device.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        device.set(cv2.CAP_PROP_FPS, fps)
+    return device
+
+
+def open_source(source: Any, width: int, height: int, fps: float = 30.0):
+    """
+    按--camera给出的源打开帧来源，失败时返回None
+
+    - 设备编号、/dev/videoN、URL: 真实摄像头
+    - synthetic 或 synthetic:列x行: 实时生成的合成棋盘格画面（无需摄像头）
+    - 视频文件、图片目录或通配符: 循环播放
+
+    返回的对象都与cv2.VideoCapture接口兼容，可以交给CameraCapture
+    """
+    if isinstance(source, int) or str(source).startswith("/dev/video"):
+        return open_device(source, width, height, fps)
+
+    kind, _, options = str(source).partition(":")
+    if kind == "synthetic":
+        from synthetic import SyntheticCamera
+
+        pattern_size = (9, 6)
+        if options:
+            cols, _, rows = options.lower().partition("x")
+            pattern_size = (int(cols), int(rows))
+        return SyntheticCamera((width, height), pattern_size, fps=fps)
+
+    if expand_source(source):
+        return FileSource(source, width, height, fps)
+    return open_device(source, width, height, fps)
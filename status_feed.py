@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+
+def make_sse_event(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> bytes:
+    """把一条消息包装成Server-Sent Events格式"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class StatusFeed:
+    """
+    带版本号的状态推送
+
+    update()只记录发生变化的字段，每次变化版本号加一，并保留最近的若干条差量。
+    订阅者首次连接或落后太多时收到完整快照（snapshot），之后只收到差量（update）；
+    断线重连时带上最后收到的版本号即可从差量补齐。
+    """
+
+    def __init__(self, history: int = 256, keepalive: float = 15.0):
+        self.version = 0
+        self.keepalive = keepalive
+        self._state: Dict[str, Any] = {}
+        # (版本号, 该版本的差量)
+        self._history: deque = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def update(self, fields: Dict[str, Any]) -> int:
+        """合并新的字段值，有变化时生成新版本并唤醒订阅者，返回当前版本号"""
+        with self._lock:
+            diff = {k: v for k, v in fields.items() if k not in self._state or self._state[k] != v}
+            if not diff:
+                return self.version
+            self._state.update(diff)
+            self.version += 1
+            self._history.append((self.version, diff))
+            self._wake_async_waiters()
+            return self.version
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        """返回(版本号, 完整状态的副本)"""
+        with self._lock:
+            return self.version, dict(self._state)
+
+    def changes_since(self, version: int) -> Optional[List[Tuple[int, Dict[str, Any]]]]:
+        """返回version之后的所有差量；差量已被丢弃或版本号无效时返回None，需要重新同步"""
+        with self._lock:
+            if version > self.version:
+                return None
+            if version == self.version:
+                return []
+            if not self._history or self._history[0][0] > version + 1:
+                return None
+            return [(v, diff) for v, diff in self._history if v > version]
+
+    def _wake_async_waiters(self):
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                self._async_waiters.discard((loop, event))
+
+    async def subscribe_async(self, last_version: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        异步订阅，逐条产出SSE消息
+
+        last_version为客户端最后收到的版本号（Last-Event-ID），为None时先发送完整快照。
+        没有变化时每隔keepalive秒发送一条注释，防止连接被代理断开。
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        _, event = waiter
+        with self._lock:
+            self._async_waiters.add(waiter)
+        try:
+            changes = None if last_version is None else self.changes_since(last_version)
+            if changes is None:
+                version, state = self.snapshot()
+                yield make_sse_event("snapshot", state, version)
+            else:
+                version = last_version
+                for version, diff in changes:
+                    yield make_sse_event("update", diff, version)
+
+            while True:
+                event.clear()
+                changes = self.changes_since(version)
+                if changes is None:
+                    # 推送速度跟不上时直接重新同步
+                    version, state = self.snapshot()
+                    yield make_sse_event("snapshot", state, version)
+                    continue
+                if not changes:
+                    try:
+                        await asyncio.wait_for(event.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                    continue
+                for version, diff in changes:
+                    yield make_sse_event("update", diff, version)
+        finally:
+            with self._lock:
+                self._async_waiters.discard(waiter)
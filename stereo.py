@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from calibration import CalibrationResults, CameraCalibrator
+from result_store import atomic_write
+from view_selection import ViewSelector
+
+
+@dataclass
+class StereoPair:
+    """参考摄像头与另一个摄像头之间的外参和校正结果"""
+
+    reference: str
+    camera: str
+    R: np.ndarray  # 参考摄像头坐标系到该摄像头坐标系的旋转
+    T: np.ndarray  # 平移，单位与棋盘格方格尺寸一致
+    E: np.ndarray
+    F: np.ndarray
+    reprojection_error: float
+    R1: np.ndarray  # 校正旋转和投影矩阵（stereoRectify的输出）
+    R2: np.ndarray
+    P1: np.ndarray
+    P2: np.ndarray
+    Q: np.ndarray
+    # 校正映射表(map1, map2)，CV_16SC2格式，可直接传给cv2.remap
+    maps: Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def baseline(self) -> float:
+        return float(np.linalg.norm(self.T))
+
+
+@dataclass
+class StereoResults:
+    camera_ids: List[str]
+    intrinsics: Dict[str, CalibrationResults]
+    pairs: List[StereoPair]
+    views: int
+    image_size: List[int]
+    chessboard_size: List[Any]
+    max_skew: float  # 采用的视图中摄像头之间最大的时间差（秒）
+
+    def save_json(self, p: Any):
+        results = {
+            "camera_ids": self.camera_ids,
+            "views": self.views,
+            "image_size": self.image_size,
+            "chessboard_size": self.chessboard_size,
+            "max_skew": self.max_skew,
+            "intrinsics": {
+                camera_id: {
+                    "camera_matrix": result.camera_matrix.tolist(),
+                    "dist_coeffs": result.dist_coeffs.tolist(),
+                    "reprojection_error": result.reprojection_error,
+                }
+                for camera_id, result in self.intrinsics.items()
+            },
+            "pairs": [
+                {
+                    "reference": pair.reference,
+                    "camera": pair.camera,
+                    "R": pair.R.tolist(),
+                    "T": pair.T.ravel().tolist(),
+                    "baseline": pair.baseline,
+                    "reprojection_error": pair.reprojection_error,
+                    "P1": pair.P1.tolist(),
+                    "P2": pair.P2.tolist(),
+                    "Q": pair.Q.tolist(),
+                }
+                for pair in self.pairs
+            ],
+        }
+        return json.dump(results, p, indent=2)
+
+    def save_numpy(self, p: Any):
+        arrays = {}
+        for camera_id, result in self.intrinsics.items():
+            arrays[f"{camera_id}_camera_matrix"] = result.camera_matrix
+            arrays[f"{camera_id}_dist_coeffs"] = result.dist_coeffs
+        for pair in self.pairs:
+            prefix = f"{pair.reference}_{pair.camera}"
+            for name in ("R", "T", "E", "F", "R1", "R2", "P1", "P2", "Q"):
+                arrays[f"{prefix}_{name}"] = getattr(pair, name)
+        np.savez(p, **arrays)
+
+    def save(self, output_dir: Any):
+        """把JSON和NumPy格式的结果保存到目录，校正映射表可由参数重新生成，不保存"""
+        output_dir = Path(output_dir)
+        atomic_write(output_dir.joinpath("stereo.json"), self.save_json)
+        atomic_write(output_dir.joinpath("stereo.npz"), self.save_numpy, "wb")
+
+
+class StereoCalibrator:
+    """
+    多摄像头外参标定
+
+    以第一个摄像头为参考，每当它采集到新帧时，从其他摄像头的环形缓冲区中
+    取采集时间最接近的帧，时间差超过max_skew的组合直接丢弃。各摄像头的
+    检测在各自的线程中并行进行，只保留所有摄像头都检测到棋盘格的视图，
+    然后依次求解参考摄像头与其他摄像头之间的外参，并生成校正映射表。
+    detector_factory创建每个摄像头的检测器（检测引擎、模糊阈值、ROI跟踪等与单目标定一致）。
+    """
+
+    def __init__(
+        self,
+        camera_ids: Sequence[str],
+        max_skew: float = 0.02,
+        detect_scale: float = 1.0,
+        cpu_share: Any = None,
+        detector_factory: Optional[Callable[[], CameraCalibrator]] = None,
+    ):
+        if len(camera_ids) < 2:
+            raise ValueError("外参标定至少需要两个摄像头")
+        self.camera_ids = list(camera_ids)
+        self.max_skew = max_skew
+        self.cpu_share = cpu_share
+        # 每个摄像头一个检测器，各自维护预处理缓冲区和ROI跟踪状态
+        if detector_factory is None:
+            detector_factory = lambda: CameraCalibrator(detect_scale=detect_scale)
+        self.detectors = [detector_factory() for _ in self.camera_ids]
+        self.chessboard_size = (9, 6, 0.01)
+        self.image_size: Optional[Tuple[int, int]] = None
+        self.object_points: List[np.ndarray] = []
+        # image_points[i][j]：第j个视图在第i个摄像头中的角点
+        self.image_points: List[List[np.ndarray]] = [[] for _ in self.camera_ids]
+        self.skews: List[float] = []
+        self.matched_frames = 0
+        self.dropped_frames = 0  # 时间差过大而丢弃的帧
+        self.flipped_views = 0  # 各摄像头角点顺序不一致（相差180度）而丢弃的视图
+        self.stop_calibration = False
+        self.selector: Optional[ViewSelector] = None
+        self._executor = ThreadPoolExecutor(len(self.camera_ids), thread_name_prefix="stereo")
+
+    def set_chessboard_size(self, width: int, height: int, square_size: float):
+        self.chessboard_size = (width, height, square_size)
+        for detector in self.detectors:
+            detector.set_chessboard_size(width, height, square_size)
+
+    def reset(self):
+        self.object_points = []
+        self.image_points = [[] for _ in self.camera_ids]
+        self.skews = []
+        self.matched_frames = 0
+        self.dropped_frames = 0
+        self.flipped_views = 0
+        self.stop_calibration = False
+        self.selector = None
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _match_frames(
+        self, captures: Sequence[Any], seq: int, frame: np.ndarray
+    ) -> Optional[Tuple[List[np.ndarray], float]]:
+        """取与参考帧时间最接近的一组帧（复制一份），返回(帧列表, 最大时间差)"""
+        stamp = captures[0].timestamp(seq)
+        if stamp is None:
+            return None
+        frames = [frame.copy()]
+        skew = 0.0
+        for capture in captures[1:]:
+            # 对方还没采集到参考帧之后的帧时最多等待max_skew
+            deadline = time.monotonic() + self.max_skew
+            while True:
+                latest = capture.timestamp(capture.seq)
+                remaining = deadline - time.monotonic()
+                if (latest is not None and latest >= stamp) or remaining <= 0:
+                    break
+                capture.wait_frame(capture.seq, timeout=remaining)
+            _, other, other_stamp = capture.nearest(stamp)
+            if other is None or abs(other_stamp - stamp) > self.max_skew:
+                return None
+            frames.append(other.copy())
+            skew = max(skew, abs(other_stamp - stamp))
+        return frames, skew
+
+    def _detect(self, index: int, frame: np.ndarray):
+        if self.cpu_share is not None:
+            self.cpu_share.acquire()
+        try:
+            return self.detectors[index].detect_chessboard(frame)
+        finally:
+            if self.cpu_share is not None:
+                self.cpu_share.release()
+
+    def capture_views(
+        self,
+        captures: Sequence[Any],
+        progress_callback: Callable,
+        max_views: int = 30,
+        min_views: int = 15,
+    ) -> int:
+        """
+        从多个CameraCapture采集同步视图，返回采集到的视图数
+
+        参考摄像头上的视图选择与单目标定一致（覆盖率和姿态多样性），
+        达到覆盖目标或max_views后结束，也可以通过stop_calibration提前结束
+        """
+        if len(captures) != len(self.camera_ids):
+            raise ValueError("摄像头数量与camera_ids不一致")
+        seq = 0
+        collected = len(self.object_points)
+        while not self.stop_calibration and collected < max_views:
+            seq, frame = captures[0].wait_frame(seq)
+            if frame is None:
+                progress_callback(0, "摄像头读取失败")
+                time.sleep(0.1)
+                continue
+
+            matched = self._match_frames(captures, seq, frame)
+            if matched is None:
+                self.dropped_frames += 1
+                continue
+            frames, skew = matched
+            self.matched_frames += 1
+
+            if self.image_size is None:
+                self.image_size = (frames[0].shape[1], frames[0].shape[0])
+                for detector in self.detectors:
+                    detector.image_size = self.image_size
+            if any((f.shape[1], f.shape[0]) != self.image_size for f in frames):
+                raise ValueError("外参标定要求所有摄像头的分辨率一致")
+            if self.selector is None:
+                self.selector = ViewSelector(self.image_size, self.chessboard_size[:2])
+
+            # 各摄像头的检测并行进行
+            futures = [
+                self._executor.submit(self._detect, i, frame) for i, frame in enumerate(frames)
+            ]
+            detections = [future.result() for future in futures]
+            if not all(found for found, _ in detections):
+                continue
+            if not self._consistent_order([corners for _, corners in detections]):
+                self.flipped_views += 1
+                continue
+
+            score = self.selector.evaluate(detections[0][1])
+            if not score.accepted:
+                continue
+            self.selector.accept(detections[0][1], score)
+            self.object_points.append(
+                self.detectors[0].get_pipeline(self.image_size).object_points
+            )
+            for points, (_, corners) in zip(self.image_points, detections):
+                points.append(corners)
+            self.skews.append(skew)
+            collected += 1
+
+            progress = int(max(collected / max_views, self.selector.progress(min_views)) * 100)
+            progress_callback(
+                min(progress, 99),
+                f"已采集 {collected}/{max_views} 组同步视图。{self.selector.hint()}",
+            )
+            if self.selector.targets_met(min_views):
+                break
+        return collected
+
+    @staticmethod
+    def _consistent_order(corners_list: Sequence[np.ndarray]) -> bool:
+        """
+        检查各摄像头中角点的排列方向是否一致
+
+        对称的棋盘格在不同摄像头中可能被按相差180度的顺序检测出来，这样的一组视图
+        会让外参求解错误。以参考摄像头中第一个到最后一个角点的方向为准，
+        其他摄像头中方向相反的视图不采用（假设各摄像头之间没有超过90度的相对旋转）
+        """
+        reference = corners_list[0].reshape(-1, 2)
+        direction = reference[-1] - reference[0]
+        for corners in corners_list[1:]:
+            points = corners.reshape(-1, 2)
+            if float(np.dot(points[-1] - points[0], direction)) <= 0:
+                return False
+        return True
+
+    def _intrinsics(self, index: int, known: Optional[CalibrationResults]) -> CalibrationResults:
+        """已有单目标定结果时直接使用，否则用采集到的视图求解"""
+        if known is not None:
+            return known
+        rms, camera_matrix, dist_coeffs, rvecs, tvecs = cv2.calibrateCamera(
+            self.object_points, self.image_points[index], self.image_size, None, None
+        )
+        return CalibrationResults(
+            camera_matrix=camera_matrix,
+            dist_coeffs=dist_coeffs,
+            rvecs=rvecs,
+            tvecs=tvecs,
+            reprojection_error=float(rms),
+            calibration_images=len(self.object_points),
+            chessboard_size=list(self.chessboard_size),
+            image_size=list(self.image_size),
+            fov=list(self.detectors[index]._calculate_fov_from_intrinsics(camera_matrix)),
+        )
+
+    def calibrate(
+        self,
+        intrinsics: Optional[Dict[str, CalibrationResults]] = None,
+        min_views: int = 15,
+        fix_intrinsics: bool = True,
+        alpha: float = 0.0,
+    ) -> StereoResults:
+        """
+        求解外参和校正参数
+
+        intrinsics: 已有的单目标定结果（按摄像头名称），缺少的摄像头用同步视图求解
+        fix_intrinsics: 为True时固定内参只求外参，否则以内参为初值联合优化
+        alpha: stereoRectify的缩放参数，0只保留有效像素，1保留全部像素
+        """
+        views = len(self.object_points)
+        if views < min_views:
+            raise ValueError(f"同步视图数量不足，需要至少 {min_views} 组，当前只有 {views} 组")
+        intrinsics = intrinsics or {}
+
+        # 各摄像头的内参互不依赖，并行求解
+        futures = [
+            self._executor.submit(self._intrinsics, i, intrinsics.get(camera_id))
+            for i, camera_id in enumerate(self.camera_ids)
+        ]
+        solved = {camera_id: f.result() for camera_id, f in zip(self.camera_ids, futures)}
+
+        flags = cv2.CALIB_FIX_INTRINSIC if fix_intrinsics else cv2.CALIB_USE_INTRINSIC_GUESS
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-6)
+        reference_id = self.camera_ids[0]
+        reference = solved[reference_id]
+        pairs = []
+        for i, camera_id in enumerate(self.camera_ids[1:], start=1):
+            other = solved[camera_id]
+            rms, K1, d1, K2, d2, R, T, E, F = cv2.stereoCalibrate(
+                self.object_points,
+                self.image_points[0],
+                self.image_points[i],
+                reference.camera_matrix.copy(),
+                reference.dist_coeffs.copy(),
+                other.camera_matrix.copy(),
+                other.dist_coeffs.copy(),
+                self.image_size,
+                criteria=criteria,
+                flags=flags,
+            )[:9]
+            R1, R2, P1, P2, Q, _, _ = cv2.stereoRectify(
+                K1, d1, K2, d2, self.image_size, R, T, alpha=alpha
+            )
+            maps = (
+                cv2.initUndistortRectifyMap(K1, d1, R1, P1, self.image_size, cv2.CV_16SC2),
+                cv2.initUndistortRectifyMap(K2, d2, R2, P2, self.image_size, cv2.CV_16SC2),
+            )
+            pairs.append(
+                StereoPair(reference_id, camera_id, R, T, E, F, float(rms), R1, R2, P1, P2, Q, maps)
+            )
+            print(
+                f"外参 {reference_id}->{camera_id}: 重投影误差 {rms:.4f}, "
+                f"基线 {np.linalg.norm(T):.4f}"
+            )
+
+        return StereoResults(
+            camera_ids=self.camera_ids,
+            intrinsics=solved,
+            pairs=pairs,
+            views=views,
+            image_size=list(self.image_size),
+            chessboard_size=list(self.chessboard_size),
+            max_skew=max(self.skews) if self.skews else 0.0,
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "camera_ids": self.camera_ids,
+            "views": len(self.object_points),
+            "matched_frames": self.matched_frames,
+            "dropped_frames": self.dropped_frames,
+            "flipped_views": self.flipped_views,
+            "max_skew": round(max(self.skews), 4) if self.skews else None,
+        }
+
+
+def rectify_pair(pair: StereoPair, frames: Sequence[np.ndarray]) -> List[np.ndarray]:
+    """用校正映射表对一对图像做极线校正"""
+    return [
+        cv2.remap(frame, map1, map2, cv2.INTER_LINEAR)
+        for frame, (map1, map2) in zip(frames, pair.maps)
+    ]
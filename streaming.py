@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import itertools
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from capture import CameraCapture
+from metrics import stage_timer
+
+
+def make_mjpeg_chunk(jpeg: bytes) -> bytes:
+    """把JPEG数据包装成multipart/x-mixed-replace的一个分块"""
+    return b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+
+
+def normalize_stream_setting(
+    max_width: Optional[int], max_height: Optional[int], quality: int
+) -> Tuple[Optional[int], Optional[int], int]:
+    """
+    把客户端请求的尺寸和质量归整到有限的档位
+
+    尺寸取16的倍数（至少64），质量取5的倍数（10-95），
+    相近的请求共用同一个编码器，而不是每个客户端各编码一份
+    """
+    def snap(value: Optional[int]) -> Optional[int]:
+        if not value or value <= 0:
+            return None
+        return max(int(value) // 16 * 16, 64)
+
+    quality = min(max(int(round(quality / 5)) * 5, 10), 95)
+    return snap(max_width), snap(max_height), quality
+
+
+def fit_size(
+    frame_size: Tuple[int, int], max_width: Optional[int], max_height: Optional[int]
+) -> Optional[Tuple[int, int]]:
+    """保持宽高比缩小到max_width x max_height以内，不需要缩小时返回None"""
+    width, height = frame_size
+    scale = min(
+        max_width / width if max_width else 1.0,
+        max_height / height if max_height else 1.0,
+    )
+    if scale >= 1.0:
+        return None
+    return max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)
+
+
+class RateMeter:
+    """按约1秒的窗口统计事件速率"""
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+        self.total = 0
+        self.rate = 0.0
+        self._count = 0
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def mark(self, n: int = 1):
+        with self._lock:
+            self.total += n
+            self._count += n
+            self._roll(time.monotonic())
+
+    def _roll(self, now: float):
+        elapsed = now - self._start
+        if elapsed >= self.window:
+            self.rate = self._count / elapsed
+            self._count = 0
+            self._start = now
+
+    def get_rate(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._roll(now)
+            # 窗口内长时间没有事件时速率应归零
+            if now - self._start >= 2 * self.window:
+                self.rate = 0.0
+            return self.rate
+
+
+class MjpegBroadcaster:
+    """
+    编码一次、分发给所有客户端的MJPEG广播器
+
+    每一帧只做一次叠加绘制和JPEG编码，所有订阅者共享同一个bytes分块。
+    max_width/max_height给出时先缩小再编码，不同尺寸和质量各用一个广播器。
+    订阅者只取最新的分块，处理慢的客户端会跳过中间帧而不会拖慢其他客户端。
+    threaded=True时在独立的工作线程中编码；否则由第一个需要新帧的订阅者编码。
+    subscribe_async()供asyncio使用：等待新分块时不占用线程池，也不按固定间隔休眠。
+    """
+
+    def __init__(
+        self,
+        capture: CameraCapture,
+        overlay: Optional[Callable[[np.ndarray, int], np.ndarray]] = None,
+        quality: int = 80,
+        threaded: bool = True,
+        max_width: Optional[int] = None,
+        max_height: Optional[int] = None,
+    ):
+        self.capture = capture
+        self.overlay = overlay
+        self.quality = quality
+        self.threaded = threaded
+        self.max_width = max_width
+        self.max_height = max_height
+        self._scaled: Optional[np.ndarray] = None  # 缩小后的帧，每帧复用
+        self.encode_meter = RateMeter()
+        self.serve_meter = RateMeter()
+        self.dropped_frames = 0
+        self._chunk: Optional[bytes] = None
+        self._chunk_seq = 0
+        self._frame_seq = 0
+        self._subscribers = 0
+        self._idle_since = time.monotonic()  # 最后一个订阅者离开（或创建）的时间
+        self._client_meters: Dict[int, RateMeter] = {}  # 客户端编号 -> 帧率统计
+        self._client_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._encode_lock = threading.Lock()
+        # 异步订阅者的(事件循环, 事件)，新分块发布时跨线程唤醒
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动编码工作线程（threaded=False时无需启动）"""
+        if self.threaded and not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._encode_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+            self._wake_async_waiters()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _encode_loop(self):
+        while self._running:
+            with self._cond:
+                # 没有订阅者时不编码
+                self._cond.wait_for(
+                    lambda: self._subscribers > 0 or not self._running, timeout=1.0
+                )
+                if not self._running or self._subscribers == 0:
+                    continue
+            try:
+                self._encode_next()
+            except Exception as e:
+                print(f"生成视频帧时出错: {e}")
+                time.sleep(1)
+
+    def _encode_next(self) -> bool:
+        """等待采集线程的新帧并编码，成功时发布新的分块"""
+        seq, frame = self.capture.wait_frame(self._frame_seq)
+        if frame is None:
+            return False
+        self._frame_seq = seq
+        if self.overlay is not None:
+            with stage_timer("overlay"):
+                frame = self.overlay(frame, seq)
+        size = fit_size((frame.shape[1], frame.shape[0]), self.max_width, self.max_height)
+        if size is not None:
+            with stage_timer("resize"):
+                if self._scaled is None or self._scaled.shape[:2] != (size[1], size[0]):
+                    self._scaled = np.empty((size[1], size[0]) + frame.shape[2:], frame.dtype)
+                frame = cv2.resize(frame, size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+        with stage_timer("encode"):
+            ok, buffer = cv2.imencode(
+                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+            )
+        if not ok:
+            return False
+        chunk = make_mjpeg_chunk(buffer.tobytes())
+        self.encode_meter.mark()
+        with self._cond:
+            self._chunk = chunk
+            self._chunk_seq = seq
+            self._cond.notify_all()
+            self._wake_async_waiters()
+        return True
+
+    def _wake_async_waiters(self):
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                self._async_waiters.discard((loop, event))
+
+    def _next_chunk(self, after_seq: int) -> Tuple[int, Optional[bytes]]:
+        """返回比after_seq更新的分块"""
+        if not self.threaded:
+            with self._encode_lock:
+                # 其他订阅者可能已经编码了这一帧
+                if self._chunk_seq <= after_seq:
+                    self._encode_next()
+            return self._chunk_seq, self._chunk if self._chunk_seq > after_seq else None
+
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._chunk_seq > after_seq or not self._running,
+                timeout=self.capture.read_timeout,
+            )
+            if self._chunk_seq <= after_seq:
+                return self._chunk_seq, None
+            return self._chunk_seq, self._chunk
+
+    def _add_subscriber(self) -> RateMeter:
+        """登记订阅者，返回它自己的帧率统计"""
+        meter = RateMeter()
+        with self._cond:
+            self._subscribers += 1
+            self._client_meters[next(self._client_ids)] = meter
+            self._cond.notify_all()
+        return meter
+
+    def _remove_subscriber(self, meter: RateMeter):
+        with self._cond:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._idle_since = time.monotonic()
+            for client_id, value in list(self._client_meters.items()):
+                if value is meter:
+                    del self._client_meters[client_id]
+
+    def idle_seconds(self) -> float:
+        """没有订阅者的持续时间，有订阅者时为0"""
+        with self._cond:
+            if self._subscribers:
+                return 0.0
+            return time.monotonic() - self._idle_since
+
+    def _count_served(self, last_seq: int, seq: int, meter: RateMeter, count_drops: bool = True):
+        # 限制了帧率的客户端是主动跳帧，不计入丢帧
+        if count_drops and last_seq and seq - last_seq > 1:
+            with self._cond:
+                self.dropped_frames += seq - last_seq - 1
+        self.serve_meter.mark()
+        meter.mark()
+
+    def client_rates(self) -> Dict[int, float]:
+        """每个客户端实际收到的帧率"""
+        with self._cond:
+            meters = dict(self._client_meters)
+        return {client_id: round(meter.get_rate(), 2) for client_id, meter in meters.items()}
+
+    def subscribe(self) -> Iterator[bytes]:
+        """同步订阅，逐个产出multipart分块"""
+        meter = self._add_subscriber()
+        last_seq = self._chunk_seq
+        try:
+            while True:
+                seq, chunk = self._next_chunk(last_seq)
+                if chunk is None:
+                    # 广播器已停止时_next_chunk不再等待，结束订阅而不是空转
+                    if self.threaded and not self._running:
+                        return
+                    continue
+                self._count_served(last_seq, seq, meter)
+                last_seq = seq
+                yield chunk
+        finally:
+            self._remove_subscriber(meter)
+
+    async def subscribe_async(self, max_fps: Optional[float] = None) -> AsyncIterator[bytes]:
+        """
+        异步订阅，逐个产出multipart分块
+
+        需要threaded=True的广播器。调用方await发送完上一个分块后
+        才会取下一个分块，发送慢时直接跳到最新分块，实现背压。
+        max_fps给出时两个分块之间至少间隔1/max_fps秒，其间的帧跳过。
+        """
+        if not self.threaded:
+            raise RuntimeError("异步订阅需要在工作线程中编码的广播器")
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        _, event = waiter
+        with self._cond:
+            self._async_waiters.add(waiter)
+        meter = self._add_subscriber()
+        last_seq = self._chunk_seq
+        interval = 1.0 / max_fps if max_fps else 0.0
+        next_time = 0.0
+        try:
+            while self._running:
+                if interval:
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                event.clear()
+                with self._cond:
+                    seq, chunk = self._chunk_seq, self._chunk
+                if seq <= last_seq or chunk is None:
+                    await event.wait()
+                    continue
+                self._count_served(last_seq, seq, meter, count_drops=not interval)
+                last_seq = seq
+                next_time = max(next_time + interval, time.monotonic() - interval)
+                yield chunk
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+            self._remove_subscriber(meter)
+
+    def stats(self) -> Dict[str, float]:
+        """编码次数与分发次数的统计"""
+        encodes = self.encode_meter.get_rate()
+        served = self.serve_meter.get_rate()
+        return {
+            "clients": self._subscribers,
+            "encodes_per_sec": round(encodes, 2),
+            "chunks_served_per_sec": round(served, 2),
+            "served_per_encode": round(served / encodes, 2) if encodes else 0.0,
+            "total_encodes": self.encode_meter.total,
+            "total_served": self.serve_meter.total,
+            "dropped_frames": self.dropped_frames,
+            "client_fps": self.client_rates(),
+        }
+
+
+class AdaptiveQuality:
+    """
+    按客户端socket的排空速度在画质档位之间升降
+
+    每个档位为(尺寸比例, JPEG质量, 帧率比例)。按window秒的窗口统计发送阻塞时间
+    占比：超过high说明链路已饱和，此时的发送速率即链路容量，降一档；
+    低于low且更高一档的码率（该档实测的分块大小 x 帧率）在容量的headroom以内时升一档。
+    socket缓冲区会吸收突发，单个分块的发送耗时不可靠，所以按窗口判断。
+    """
+
+    LEVELS: List[Tuple[float, int, float]] = [
+        (1.0, 80, 1.0),
+        (1.0, 60, 1.0),
+        (0.75, 60, 1.0),
+        (0.5, 60, 1.0),
+        (0.5, 40, 0.5),
+        (0.25, 40, 0.5),
+        (0.25, 30, 0.25),
+    ]
+
+    def __init__(
+        self,
+        max_fps: float = 30.0,
+        window: float = 2.0,
+        high: float = 0.8,
+        low: float = 0.3,
+        headroom: float = 0.7,
+    ):
+        self.max_fps = max_fps
+        self.window = window
+        self.high = high
+        self.low = low
+        self.headroom = headroom
+        self.level = 0
+        self.capacity: Optional[float] = None  # 估计的链路容量（字节/秒）
+        self._chunk_bytes: Dict[int, float] = {}  # 档位 -> 平均分块大小
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._sent_bytes = 0
+        self._send_seconds = 0.0
+
+    def setting(self, level: Optional[int] = None) -> Tuple[float, int, float]:
+        """某一档位（默认当前档位）的(尺寸比例, JPEG质量, 帧率)"""
+        scale, quality, fps_factor = self.LEVELS[self.level if level is None else level]
+        return scale, quality, self.max_fps * fps_factor
+
+    def update(self, chunk_bytes: int, send_seconds: float) -> bool:
+        """记录一个分块的大小和发送耗时，档位变化时返回True"""
+        average = self._chunk_bytes.get(self.level, chunk_bytes)
+        self._chunk_bytes[self.level] = average + 0.1 * (chunk_bytes - average)
+        self._sent_bytes += chunk_bytes
+        self._send_seconds += send_seconds
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < self.window:
+            return False
+        busy = self._send_seconds / elapsed
+        throughput = self._sent_bytes / elapsed
+        self._reset_window()
+
+        if busy > self.high:
+            self.capacity = throughput
+            if self.level < len(self.LEVELS) - 1:
+                self.level += 1
+                return True
+        elif busy < self.low and self.level > 0:
+            upper = self.level - 1
+            demand = self._chunk_bytes.get(upper, 2 * self._chunk_bytes[self.level])
+            demand *= self.setting(upper)[2]
+            if self.capacity is None or demand < self.headroom * self.capacity:
+                self.level = upper
+                return True
+            # 链路可能变快了，逐步放宽容量估计以便试探
+            self.capacity *= 1.1
+        return False
+
+
+async def adaptive_stream(
+    get_broadcaster: Callable[[float, int], MjpegBroadcaster],
+    controller: AdaptiveQuality,
+) -> AsyncIterator[bytes]:
+    """
+    自适应视频流：按controller的档位订阅对应尺寸和质量的共享广播器，
+    档位变化时切换到另一个广播器（同一档位的客户端共用编码结果）
+
+    get_broadcaster(尺寸比例, 质量)返回对应的广播器，取不到时抛出ValueError；
+    只有第一次订阅失败时异常会传给调用方，切换档位失败时留在当前档位。
+    调用方await发送完成才会回到这里，因此yield前后的耗时就是socket排空一个分块的时间
+    """
+    scale, quality, _ = controller.setting()
+    broadcaster = get_broadcaster(scale, quality)
+    while True:
+        level = controller.level
+        stream = broadcaster.subscribe_async(max_fps=controller.setting()[2])
+        switched = False
+        try:
+            async for chunk in stream:
+                start = time.perf_counter()
+                yield chunk
+                if controller.update(len(chunk), time.perf_counter() - start):
+                    switched = True
+                    break
+        finally:
+            await stream.aclose()
+        if not switched:
+            return
+        scale, quality, _ = controller.setting()
+        try:
+            broadcaster = get_broadcaster(scale, quality)
+        except ValueError as e:
+            # 规格数达到上限或相机不可用，响应已经开始，不能中断，继续使用当前档位
+            print(f"切换视频流档位失败，保持当前档位: {e}")
+            controller.level = level
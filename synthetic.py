@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from sources import FrameRateLimiter
+from targets import TargetSpec, create_target, object_template
+
+# 失真映射表缓存：(内参, 畸变, 尺寸) -> (map_x, map_y)
+_distort_maps: Dict[bytes, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def default_camera_matrix(image_size: Tuple[int, int], fov_deg: float = 60.0) -> np.ndarray:
+    """按水平视场角构造一个主点在图像中心的相机内参矩阵"""
+    width, height = image_size
+    f = width / (2 * np.tan(np.radians(fov_deg) / 2))
+    return np.array(
+        [[f, 0, (width - 1) / 2], [0, f, (height - 1) / 2], [0, 0, 1]], np.float64
+    )
+
+
+def board_object_points(pattern_size: Tuple[int, int], square_size: float) -> np.ndarray:
+    """棋盘格内角点的3D坐标（z=0平面），顺序与findChessboardCorners一致"""
+    cols, rows = pattern_size
+    objp = np.zeros((cols * rows, 3), np.float32)
+    objp[:, :2] = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2)
+    return objp * square_size
+
+
+def fronto_parallel_pose(
+    pattern_size: Tuple[int, int],
+    square_size: float,
+    camera_matrix: np.ndarray,
+    image_size: Tuple[int, int],
+    fill: float = 0.5,
+    tilt_deg: Tuple[float, float] = (0.0, 0.0),
+    offset: Tuple[float, float] = (0.0, 0.0),
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    生成棋盘格位于视野中心附近的位姿
+
+    fill: 棋盘格宽度占图像宽度的比例
+    tilt_deg: 绕x轴、y轴的倾斜角（度）
+    offset: 棋盘格中心相对图像中心的偏移，单位为图像宽/高的比例
+    """
+    cols, rows = pattern_size
+    board_w = (cols + 1) * square_size
+    fx = camera_matrix[0, 0]
+    z = fx * board_w / (fill * image_size[0])
+
+    rx, ry = np.radians(tilt_deg)
+    rot_x = np.array([[1, 0, 0], [0, np.cos(rx), -np.sin(rx)], [0, np.sin(rx), np.cos(rx)]])
+    rot_y = np.array([[np.cos(ry), 0, np.sin(ry)], [0, 1, 0], [-np.sin(ry), 0, np.cos(ry)]])
+    rot = rot_y @ rot_x
+
+    # 让棋盘格中心落在指定位置
+    center_board = np.array([(cols - 1) * square_size / 2, (rows - 1) * square_size / 2, 0])
+    center_cam = np.array(
+        [
+            offset[0] * image_size[0] * z / fx,
+            offset[1] * image_size[1] * z / camera_matrix[1, 1],
+            z,
+        ]
+    )
+    tvec = center_cam - rot @ center_board
+    rvec, _ = cv2.Rodrigues(rot)
+    return rvec.reshape(3), tvec.reshape(3)
+
+
+def random_pose(
+    pattern_size: Tuple[int, int],
+    square_size: float,
+    camera_matrix: np.ndarray,
+    image_size: Tuple[int, int],
+    rng: np.random.Generator,
+    fill_range: Tuple[float, float] = (0.3, 0.6),
+    max_tilt_deg: float = 30.0,
+    max_offset: float = 0.25,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """随机生成一个棋盘格完整可见的位姿（大小、倾斜和位置在给定范围内均匀分布）"""
+    return fronto_parallel_pose(
+        pattern_size,
+        square_size,
+        camera_matrix,
+        image_size,
+        fill=rng.uniform(*fill_range),
+        tilt_deg=tuple(rng.uniform(-max_tilt_deg, max_tilt_deg, 2)),
+        offset=tuple(rng.uniform(-max_offset, max_offset, 2)),
+    )
+
+
+def _distortion_maps(
+    camera_matrix: np.ndarray, dist_coeffs: np.ndarray, image_size: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """失真图像每个像素在无畸变图像中的坐标，用于cv2.remap"""
+    key = (
+        np.asarray(camera_matrix, np.float64).tobytes()
+        + np.asarray(dist_coeffs, np.float64).tobytes()
+        + np.array(image_size, np.int64).tobytes()
+    )
+    maps = _distort_maps.get(key)
+    if maps is None:
+        width, height = image_size
+        grid = np.stack(np.meshgrid(np.arange(width), np.arange(height)), axis=-1)
+        points = grid.reshape(-1, 1, 2).astype(np.float64)
+        undistorted = cv2.undistortPoints(
+            points, camera_matrix, dist_coeffs, P=camera_matrix
+        ).reshape(height, width, 2)
+        maps = (
+            undistorted[..., 0].astype(np.float32),
+            undistorted[..., 1].astype(np.float32),
+        )
+        _distort_maps[key] = maps
+    return maps
+
+
+def pose_pattern_size(pattern_size: Tuple[int, int], target: Optional[TargetSpec] = None):
+    """生成位姿时使用的棋盘格尺寸，非对称圆点阵列的宽度约为列数的两倍"""
+    if target is not None and target.kind == "asymmetric_circles":
+        return 2 * pattern_size[0], pattern_size[1]
+    return tuple(pattern_size)
+
+
+def _board_texture(
+    pattern_size: Tuple[int, int], px_per_square: int, target: Optional[TargetSpec] = None
+) -> np.ndarray:
+    """带一圈白边的标定板纹理，第一个角点（圆心）位于(2, 2)个方格处"""
+    cols, rows = pattern_size
+    kind = target.kind if target is not None else "chessboard"
+    if kind in ("circles", "asymmetric_circles"):
+        points = object_template((cols, rows, 1.0), kind)[:, :2]
+        width, height = ((points.max(axis=0) + 4) * px_per_square).astype(int)
+        texture = np.full((height, width), 255, np.uint8)
+        # 像素中心位于整数坐标+0.5处，按1/16像素精度绘制
+        for x, y in ((points + 2) * px_per_square - 0.5) * 16:
+            cv2.circle(
+                texture, (int(round(x)), int(round(y))), int(0.3 * px_per_square * 16),
+                0, -1, cv2.LINE_AA, shift=4,
+            )
+        return texture
+    if kind == "charuco":
+        board = create_target((cols, rows, 1.0), target).board
+        image = board.generateImage(
+            ((cols + 1) * px_per_square, (rows + 1) * px_per_square), marginSize=0
+        )
+        margin = px_per_square
+        return cv2.copyMakeBorder(
+            image, margin, margin, margin, margin, cv2.BORDER_CONSTANT, value=255
+        )
+    squares = np.indices((rows + 1, cols + 1)).sum(axis=0) % 2
+    board = np.kron(1 - squares, np.ones((px_per_square, px_per_square))) * 255
+    margin = px_per_square
+    texture = np.full(
+        (board.shape[0] + 2 * margin, board.shape[1] + 2 * margin), 255, np.uint8
+    )
+    texture[margin:-margin, margin:-margin] = board
+    return texture
+
+
+def render_chessboard(
+    pattern_size: Tuple[int, int],
+    image_size: Tuple[int, int],
+    camera_matrix: np.ndarray,
+    rvec: np.ndarray,
+    tvec: np.ndarray,
+    square_size: float = 1.0,
+    noise_sigma: float = 0.0,
+    blur_sigma: float = 0.0,
+    background: int = 128,
+    px_per_square: int = 32,
+    rng: Optional[np.random.Generator] = None,
+    dist_coeffs: Optional[np.ndarray] = None,
+    target: Optional[TargetSpec] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按给定位姿渲染一张棋盘格（或target指定的其他标定板）BGR图像
+
+    给出dist_coeffs时先渲染无畸变图像，再按畸变模型重映射
+    返回(图像, 真实内角点坐标(N, 1, 2))，顺序与标定板模板一致
+    """
+    width, height = image_size
+    texture = _board_texture(pattern_size, px_per_square, target)
+
+    # 纹理像素坐标 -> 棋盘格平面坐标（米） -> 图像坐标
+    s = square_size / px_per_square
+    origin = 2 * px_per_square  # 第一个内角点所在的纹理坐标
+    texture_to_board = np.array([[s, 0, -origin * s], [0, s, -origin * s], [0, 0, 1]])
+    rot, _ = cv2.Rodrigues(np.asarray(rvec, np.float64))
+    board_to_image = camera_matrix @ np.column_stack(
+        [rot[:, 0], rot[:, 1], np.asarray(tvec, np.float64).reshape(3)]
+    )
+    # 纹理像素中心位于整数坐标+0.5处
+    half = np.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]])
+    homography = board_to_image @ texture_to_board @ np.linalg.inv(half)
+
+    gray = cv2.warpPerspective(
+        texture,
+        homography,
+        (width, height),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=background,
+    )
+    if dist_coeffs is not None and np.any(dist_coeffs):
+        map_x, map_y = _distortion_maps(camera_matrix, dist_coeffs, image_size)
+        gray = cv2.remap(
+            gray, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=background
+        )
+    if blur_sigma > 0:
+        gray = cv2.GaussianBlur(gray, (0, 0), blur_sigma)
+    if noise_sigma > 0:
+        rng = rng or np.random.default_rng()
+        noisy = gray.astype(np.float32) + rng.normal(0, noise_sigma, gray.shape)
+        gray = np.clip(noisy, 0, 255).astype(np.uint8)
+
+    kind = target.kind if target is not None else "chessboard"
+    objp = object_template((*pattern_size, square_size), kind).astype(np.float64)
+    corners, _ = cv2.projectPoints(objp, rvec, tvec, camera_matrix, dist_coeffs)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), corners.astype(np.float32)
+
+
+def render_empty(image_size: Tuple[int, int], seed: int = 0) -> np.ndarray:
+    """渲染不含棋盘格的杂乱背景图像，用于测量未检测到棋盘格时的耗时"""
+    rng = np.random.default_rng(seed)
+    width, height = image_size
+    small = rng.integers(0, 255, (max(height // 32, 2), max(width // 32, 2)), np.uint8)
+    gray = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def render_sequence(
+    pattern_size: Tuple[int, int],
+    image_size: Tuple[int, int],
+    camera_matrix: np.ndarray,
+    poses: int,
+    square_size: float = 0.025,
+    dist_coeffs: Optional[np.ndarray] = None,
+    hold: int = 3,
+    noise_sigma: float = 1.0,
+    blur_sigma: float = 0.5,
+    seed: int = 0,
+    target: Optional[TargetSpec] = None,
+) -> List[np.ndarray]:
+    """
+    渲染一段标定视频：poses个随机位姿，每个位姿保持hold帧（模拟手持停顿）
+
+    同一位姿的各帧噪声不同，固定seed时结果可复现
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(poses):
+        rvec, tvec = random_pose(
+            pose_pattern_size(pattern_size, target), square_size, camera_matrix, image_size, rng
+        )
+        for _ in range(hold):
+            frame, _ = render_chessboard(
+                pattern_size,
+                image_size,
+                camera_matrix,
+                rvec,
+                tvec,
+                square_size,
+                noise_sigma=noise_sigma,
+                blur_sigma=blur_sigma,
+                rng=rng,
+                dist_coeffs=dist_coeffs,
+                target=target,
+            )
+            frames.append(frame)
+    return frames
+
+
+class FakeVideoCapture:
+    """
+    与cv2.VideoCapture接口兼容的合成摄像头
+
+    按顺序返回预先渲染的帧，loop为True时循环播放；给出fps时按帧率节流，
+    模拟实时摄像头，否则读取不等待（测量纯处理吞吐）
+    """
+
+    def __init__(self, frames: Sequence[np.ndarray], fps: Optional[float] = None, loop: bool = True):
+        if not frames:
+            raise ValueError("至少需要一帧")
+        self.frames = list(frames)
+        self.fps = fps
+        self.loop = loop
+        self.index = 0
+        self._opened = True
+        self.limiter = FrameRateLimiter(fps)
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened or (not self.loop and self.index >= len(self.frames)):
+            return False, None
+        self.limiter.wait()
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def set(self, prop_id: int, value: Any) -> bool:
+        return False
+
+    def get(self, prop_id: int) -> float:
+        height, width = self.frames[0].shape[:2]
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(height)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.frames))
+        return 0.0
+
+    def release(self):
+        self._opened = False
+
+
+class SyntheticCamera:
+    """
+    实时生成棋盘格画面的合成摄像头，用于在没有摄像头的机器上运行服务和压测
+
+    每个随机位姿保持hold帧（模拟手持停顿）后换到下一个位姿，
+    只缓存当前位姿的一帧，内存占用与运行时长无关。与cv2.VideoCapture接口兼容。
+    """
+
+    def __init__(
+        self,
+        image_size: Tuple[int, int] = (640, 480),
+        pattern_size: Tuple[int, int] = (9, 6),
+        fps: Optional[float] = 30.0,
+        hold: Optional[int] = None,
+        square_size: float = 0.025,
+        dist_coeffs: Optional[np.ndarray] = None,
+        noise_sigma: float = 1.0,
+        blur_sigma: float = 0.5,
+        seed: int = 0,
+    ):
+        self.image_size = tuple(int(v) for v in image_size)
+        self.pattern_size = tuple(pattern_size)
+        self.square_size = square_size
+        self.camera_matrix = default_camera_matrix(self.image_size)
+        # 默认带轻微的桶形畸变，去畸变视频流才有意义
+        self.dist_coeffs = (
+            np.array([-0.1, 0.02, 0.0, 0.0, 0.0]) if dist_coeffs is None else dist_coeffs
+        )
+        self.noise_sigma = noise_sigma
+        self.blur_sigma = blur_sigma
+        # 默认每个位姿停留约半秒
+        self.hold = hold or max(int(round((fps or 30.0) / 2)), 2)
+        self.limiter = FrameRateLimiter(fps)
+        self.fps = fps
+        self.frame_count = 0
+        self._rng = np.random.default_rng(seed)
+        self._frame: Optional[np.ndarray] = None
+        self._opened = True
+
+    def _render_next_pose(self):
+        rvec, tvec = random_pose(
+            self.pattern_size, self.square_size, self.camera_matrix, self.image_size, self._rng
+        )
+        self._frame, _ = render_chessboard(
+            self.pattern_size,
+            self.image_size,
+            self.camera_matrix,
+            rvec,
+            tvec,
+            self.square_size,
+            noise_sigma=self.noise_sigma,
+            blur_sigma=self.blur_sigma,
+            rng=self._rng,
+            dist_coeffs=self.dist_coeffs,
+        )
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened:
+            return False, None
+        self.limiter.wait()
+        if self._frame is None or self.frame_count % self.hold == 0:
+            self._render_next_pose()
+        self.frame_count += 1
+        if image is not None and image.shape == self._frame.shape:
+            np.copyto(image, self._frame)
+            return True, image
+        return True, self._frame.copy()
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def set(self, prop_id: int, value: Any) -> bool:
+        return False
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.image_size[0])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.image_size[1])
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        return 0.0
+
+    def release(self):
+        self._opened = False
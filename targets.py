@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# (是否检测到, 角点(N, 1, 2) float32, 角点编号(N,) int32或None)
+TargetResult = Tuple[bool, Optional[np.ndarray], Optional[np.ndarray]]
+
+# 部分可见的视图至少需要的角点数，太少时单应初始化不稳定
+MIN_PARTIAL_POINTS = 8
+
+
+@dataclass(frozen=True)
+class TargetSpec:
+    """
+    标定板类型及其附加参数
+
+    可哈希，作为检测配置的一部分传给检测后端的工作者。棋盘格尺寸(列, 行, 边长)
+    对棋盘格和ChArUco是内角点数，对圆点阵列是每行、每列的圆点数。
+    """
+
+    kind: str = "chessboard"  # chessboard、charuco、circles或asymmetric_circles
+    marker_ratio: float = 0.75  # ChArUco标记边长与方格边长之比
+    dictionary: str = "DICT_5X5_250"  # ChArUco使用的ArUco字典（cv2.aruco.DICT_*）
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "TargetSpec":
+        return cls(**data) if data else cls()
+
+
+def object_template(chessboard_size: Sequence[Any], kind: str = "chessboard") -> np.ndarray:
+    """
+    标定板特征点的3D坐标模板(N, 3)，按行优先排列，角点编号即下标
+
+    非对称圆点阵列的奇数行错开半个间距，与OpenCV示例的约定一致
+    """
+    cols, rows, square_size = chessboard_size
+    grid = np.mgrid[0:cols, 0:rows].T.reshape(-1, 2)
+    if kind == "asymmetric_circles":
+        grid[:, 0] = 2 * grid[:, 0] + grid[:, 1] % 2
+    template = np.zeros((cols * rows, 3), np.float32)
+    template[:, :2] = grid * square_size
+    return template
+
+
+class TargetDetector:
+    """
+    标定板检测器接口
+
+    detect()接收预处理后的灰度图，返回(是否检测到, 角点, 角点编号)。编号为None时
+    检测到的是完整的标定板，角点与object_points一一对应；否则只检测到其中一部分
+    （partial为True的检测器），编号是角点在object_points中的下标。
+    检测器持有内部状态，同一实例不能被多个线程同时使用。
+    """
+
+    partial = False  # 是否接受部分可见的视图
+
+    def __init__(self, chessboard_size: Sequence[Any], spec: TargetSpec):
+        self.chessboard_size = tuple(chessboard_size)
+        self.spec = spec
+        objp = object_template(chessboard_size, spec.kind)
+        objp.setflags(write=False)
+        self.object_points = objp
+
+    def matches(self, chessboard_size: Sequence[Any], spec: TargetSpec) -> bool:
+        return self.chessboard_size == tuple(chessboard_size) and self.spec == spec
+
+    def detect(self, gray: np.ndarray) -> TargetResult:
+        raise NotImplementedError
+
+    def draw(self, frame: np.ndarray, corners: np.ndarray, ids: Optional[np.ndarray]):
+        cv2.drawChessboardCorners(frame, self.chessboard_size[:2], corners, True)
+
+
+# 标定板类型 -> 检测器类；棋盘格由CameraCalibrator内置的检测流程处理（ROI跟踪、粗检测缩放）
+TARGETS: Dict[str, Callable[[Sequence[Any], TargetSpec], TargetDetector]] = {}
+
+
+def register_target(kind: str):
+    """注册标定板检测器：@register_target("charuco")"""
+
+    def decorator(cls):
+        TARGETS[kind] = cls
+        return cls
+
+    return decorator
+
+
+def target_kinds() -> Tuple[str, ...]:
+    return ("chessboard",) + tuple(TARGETS)
+
+
+def create_target(chessboard_size: Sequence[Any], spec: TargetSpec) -> TargetDetector:
+    """按类型创建检测器，参数不合法时抛出ValueError"""
+    factory = TARGETS.get(spec.kind)
+    if factory is None:
+        raise ValueError(f"未知的标定板类型: {spec.kind}，可选: {', '.join(target_kinds())}")
+    return factory(chessboard_size, spec)
+
+
+@register_target("circles")
+class CirclesGridTarget(TargetDetector):
+    """对称圆点阵列（深色圆点、浅色背景），圆心由findCirclesGrid给出，不需要亚像素精细化"""
+
+    flags = cv2.CALIB_CB_SYMMETRIC_GRID
+
+    def __init__(self, chessboard_size: Sequence[Any], spec: TargetSpec):
+        super().__init__(chessboard_size, spec)
+        params = cv2.SimpleBlobDetector_Params()
+        # 默认的最大面积（5000像素）在高分辨率、标定板靠近镜头时会漏掉圆点
+        params.maxArea = 1e5
+        self.blob_detector = cv2.SimpleBlobDetector_create(params)
+
+    def detect(self, gray: np.ndarray) -> TargetResult:
+        found, centers = cv2.findCirclesGrid(
+            gray, self.chessboard_size[:2], flags=self.flags, blobDetector=self.blob_detector
+        )
+        if not found:
+            return False, None, None
+        return True, centers.reshape(-1, 1, 2).astype(np.float32), None
+
+
+@register_target("asymmetric_circles")
+class AsymmetricCirclesGridTarget(CirclesGridTarget):
+    """非对称圆点阵列，奇数行错开半个间距，不存在180度旋转的歧义"""
+
+    flags = cv2.CALIB_CB_ASYMMETRIC_GRID
+
+
+@register_target("charuco")
+class CharucoTarget(TargetDetector):
+    """
+    ChArUco标定板：白色方格中带ArUco标记的棋盘格
+
+    每个内角点都能由相邻的标记识别出编号，标定板部分出画或被遮挡时
+    仍可使用检测到的角点，适合广角镜头把标定板推到图像边缘采集
+    """
+
+    partial = True
+
+    def __init__(self, chessboard_size: Sequence[Any], spec: TargetSpec):
+        super().__init__(chessboard_size, spec)
+        cols, rows, square_size = self.chessboard_size
+        dictionary_id = getattr(cv2.aruco, spec.dictionary, None)
+        if not spec.dictionary.startswith("DICT_") or not isinstance(dictionary_id, int):
+            raise ValueError(f"未知的ArUco字典: {spec.dictionary}")
+        if not 0 < spec.marker_ratio < 1:
+            raise ValueError("标记边长与方格边长之比必须在(0, 1)之间")
+        dictionary = cv2.aruco.getPredefinedDictionary(dictionary_id)
+        # 方格数比内角点数多一，标记只放在一半的方格中
+        markers = (cols + 1) * (rows + 1) // 2
+        if markers > len(dictionary.bytesList):
+            raise ValueError(
+                f"{spec.dictionary} 只有 {len(dictionary.bytesList)} 个标记，"
+                f"{cols + 1}x{rows + 1} 的ChArUco标定板需要 {markers} 个"
+            )
+        self.board = cv2.aruco.CharucoBoard(
+            (cols + 1, rows + 1), square_size, square_size * spec.marker_ratio, dictionary
+        )
+        self.detector = cv2.aruco.CharucoDetector(self.board)
+        self.min_points = min(MIN_PARTIAL_POINTS, cols * rows)
+
+    def detect(self, gray: np.ndarray) -> TargetResult:
+        corners, ids, _, _ = self.detector.detectBoard(gray)
+        if ids is None or len(ids) < self.min_points:
+            return False, None, None
+        ids = ids.ravel().astype(np.int32)
+        # 所有角点在同一行或同一列时无法求单应，不能用于标定
+        cols = self.chessboard_size[0]
+        if len(np.unique(ids % cols)) < 2 or len(np.unique(ids // cols)) < 2:
+            return False, None, None
+        return True, corners.reshape(-1, 1, 2).astype(np.float32), ids
+
+    def draw(self, frame: np.ndarray, corners: np.ndarray, ids: Optional[np.ndarray]):
+        cv2.aruco.drawDetectedCornersCharuco(frame, corners, ids.reshape(-1, 1), (0, 255, 0))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from result_store import atomic_write
+
+MAP1_FILE = "undistort_map1.npy"
+MAP2_FILE = "undistort_map2.npy"
+META_FILE = "undistort.json"
+
+
+def intrinsics_key(
+    camera_matrix: np.ndarray, dist_coeffs: np.ndarray, image_size: Tuple[int, int], alpha: float
+) -> str:
+    """内参、图像尺寸和alpha的摘要，用来判断磁盘上的映射表是否过期"""
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(camera_matrix, np.float64).tobytes())
+    digest.update(np.ascontiguousarray(dist_coeffs, np.float64).ravel().tobytes())
+    digest.update(np.array([*image_size, alpha], np.float64).tobytes())
+    return digest.hexdigest()
+
+
+class UndistortMaps:
+    """
+    预先计算的去畸变映射表
+
+    用initUndistortRectifyMap生成CV_16SC2定点映射表（map1为整数坐标，
+    map2为插值表索引），之后每帧只需一次cv2.remap，不再像cv2.undistort
+    那样每次重新计算映射。映射表以.npy保存，加载时用内存映射，多个进程
+    可以共享同一份页缓存。
+    """
+
+    def __init__(
+        self,
+        map1: np.ndarray,
+        map2: np.ndarray,
+        new_camera_matrix: np.ndarray,
+        image_size: Tuple[int, int],
+        key: str,
+    ):
+        self.map1 = map1
+        self.map2 = map2
+        self.new_camera_matrix = new_camera_matrix
+        self.image_size = tuple(image_size)
+        self.key = key
+
+    @classmethod
+    def build(
+        cls,
+        camera_matrix: np.ndarray,
+        dist_coeffs: np.ndarray,
+        image_size: Tuple[int, int],
+        alpha: float = 0.0,
+    ) -> "UndistortMaps":
+        """
+        生成映射表
+
+        alpha: 0表示裁掉去畸变后的无效黑边，1表示保留全部原始像素
+        """
+        image_size = tuple(int(v) for v in image_size)
+        new_camera_matrix, _ = cv2.getOptimalNewCameraMatrix(
+            camera_matrix, dist_coeffs, image_size, alpha, image_size
+        )
+        map1, map2 = cv2.initUndistortRectifyMap(
+            camera_matrix, dist_coeffs, None, new_camera_matrix, image_size, cv2.CV_16SC2
+        )
+        key = intrinsics_key(camera_matrix, dist_coeffs, image_size, alpha)
+        return cls(map1, map2, new_camera_matrix, image_size, key)
+
+    def save(self, output_dir: Any):
+        """保存为.npy（可内存映射）和描述文件"""
+        output_dir = Path(output_dir)
+        # 原子替换而不是原地覆盖：已内存映射旧文件的UndistortMaps仍指向旧inode，
+        # 原地截断会让正在remap的读者收到SIGBUS
+        atomic_write(output_dir.joinpath(MAP1_FILE), lambda f: np.save(f, self.map1), "wb")
+        atomic_write(output_dir.joinpath(MAP2_FILE), lambda f: np.save(f, self.map2), "wb")
+        meta = {
+            "key": self.key,
+            "image_size": list(self.image_size),
+            "new_camera_matrix": self.new_camera_matrix.tolist(),
+            "map_type": "CV_16SC2",
+        }
+        # 描述文件最后写入，映射表写到一半时不会被当成有效缓存
+        atomic_write(output_dir.joinpath(META_FILE), lambda f: json.dump(meta, f, indent=2))
+
+    @classmethod
+    def load(cls, output_dir: Any, key: Optional[str] = None) -> Optional["UndistortMaps"]:
+        """内存映射加载缓存的映射表；不存在或key不一致时返回None"""
+        output_dir = Path(output_dir)
+        meta_path = output_dir.joinpath(META_FILE)
+        if not meta_path.exists():
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if key is not None and meta.get("key") != key:
+            return None
+        try:
+            map1 = np.load(output_dir.joinpath(MAP1_FILE), mmap_mode="r")
+            map2 = np.load(output_dir.joinpath(MAP2_FILE), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        width, height = meta["image_size"]
+        if map1.shape[:2] != (height, width) or map2.shape != (height, width):
+            return None
+        return cls(map1, map2, np.array(meta["new_camera_matrix"]), (width, height), meta["key"])
+
+    @classmethod
+    def load_or_build(
+        cls,
+        output_dir: Any,
+        camera_matrix: np.ndarray,
+        dist_coeffs: np.ndarray,
+        image_size: Tuple[int, int],
+        alpha: float = 0.0,
+    ) -> "UndistortMaps":
+        """优先使用磁盘缓存，内参变化时重新生成并写回缓存"""
+        key = intrinsics_key(camera_matrix, dist_coeffs, tuple(image_size), alpha)
+        maps = cls.load(output_dir, key)
+        if maps is None:
+            maps = cls.build(camera_matrix, dist_coeffs, image_size, alpha)
+            maps.save(output_dir)
+        return maps
+
+    def remap(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """对一帧去畸变，尺寸必须与标定时的图像尺寸一致"""
+        if (frame.shape[1], frame.shape[0]) != self.image_size:
+            raise ValueError(
+                f"图像尺寸 {frame.shape[1]}x{frame.shape[0]} 与标定尺寸 "
+                f"{self.image_size[0]}x{self.image_size[1]} 不一致"
+            )
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# 3x3粗分区对应的移动提示，按(行, 列)索引
+_REGION_HINTS = [
+    ["左上角", "上方", "右上角"],
+    ["左侧", "中间", "右侧"],
+    ["左下角", "下方", "右下角"],
+]
+
+
+@dataclass
+class ViewScore:
+    """候选视图的评分"""
+
+    accepted: bool
+    score: float
+    coverage_gain: float  # 新覆盖的网格比例
+    diversity: float  # 与已采用视图在位置/尺度/倾斜上的最小距离
+    features: np.ndarray  # (中心x, 中心y, 尺度, 左右倾斜, 上下倾斜)
+    reason: str = ""
+
+
+class ViewSelector:
+    """
+    基于覆盖率的关键帧选择
+
+    用网格记录棋盘格在图像上覆盖过的区域，并比较候选视图与已采用视图的
+    位置、尺度和倾斜。只有覆盖新的区域或姿态足够不同的稳定视图才会被采用，
+    覆盖率、倾斜和视图数都达标后即可提前结束采集。
+    """
+
+    def __init__(
+        self,
+        image_size: Tuple[int, int],
+        pattern_size: Tuple[int, int],
+        grid: Tuple[int, int] = (8, 6),
+        coverage_target: float = 0.7,
+        tilt_target: float = 0.12,
+        scale_range_target: float = 0.15,
+        min_diversity: float = 0.12,
+        max_motion: Optional[float] = 0.01,
+    ):
+        """
+        Args:
+            image_size: 图像尺寸(宽, 高)
+            pattern_size: 棋盘格内角点数(列, 行)
+            grid: 覆盖率网格(列, 行)
+            coverage_target: 需要达到的网格覆盖比例
+            tilt_target: 左右、上下方向各自需要出现的倾斜量（对边长度比的对数）
+            scale_range_target: 需要达到的棋盘格尺度变化范围
+            min_diversity: 不覆盖新区域时，与已采用视图的最小姿态距离
+            max_motion: 与上一帧相比角点平均移动超过图像宽度的该比例时视为不稳定，
+                None表示不检查（离线图片集）
+        """
+        self.image_size = tuple(image_size)
+        self.pattern_size = tuple(pattern_size[:2])
+        self.grid = grid
+        self.coverage_target = coverage_target
+        self.tilt_target = tilt_target
+        self.scale_range_target = scale_range_target
+        self.min_diversity = min_diversity
+        self.max_motion = max_motion
+        self.occupancy = np.zeros((grid[1], grid[0]), bool)
+        self.features: List[np.ndarray] = []
+        self._last_corners: Optional[np.ndarray] = None
+        self._last_ids: Optional[np.ndarray] = None
+
+    @property
+    def coverage(self) -> float:
+        return float(self.occupancy.mean())
+
+    def _outline(self, corners: np.ndarray, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        内角点的四个顶点，顺序为左上、右上、右下、左下（按检测顺序）
+
+        只检测到部分角点时（ids为角点编号），用角点在标定板上的位置求单应，
+        取检测到的行列范围的四个顶点
+        """
+        cols, rows = self.pattern_size
+        points = corners.reshape(-1, 2)
+        if ids is None:
+            return points[[0, cols - 1, cols * rows - 1, cols * (rows - 1)]]
+        grid = np.stack([ids % cols, ids // cols], axis=1).astype(np.float32)
+        homography, _ = cv2.findHomography(grid, points)
+        if homography is None:
+            return cv2.boxPoints(cv2.minAreaRect(points.astype(np.float32)))
+        (x0, y0), (x1, y1) = grid.min(axis=0), grid.max(axis=0)
+        quad = np.array([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]]], np.float32)
+        return cv2.perspectiveTransform(quad, homography)[0]
+
+    def _cells(self, outline: np.ndarray) -> np.ndarray:
+        """棋盘格覆盖的网格，网格一半以上面积被覆盖才计入"""
+        width, height = self.image_size
+        cols, rows = self.grid
+        sub = 4  # 每个网格细分为4x4，提高光栅化精度
+        mask = np.zeros((rows * sub, cols * sub), np.uint8)
+        scale = np.array([cols * sub / width, rows * sub / height])
+        polygon = np.round(outline * scale * 16).astype(np.int32)
+        cv2.fillConvexPoly(mask, polygon, 1, lineType=cv2.LINE_8, shift=4)
+        return mask.reshape(rows, sub, cols, sub).mean(axis=(1, 3)) > 0.5
+
+    def _features(self, outline: np.ndarray) -> np.ndarray:
+        width, height = self.image_size
+        center = outline.mean(axis=0) / np.array([width, height])
+        area = cv2.contourArea(outline.astype(np.float32))
+        scale = np.sqrt(area / (width * height))
+        top = np.linalg.norm(outline[1] - outline[0])
+        right = np.linalg.norm(outline[2] - outline[1])
+        bottom = np.linalg.norm(outline[2] - outline[3])
+        left = np.linalg.norm(outline[3] - outline[0])
+        # 透视缩短：倾斜时对边长度不再相等
+        tilt_lr = np.log(max(left, 1e-6) / max(right, 1e-6))
+        tilt_ud = np.log(max(top, 1e-6) / max(bottom, 1e-6))
+        return np.array([center[0], center[1], scale, tilt_lr, tilt_ud])
+
+    def _diversity(self, features: np.ndarray) -> float:
+        if not self.features:
+            return float("inf")
+        # 倾斜和尺度对标定的约束更重要，权重更高
+        weights = np.array([1.0, 1.0, 2.0, 3.0, 3.0])
+        diffs = (np.array(self.features) - features) * weights
+        return float(np.linalg.norm(diffs, axis=1).min())
+
+    def evaluate(self, corners: np.ndarray, ids: Optional[np.ndarray] = None) -> ViewScore:
+        """
+        评估候选视图，不修改已采用的状态（只记录上一帧角点用于稳定性判断）
+
+        ids为部分可见时的角点编号，稳定性按两帧共同检测到的角点计算
+        """
+        outline = self._outline(corners, ids)
+        features = self._features(outline)
+        if self.max_motion is not None:
+            last, self._last_corners = self._last_corners, corners.reshape(-1, 2).copy()
+            last_ids, self._last_ids = self._last_ids, ids
+            current = self._last_corners
+            if last is not None and (ids is not None or last_ids is not None):
+                if ids is None or last_ids is None:
+                    last = None
+                else:
+                    _, now_index, last_index = np.intersect1d(ids, last_ids, return_indices=True)
+                    current, last = current[now_index], last[last_index]
+            if last is None or len(last) == 0 or last.shape != current.shape:
+                # 第一次看到标定板，等下一帧确认稳定
+                return ViewScore(False, 0.0, 0.0, 0.0, features, "请保持稳定")
+            motion = np.linalg.norm(current - last, axis=1).mean()
+            if motion > self.max_motion * self.image_size[0]:
+                return ViewScore(False, 0.0, 0.0, 0.0, features, "棋盘格在移动，请保持稳定")
+
+        cells = self._cells(outline)
+        gain = float((cells & ~self.occupancy).mean())
+        diversity = self._diversity(features)
+        score = gain * 10 + min(diversity, 1.0)
+        accepted = gain > 0 or diversity >= self.min_diversity
+        reason = "" if accepted else "与已采集的视图重复"
+        return ViewScore(accepted, score, gain, diversity, features, reason)
+
+    def accept(
+        self,
+        corners: np.ndarray,
+        score: Optional[ViewScore] = None,
+        ids: Optional[np.ndarray] = None,
+    ):
+        """采用视图，更新覆盖网格和姿态记录"""
+        outline = self._outline(corners, ids)
+        self.occupancy |= self._cells(outline)
+        self.features.append(score.features if score is not None else self._features(outline))
+
+    def _tilt_ok(self) -> Tuple[bool, bool]:
+        if not self.features:
+            return False, False
+        tilts = np.abs(np.array(self.features)[:, 3:5]).max(axis=0)
+        return bool(tilts[0] >= self.tilt_target), bool(tilts[1] >= self.tilt_target)
+
+    def _scale_range(self) -> float:
+        if not self.features:
+            return 0.0
+        scales = np.array(self.features)[:, 2]
+        return float(scales.max() - scales.min())
+
+    def progress(self, min_views: int) -> float:
+        """完成度(0~1)，取覆盖率、倾斜、尺度和视图数中最落后的一项"""
+        tilt_lr, tilt_ud = self._tilt_ok()
+        return min(
+            self.coverage / self.coverage_target,
+            (tilt_lr + tilt_ud) / 2,
+            self._scale_range() / self.scale_range_target,
+            len(self.features) / max(min_views, 1),
+            1.0,
+        )
+
+    def targets_met(self, min_views: int) -> bool:
+        """覆盖率、倾斜、尺度变化和视图数是否都已达标"""
+        return self.progress(min_views) >= 1.0
+
+    def hint(self) -> str:
+        """根据最欠缺的一项给出操作提示"""
+        if self.coverage < self.coverage_target:
+            rows, cols = self.occupancy.shape
+            # 按3x3粗分区统计覆盖率，提示移向覆盖最少的区域
+            row_edges = np.linspace(0, rows, 4).astype(int)
+            col_edges = np.linspace(0, cols, 4).astype(int)
+            best, target = None, (1, 1)
+            for i in range(3):
+                for j in range(3):
+                    block = self.occupancy[
+                        row_edges[i] : row_edges[i + 1], col_edges[j] : col_edges[j + 1]
+                    ]
+                    value = block.mean() if block.size else 1.0
+                    if best is None or value < best:
+                        best, target = value, (i, j)
+            return f"将棋盘格移向画面{_REGION_HINTS[target[0]][target[1]]}"
+        tilt_lr, tilt_ud = self._tilt_ok()
+        if not tilt_lr:
+            return "将棋盘格向左或向右倾斜"
+        if not tilt_ud:
+            return "将棋盘格向上或向下倾斜"
+        if self._scale_range() < self.scale_range_target:
+            return "尝试靠近或远离摄像头"
+        return "继续变换角度和位置"
+
+    def get_stats(self, min_views: int) -> dict:
+        tilt_lr, tilt_ud = self._tilt_ok()
+        return {
+            "coverage": round(self.coverage, 3),
+            "coverage_target": self.coverage_target,
+            "tilt_left_right": tilt_lr,
+            "tilt_up_down": tilt_ud,
+            "scale_range": round(self._scale_range(), 3),
+            "views": len(self.features),
+            "progress": round(self.progress(min_views), 3),
+            "occupancy": self.occupancy.astype(int).tolist(),
+        }